@@ -1,24 +1,66 @@
+import time
+_startup_started = time.perf_counter() # Startup phase timings are measured from here
 import os
 import logging
 import json
 from datetime import timedelta, datetime
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, stream_with_context, has_app_context, has_request_context, g
+import click
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects import postgresql, sqlite
 from neo4j import GraphDatabase, basic_auth
+from neo4j.exceptions import DriverError, Neo4jError
 from werkzeug.security import generate_password_hash, check_password_hash
-import spacy
 from flask_jwt_extended import create_access_token, jwt_required, JWTManager, get_jwt_identity
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
 
 # For OTP generation
 import random
 import string
 
 # For sending emails
+import smtplib
 from flask_mail import Mail, Message
 
+# For bulk resource imports and paginated listings
+import base64
+import csv
+import hashlib
+import io
+from urllib.parse import urlencode, urljoin, urlparse
+
+# For fetching contributed pages
+import ipaddress
+import socket
+
+# For background Knowledge Graph ingestion
+import atexit
+import heapq
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# For metrics
+import bisect
+from contextlib import contextmanager
+
+# For the learning path engine and in-process caches
+import itertools
+import math
+import re
+from collections import Counter, OrderedDict
+
+# For the similar resources index
+import shutil
+import zlib
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -51,34 +93,291 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 
+# --- Metrics (Prometheus text format at GET /metrics) ---
+# A deliberately small registry: each observation is a dict lookup, a bisect and a
+# lock, cheap enough to leave on in production. Histograms are kept per label set
+# and made cumulative only when /metrics renders them.
+METRIC_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRIC_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+class MetricCounter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in sorted(self.values.items())]
+        return lines
+
+class MetricHistogram:
+    def __init__(self, name, help_text, buckets=METRIC_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.values = {} # label key -> [per-bucket counts (+Inf last), sum, count]
+        self.lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = sorted((key, list(entry[0]), entry[1], entry[2]) for key, entry in self.values.items())
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+class MetricGauge:
+    """A gauge (or counter kept elsewhere) whose values are read by a callback at scrape time."""
+    def __init__(self, name, help_text, read, metric_type='gauge'):
+        self.name = name
+        self.help_text = help_text
+        self.read = read # returns a list of (labels dict, value)
+        self.metric_type = metric_type
+        metrics_registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        lines += [f"{self.name}{_format_labels(tuple(sorted(labels.items())))} {value}" for labels, value in self.read()]
+        return lines
+
+metrics_registry = []
+http_request_seconds = MetricHistogram('gyanpath_http_request_duration_seconds', 'HTTP request latency by route.')
+http_requests_total = MetricCounter('gyanpath_http_requests_total', 'HTTP requests by route and status.')
+db_query_seconds = MetricHistogram('gyanpath_db_query_duration_seconds', 'SQL statement latency.')
+db_queries_per_request = MetricHistogram('gyanpath_db_queries_per_request', 'SQL statements issued per HTTP request.', METRIC_COUNT_BUCKETS)
+db_seconds_per_request = MetricHistogram('gyanpath_db_time_per_request_seconds', 'Total SQL time per HTTP request.')
+neo4j_query_seconds = MetricHistogram('gyanpath_neo4j_query_duration_seconds', 'Neo4j transaction latency by query.')
+spacy_doc_seconds = MetricHistogram('gyanpath_spacy_doc_duration_seconds', 'spaCy processing time per document.')
+mail_send_seconds = MetricHistogram('gyanpath_mail_send_duration_seconds', 'SMTP send latency per message.')
+mail_messages_total = MetricCounter('gyanpath_mail_messages_total', 'Outbox messages processed by outcome.')
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    db_query_seconds.observe(elapsed)
+    if has_request_context():
+        g.db_query_count = g.get('db_query_count', 0) + 1
+        g.db_query_seconds = g.get('db_query_seconds', 0.0) + elapsed
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_request_seconds.observe(time.perf_counter() - started, method=request.method, route=route)
+        http_requests_total.inc(method=request.method, route=route, status=response.status_code)
+        db_queries_per_request.observe(g.get('db_query_count', 0), route=route)
+        db_seconds_per_request.observe(g.get('db_query_seconds', 0.0), route=route)
+    return response
+
+def render_metrics():
+    lines = []
+    for metric in metrics_registry:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+# --- Lazy Subsystem Initialization ---
+# The spaCy model and the Neo4j driver are loaded on first use, so booting a
+# worker, running a CLI command or serving /login does not wait for them. A failed
+# load is retried after SUBSYSTEM_RETRY_INTERVAL. EAGER_INIT=true loads both at
+# import time and EAGER_INIT=background warms them up in a thread; GET /ready
+# reports what is loaded and startup_timings records how long each phase took.
+SUBSYSTEM_RETRY_INTERVAL = timedelta(seconds=int(os.getenv('SUBSYSTEM_RETRY_INTERVAL_SECONDS', 30)))
+EAGER_INIT = os.getenv('EAGER_INIT', 'false').lower() # 'false', 'true' or 'background'
+startup_timings = {'imports': round(time.perf_counter() - _startup_started, 3)}
+
+class LazySubsystem:
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.value = None
+        self.error = None
+        self.failed_at = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        """Returns the loaded object, loading it on first use. Returns None if loading failed."""
+        if self.value is not None:
+            return self.value
+        with self.lock:
+            if self.value is None and not self.recently_failed:
+                started = time.perf_counter()
+                try:
+                    self.value = self.loader()
+                    self.error = None
+                    self.failed_at = None
+                except Exception as e:
+                    self.error = str(e)
+                    self.failed_at = datetime.utcnow()
+                    logger.error(f"Failed to initialize {self.name}: {e}")
+                startup_timings[self.name] = round(time.perf_counter() - started, 3)
+                logger.info(f"Startup phase '{self.name}' took {startup_timings[self.name]}s.")
+        return self.value
+
+    @property
+    def recently_failed(self):
+        return self.value is None and self.failed_at is not None and datetime.utcnow() - self.failed_at < SUBSYSTEM_RETRY_INTERVAL
+
+    @property
+    def status(self):
+        if self.value is not None:
+            return 'loaded'
+        return 'failed' if self.failed_at else 'not_loaded'
+
 # --- Neo4j Configuration ---
 neo4j_uri = os.getenv("NEO4J_URI")
 neo4j_username = os.getenv("NEO4J_USERNAME")
 neo4j_password = os.getenv("NEO4J_PASSWORD")
 
-neo4j_driver = None
-try:
-    neo4j_driver = GraphDatabase.driver(
+def _connect_neo4j():
+    driver = GraphDatabase.driver(
         neo4j_uri,
         auth=basic_auth(neo4j_username, neo4j_password),
-        max_connection_lifetime=60 * 5
+        max_connection_lifetime=60 * 5,
+        max_transaction_retry_time=float(os.getenv('NEO4J_MAX_TRANSACTION_RETRY_TIME', 15))
     )
-    neo4j_driver.verify_connectivity()
+    try:
+        driver.verify_connectivity()
+    except Exception:
+        driver.close()
+        raise
     logger.info("Successfully connected to Neo4j.")
-except Exception as e:
-    logger.error(f"Failed to connect to Neo4j: {e}")
+    return driver
+
+neo4j_subsystem = LazySubsystem('neo4j', _connect_neo4j)
+
+def get_neo4j_driver():
+    return neo4j_subsystem.get()
 
 # --- NLP Model Loading ---
-nlp = None
-try:
-    nlp = spacy.load("en_core_web_sm")
+def _load_nlp():
+    import spacy
+    try:
+        model = spacy.load("en_core_web_sm")
+    except Exception as e:
+        raise RuntimeError(f"{e}. Please run 'python -m spacy download en_core_web_sm'")
     logger.info("Successfully loaded spaCy model 'en_core_web_sm'.")
-except Exception as e:
-    logger.error(f"Failed to load spaCy model: {e}. Please run 'python -m spacy download en_core_web_sm'")
+    return model
+
+nlp_subsystem = LazySubsystem('spacy', _load_nlp)
+
+def get_nlp():
+    return nlp_subsystem.get()
+
+def kg_subsystems_unavailable():
+    """True if the NLP model or Neo4j failed to load recently. Never triggers a load itself."""
+    return nlp_subsystem.recently_failed or neo4j_subsystem.recently_failed
+
+# --- Verified emails (for registration) ---
+VERIFICATION_TIMEOUT = timedelta(minutes=int(os.getenv('VERIFICATION_TIMEOUT_MINUTES', 15)))
+VERIFICATION_STORE = os.getenv('VERIFICATION_STORE', 'database').lower() # 'database' (shared by all workers) or 'memory'
+
+# --- Password Hashing Service ---
+# Hashing and verification run on a bounded thread pool (hashlib releases the GIL
+# for pbkdf2 and scrypt), with at most PASSWORD_HASH_MAX_PENDING requests waiting,
+# so a login storm cannot take every CPU from the rest of the worker. The method
+# and cost come from PASSWORD_HASH_METHOD in Werkzeug's format, e.g.
+# 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'. Stored hashes made with other
+# parameters are upgraded on the user's next successful login.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 4))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32))
+PASSWORD_HASH_WAIT_SECONDS = float(os.getenv('PASSWORD_HASH_WAIT_SECONDS', 5))
+
+password_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+password_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+password_hash_stats = Counter() # '<operation>_count', '<operation>_seconds', 'rejected'
+password_hash_stats_lock = threading.Lock()
+password_hash_seconds = MetricHistogram('gyanpath_password_hash_duration_seconds', 'Password hash/verify time on the pool.')
+_password_hash_prefix = None
+
+class PasswordHashingBusy(Exception):
+    pass
+
+def _timed_password_job(operation, fn, *args):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        elapsed = time.perf_counter() - started
+        password_hash_seconds.observe(elapsed, operation=operation)
+        with password_hash_stats_lock:
+            password_hash_stats[f'{operation}_count'] += 1
+            password_hash_stats[f'{operation}_seconds'] += elapsed
+            password_hash_stats[f'{operation}_max_seconds'] = max(password_hash_stats[f'{operation}_max_seconds'], elapsed)
+
+def _run_password_job(operation, fn, *args):
+    if not password_hash_slots.acquire(timeout=PASSWORD_HASH_WAIT_SECONDS):
+        with password_hash_stats_lock:
+            password_hash_stats['rejected'] += 1
+        raise PasswordHashingBusy("Too many password operations in progress")
+    try:
+        return password_hash_executor.submit(_timed_password_job, operation, fn, *args).result()
+    finally:
+        password_hash_slots.release()
+
+def hash_password(password):
+    return _run_password_job('hash', generate_password_hash, password, PASSWORD_HASH_METHOD)
 
-# --- In-memory cache for verified emails (for registration) ---
-verified_emails_for_registration = set()
-VERIFICATION_TIMEOUT = timedelta(minutes=15)
+def verify_password(password_hash, password):
+    return _run_password_job('verify', check_password_hash, password_hash, password)
+
+def password_needs_rehash(password_hash):
+    global _password_hash_prefix
+    if _password_hash_prefix is None:
+        # Werkzeug fills in defaults (e.g. 'pbkdf2' -> 'pbkdf2:sha256:1000000'), so the
+        # configured method is normalized by hashing once.
+        _password_hash_prefix = generate_password_hash('', PASSWORD_HASH_METHOD).split('$', 1)[0]
+    return password_hash.split('$', 1)[0] != _password_hash_prefix
 
 # --- Define Your Database Models (PostgreSQL) ---
 class User(db.Model):
@@ -90,100 +389,2191 @@ class User(db.Model):
     preferred_content_types = db.Column(db.String(255), default='["article", "video"]') # Stored as JSON string
     time_availability = db.Column(db.String(50), default='1_hour_day') # e.g., '30_mins_day', '1_hour_day'
     difficulty_preference = db.Column(db.String(50), default='beginner') # e.g., 'beginner', 'intermediate', 'advanced'
+    profile_version = db.Column(db.Integer, nullable=False, default=1, server_default='1') # Bumped on every profile write; the profile ETag
 
     def __repr__(self):
         return f'<User {self.email}>'
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
 class OTP(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     code = db.Column(db.String(6), nullable=False)
-    expires_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    # Matches the (email, code) lookup in /verify_otp.
+    __table_args__ = (db.Index('ix_otp_email_code', 'email', 'code'),)
 
     def __repr__(self):
         return f'<OTP for {self.email}>'
 
 
+# Title terms rank above description terms. GET /resources/search must use this exact
+# expression for Postgres to match it to ix_resource_search.
+RESOURCE_SEARCH_VECTOR_SQL = ("setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+                              "setweight(to_tsvector('english', coalesce(description, '')), 'B')")
+
 class Resource(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     url = db.Column(db.String(500), unique=True, nullable=False)
     description = db.Column(db.Text, nullable=True)
-    resource_type = db.Column(db.String(50), nullable=False)
-    source = db.Column(db.String(100), nullable=True)
-    difficulty = db.Column(db.String(50), nullable=True)
+    resource_type = db.Column(db.String(50), nullable=False, index=True)
+    source = db.Column(db.String(100), nullable=True, index=True)
+    difficulty = db.Column(db.String(50), nullable=True, index=True)
     estimated_time_minutes = db.Column(db.Integer, nullable=True)
     
     contributed_by_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     contributed_by = db.relationship('User', backref='contributed_resources') 
 
     created_at = db.Column(db.DateTime, default=db.func.now())
-    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now(), index=True)
+
+    # Keyset pagination for GET /resources walks (created_at, id) newest first. The
+    # full-text index is an expression index, so Postgres keeps it current on every
+    # insert and update without a stored tsvector column.
+    __table_args__ = (
+        db.Index('ix_resource_created_at_id', 'created_at', 'id'),
+        db.Index('ix_resource_search', db.text(f'({RESOURCE_SEARCH_VECTOR_SQL})'), postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
 
     def __repr__(self):
         return f'<Resource {self.title}>'
 
+class MailOutbox(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True) # 'queued', 'sending', 'sent', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=db.func.now())
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.now())
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<MailOutbox {self.id} to {self.recipient} {self.status}>'
+
+class VerifiedEmail(db.Model):
+    email = db.Column(db.String(120), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<VerifiedEmail {self.email}>'
+
+class PageFetchCache(db.Model):
+    url = db.Column(db.String(500), primary_key=True)
+    title = db.Column(db.String(255), nullable=True)
+    description = db.Column(db.Text, nullable=True)
+    etag = db.Column(db.String(255), nullable=True)
+    last_modified = db.Column(db.String(64), nullable=True)
+    fetched_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<PageFetchCache {self.url}>'
+
+class ConceptExtractionCache(db.Model):
+    key = db.Column(db.String(64), primary_key=True) # sha256 of model, extraction version and normalized text
+    concepts = db.Column(db.Text, nullable=False) # Stored as JSON string
+    created_at = db.Column(db.DateTime, default=db.func.now())
+
+    def __repr__(self):
+        return f'<ConceptExtractionCache {self.key}>'
+
+class KGIngestJob(db.Model):
+    resource_id = db.Column(db.Integer, db.ForeignKey('resource.id'), primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='pending') # 'pending', 'processing', 'done', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+
+    def __repr__(self):
+        return f'<KGIngestJob {self.resource_id} {self.status}>'
+
+class JobWatermark(db.Model):
+    # High-water marks of incremental maintenance jobs such as flask kg-reconcile.
+    name = db.Column(db.String(100), primary_key=True)
+    watermark = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+
+    def __repr__(self):
+        return f'<JobWatermark {self.name} {self.watermark}>'
+
+class UserKnowledgeVersion(db.Model):
+    # Bumped on every knowledge write; caches keyed on it go stale without a graph read.
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+
+    def __repr__(self):
+        return f'<UserKnowledgeVersion {self.user_id} {self.version}>'
+
+class UserRecommendations(db.Model):
+    # Precomputed top-K feed per user, refreshed nightly and on profile changes.
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    resource_ids = db.Column(db.Text, nullable=False) # JSON list, best first
+    scores = db.Column(db.Text, nullable=False) # JSON list, parallel to resource_ids
+    profile_key = db.Column(db.String(64), nullable=False) # recommendation_profile_key() at compute time
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<UserRecommendations {self.user_id}>'
+
+# --- Verification Token Store ---
+# /verify_otp records a verified email and /create_user consumes it; both expire
+# after VERIFICATION_TIMEOUT. Under several gunicorn workers the two requests often
+# land in different processes, so the default store is the verified_email table
+# (Postgres, or SQLite on a single host). The memory store suits a single process.
+class MemoryVerificationStore:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.expiries = {} # email -> expires_at
+        self.heap = [] # (expires_at, email), may hold stale entries for re-verified emails
+        self.lock = threading.Lock()
+
+    def _sweep(self, now):
+        while self.heap and self.heap[0][0] <= now:
+            expires_at, email = heapq.heappop(self.heap)
+            if self.expiries.get(email) == expires_at:
+                del self.expiries[email]
+
+    def add(self, email):
+        now = datetime.utcnow()
+        with self.lock:
+            self._sweep(now)
+            expires_at = now + self.ttl
+            self.expiries[email] = expires_at
+            heapq.heappush(self.heap, (expires_at, email))
+
+    def consume(self, email):
+        """Removes a verified email and returns True if it was present and unexpired."""
+        now = datetime.utcnow()
+        with self.lock:
+            self._sweep(now)
+            return self.expiries.pop(email, None) is not None
+
+class DatabaseVerificationStore:
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def add(self, email):
+        now = datetime.utcnow()
+        VerifiedEmail.query.filter(VerifiedEmail.expires_at <= now).delete(synchronize_session=False)
+        db.session.merge(VerifiedEmail(email=email, expires_at=now + self.ttl))
+        db.session.commit()
+
+    def consume(self, email):
+        """Removes a verified email and returns True if it was present and unexpired."""
+        # A single DELETE makes the check-and-remove atomic across workers.
+        deleted = VerifiedEmail.query.filter(VerifiedEmail.email == email, VerifiedEmail.expires_at > datetime.utcnow()) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+        return deleted == 1
+
+verification_store = MemoryVerificationStore(VERIFICATION_TIMEOUT) if VERIFICATION_STORE == 'memory' \
+    else DatabaseVerificationStore(VERIFICATION_TIMEOUT)
+
+# --- Mail Outbox ---
+# Requests only add a row to mail_outbox (in their own transaction) and wake the
+# sender. A background thread claims due messages in batches and sends them over
+# one SMTP connection, which stays open while the outbox keeps producing work.
+# Failures are retried with exponential backoff until MAIL_MAX_ATTEMPTS, and each
+# row's status records the delivery outcome. Bodies carry OTP codes, so they are
+# blanked once a message is sent or given up on, and delete_old_mail removes sent
+# and failed rows after MAIL_RETENTION. Set MAIL_SENDER_IN_PROCESS=false to run
+# the sender elsewhere, e.g. with flask send-mail-outbox.
+MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', 50))
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))
+MAIL_RETRY_BACKOFF_SECONDS = float(os.getenv('MAIL_RETRY_BACKOFF_SECONDS', 5))
+MAIL_SENDER_POLL_SECONDS = float(os.getenv('MAIL_SENDER_POLL_SECONDS', 5))
+MAIL_SENDER_IN_PROCESS = os.getenv('MAIL_SENDER_IN_PROCESS', 'True').lower() in ['true', '1', 't']
+MAIL_CLAIM_TIMEOUT = timedelta(minutes=5) # 'sending' rows older than this are assumed abandoned
+MAIL_RETENTION = timedelta(days=int(os.getenv('MAIL_RETENTION_DAYS', 30)))
+MAIL_SWEEP_BATCH_SIZE = int(os.getenv('MAIL_SWEEP_BATCH_SIZE', 1000))
+
+mail_outbox_wakeup = threading.Event()
+mail_sender_threads = []
+mail_sender_lock = threading.Lock()
+
+def queue_mail(recipient, subject, body):
+    """Adds a message to the outbox. It is committed with the caller's transaction."""
+    db.session.add(MailOutbox(recipient=recipient, subject=subject, body=body, status='queued',
+                              next_attempt_at=datetime.utcnow()))
+
+def wake_mail_sender():
+    if MAIL_SENDER_IN_PROCESS:
+        with mail_sender_lock:
+            if not mail_sender_threads:
+                sender = threading.Thread(target=_mail_sender_loop, name="mail-sender", daemon=True)
+                sender.start()
+                mail_sender_threads.append(sender)
+    mail_outbox_wakeup.set()
+
+def claim_mail_batch(limit=MAIL_BATCH_SIZE):
+    now = datetime.utcnow()
+    query = MailOutbox.query.filter(db.or_(
+        db.and_(MailOutbox.status == 'queued', MailOutbox.next_attempt_at <= now),
+        db.and_(MailOutbox.status == 'sending', MailOutbox.claimed_at < now - MAIL_CLAIM_TIMEOUT)
+    )).order_by(MailOutbox.id).limit(limit)
+    if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+
+    batch = [{"id": item.id, "recipient": item.recipient, "subject": item.subject, "body": item.body,
+              "attempts": item.attempts} for item in query.all()]
+    if batch:
+        MailOutbox.query.filter(MailOutbox.id.in_([item["id"] for item in batch])) \
+            .update({"status": "sending", "claimed_at": now}, synchronize_session=False)
+    db.session.commit()
+    return batch
+
+def _record_mail_failure(item, error):
+    attempts = item["attempts"] + 1
+    if attempts >= MAIL_MAX_ATTEMPTS:
+        logger.error(f"Giving up on mail {item['id']} to {item['recipient']} after {attempts} attempts: {error}")
+        update = {"status": "failed", "body": ""}
+    else:
+        update = {"status": "queued",
+                  "next_attempt_at": datetime.utcnow() + timedelta(seconds=MAIL_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1))}
+    MailOutbox.query.filter_by(id=item["id"]).update({**update, "attempts": attempts, "last_error": str(error)},
+                                                     synchronize_session=False)
+
+def _is_connection_lost(error):
+    # SMTPException subclasses OSError, so a refused recipient or rejected message
+    # would otherwise look like a dropped socket.
+    return isinstance(error, smtplib.SMTPServerDisconnected) or \
+        (isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException))
+
+def send_mail_batch(conn, batch):
+    for index, item in enumerate(batch):
+        try:
+            with mail_send_seconds.time():
+                conn.send(Message(item["subject"], recipients=[item["recipient"]], body=item["body"]))
+        except Exception as e:
+            if not _is_connection_lost(e):
+                _record_mail_failure(item, e)
+                mail_messages_total.inc(outcome='error')
+                continue
+            # The connection is gone: this and the rest of the batch go back to the queue.
+            for unsent in batch[index:]:
+                _record_mail_failure(unsent, e)
+            mail_messages_total.inc(len(batch) - index, outcome='disconnected')
+            db.session.commit()
+            raise
+        else:
+            mail_messages_total.inc(outcome='sent')
+            MailOutbox.query.filter_by(id=item["id"]).update(
+                {"status": "sent", "sent_at": datetime.utcnow(), "attempts": item["attempts"] + 1, "last_error": None,
+                 "body": ""},
+                synchronize_session=False)
+    db.session.commit()
+
+def drain_mail_outbox():
+    """Sends due messages over one SMTP connection until none are left. Returns the number processed."""
+    batch = claim_mail_batch()
+    if not batch:
+        return 0
+    processed = 0
+    try:
+        with mail.connect() as conn:
+            while batch:
+                current, batch = batch, None
+                send_mail_batch(conn, current)
+                processed += len(current)
+                batch = claim_mail_batch()
+    except (smtplib.SMTPException, OSError) as e:
+        if batch:
+            # Claimed but never handed to the connection (e.g. the connect failed).
+            for item in batch:
+                _record_mail_failure(item, e)
+            db.session.commit()
+        raise
+    return processed
+
+def _mail_sender_loop():
+    while True:
+        mail_outbox_wakeup.wait(timeout=MAIL_SENDER_POLL_SECONDS)
+        mail_outbox_wakeup.clear()
+        with app.app_context():
+            try:
+                drain_mail_outbox()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Mail sender failed, will retry: {e}")
+
+@app.cli.command('send-mail-outbox')
+def send_mail_outbox():
+    """Sends every due message in the mail outbox once, then exits."""
+    processed = drain_mail_outbox()
+    counts = dict(db.session.query(MailOutbox.status, db.func.count(MailOutbox.id)).group_by(MailOutbox.status).all())
+    click.echo(f"Processed {processed} messages. Outbox: {counts}")
+
+def delete_old_mail(batch_size=MAIL_SWEEP_BATCH_SIZE):
+    """Deletes sent and failed outbox rows older than MAIL_RETENTION, batch_size at a time. Returns how many were removed."""
+    removed = 0
+    cutoff = datetime.utcnow() - MAIL_RETENTION
+    while True:
+        old_ids = [mail_id for (mail_id,) in
+                   db.session.query(MailOutbox.id).filter(MailOutbox.status.in_(('sent', 'failed')),
+                                                          MailOutbox.created_at < cutoff).limit(batch_size)]
+        if not old_ids:
+            break
+        removed += MailOutbox.query.filter(MailOutbox.id.in_(old_ids)).delete(synchronize_session=False)
+        db.session.commit()
+        if len(old_ids) < batch_size:
+            break
+    return removed
+
+@app.cli.command('sweep-mail-outbox')
+@click.option('--batch-size', default=MAIL_SWEEP_BATCH_SIZE, show_default=True, help='Rows deleted per transaction.')
+def sweep_mail_outbox(batch_size):
+    """Deletes sent and failed outbox rows past the retention window."""
+    removed = delete_old_mail(batch_size)
+    click.echo(f"Removed {removed} old outbox messages.")
+
+
+# --- Expired OTP Sweeper ---
+# Expired OTPs were only deleted when someone tried to verify them, so abandoned
+# signups stayed forever. delete_expired_otps removes them in bounded batches (short
+# transactions, no long table locks); run it from cron with flask sweep-otps or set
+# OTP_SWEEP_INTERVAL_SECONDS to sweep from a background thread, which also clears
+# old mail outbox rows (delete_old_mail).
+OTP_SWEEP_BATCH_SIZE = int(os.getenv('OTP_SWEEP_BATCH_SIZE', 1000))
+OTP_SWEEP_INTERVAL_SECONDS = int(os.getenv('OTP_SWEEP_INTERVAL_SECONDS', 0)) # 0 disables the in-process sweeper
+
+otp_sweeper_threads = []
+otp_sweeper_lock = threading.Lock()
+
+def delete_expired_otps(batch_size=OTP_SWEEP_BATCH_SIZE):
+    """Deletes expired OTP rows batch_size at a time and returns how many were removed."""
+    removed = 0
+    now = datetime.utcnow()
+    while True:
+        expired_ids = [otp_id for (otp_id,) in
+                       db.session.query(OTP.id).filter(OTP.expires_at < now).limit(batch_size)]
+        if not expired_ids:
+            break
+        removed += OTP.query.filter(OTP.id.in_(expired_ids)).delete(synchronize_session=False)
+        db.session.commit()
+        if len(expired_ids) < batch_size:
+            break
+    return removed
+
+def _otp_sweeper_loop():
+    while True:
+        time.sleep(OTP_SWEEP_INTERVAL_SECONDS)
+        with app.app_context():
+            try:
+                removed = delete_expired_otps()
+                if removed:
+                    logger.info(f"OTP sweeper removed {removed} expired OTPs.")
+                removed = delete_old_mail()
+                if removed:
+                    logger.info(f"OTP sweeper removed {removed} old outbox messages.")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"OTP sweeper failed: {e}")
+
+def start_otp_sweeper():
+    if OTP_SWEEP_INTERVAL_SECONDS <= 0:
+        return
+    with otp_sweeper_lock:
+        if not otp_sweeper_threads:
+            sweeper = threading.Thread(target=_otp_sweeper_loop, name="otp-sweeper", daemon=True)
+            sweeper.start()
+            otp_sweeper_threads.append(sweeper)
+
+@app.cli.command('sweep-otps')
+@click.option('--batch-size', default=OTP_SWEEP_BATCH_SIZE, show_default=True, help='Rows deleted per transaction.')
+def sweep_otps(batch_size):
+    """Deletes expired OTPs."""
+    removed = delete_expired_otps(batch_size)
+    click.echo(f"Removed {removed} expired OTPs.")
+
+
 # --- Helper Function for Neo4j Knowledge Graph ---
+# A resource and its whole concept list go to Neo4j as parameters of a single
+# UNWIND query, so one resource costs one round trip instead of 1 + 2N. A rewrite
+# replaces the resource's TEACHES edges, and r.textHash records the text the
+# concepts came from so kg-reconcile can tell when they need re-extracting.
+KG_UPSERT_RESOURCES_QUERY = (
+    "UNWIND $resources AS res "
+    "MERGE (r:Resource {resource_id: res.resource_id}) "
+    "ON CREATE SET r.createdAt = timestamp() "
+    "SET r.title = res.title, r.url = res.url, r.textHash = res.text_hash "
+    "WITH r, res "
+    "OPTIONAL MATCH (r)-[old:TEACHES]->(previous:Concept) WHERE NOT previous.name IN res.concepts "
+    "DELETE old "
+    "WITH DISTINCT r, res "
+    "UNWIND res.concepts AS concept_name "
+    "MERGE (c:Concept {name: concept_name}) "
+    "ON CREATE SET c.createdAt = timestamp() "
+    "MERGE (r)-[:TEACHES]->(c)"
+)
+KG_WRITE_BATCH_SIZE = int(os.getenv('KG_WRITE_BATCH_SIZE', 500)) # Resources per write transaction for bulk loads
+
+# spaCy components each pass reads; the rest of the pipeline is disabled. Resource
+# text needs all of en_core_web_sm: ner gives doc.ents, noun_chunks needs the parser
+# plus the POS tags from tagger/attribute_ruler, and the lemmatizer feeds
+# canonical_concept_name. Canonicalizing a plain name (canonical_concept_names)
+# reads only POS tags and lemmas, so it skips the parser and ner.
+KG_PIPE_DOCUMENT_COMPONENTS = ('tok2vec', 'transformer', 'tagger', 'attribute_ruler', 'lemmatizer', 'parser', 'ner')
+KG_PIPE_NAME_COMPONENTS = ('tok2vec', 'transformer', 'tagger', 'attribute_ruler', 'lemmatizer')
+
+def kg_text(title, description):
+    return f"{title}. {description if description else ''}"
+
+def kg_text_hash(title, description):
+    """Fingerprint of the text and extraction rules a resource's concepts came from (r.textHash)."""
+    normalized = ' '.join(kg_text(title, description).split())
+    return hashlib.sha256(f"{CONCEPT_EXTRACTION_VERSION}|{normalized}".encode()).hexdigest()
+
+def kg_pipe_disabled_components(needed=KG_PIPE_DOCUMENT_COMPONENTS):
+    return [name for name in get_nlp().pipe_names if name not in needed]
+
+# --- Concept Canonicalization ---
+# Concept names are canonicalized before they reach the graph, so "the Python
+# language", "Python" and "python" end up on one node: names are lowercased, the
+# head noun is lemmatized, leading determiners/stopwords and trailing words that
+# describe the resource rather than the concept ("tutorial", "course") are
+# stripped, stopword-only chunks are dropped, and the result is mapped through a
+# synonym table. CONCEPT_SYNONYMS_FILE may point to a JSON object of
+# {alias: canonical} entries that extend or override the defaults.
+DEFAULT_CONCEPT_SYNONYMS = {
+    "js": "javascript",
+    "ts": "typescript",
+    "py": "python",
+    "python language": "python",
+    "python programming language": "python",
+    "ml": "machine learning",
+    "ai": "artificial intelligence",
+    "dl": "deep learning",
+    "nlp": "natural language processing",
+    "dsa": "data structures and algorithms",
+}
+CONCEPT_RESOURCE_WORDS = frozenset(['tutorial', 'course', 'guide', 'lesson', 'video', 'article', 'walkthrough',
+                                    'introduction', 'intro', 'basic', 'basics'])
+CONCEPT_EDGE_POS = ('DET', 'PRON', 'PUNCT', 'ADP', 'CCONJ', 'PART')
+
+def load_concept_synonyms():
+    synonyms = dict(DEFAULT_CONCEPT_SYNONYMS)
+    path = os.getenv('CONCEPT_SYNONYMS_FILE')
+    if path:
+        try:
+            with open(path) as f:
+                synonyms.update({' '.join(alias.lower().split()): canonical for alias, canonical in json.load(f).items()})
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load concept synonyms from {path}: {e}")
+    return synonyms
+
+concept_synonyms = load_concept_synonyms()
+
+def canonical_concept_name(span):
+    """Returns the canonical name for a spaCy span (entity or noun chunk), or None if nothing is left."""
+    tokens = list(span)
+    while tokens and (tokens[0].pos_ in CONCEPT_EDGE_POS or tokens[0].is_stop or tokens[0].is_punct):
+        tokens.pop(0)
+    while tokens and (tokens[-1].pos_ in CONCEPT_EDGE_POS or tokens[-1].is_punct):
+        tokens.pop()
+    if not tokens or all(token.is_stop for token in tokens):
+        return None
+    # Only the head noun is lemmatized: "data structures" -> "data structure", not "datum structure".
+    words = [token.text.lower() for token in tokens]
+    if tokens[-1].pos_ == 'NOUN' and tokens[-1].lemma_:
+        words[-1] = tokens[-1].lemma_.lower()
+    while words and words[-1] in CONCEPT_RESOURCE_WORDS:
+        words.pop()
+    if not words:
+        return None
+    name = ' '.join(' '.join(words).split())
+    return concept_synonyms.get(name, name)
+
+def concepts_from_doc(doc):
+    extracted_concepts = set()
+    for ent in doc.ents:
+        name = canonical_concept_name(ent)
+        if name:
+            extracted_concepts.add(name)
+    for chunk in doc.noun_chunks:
+        name = canonical_concept_name(chunk)
+        if name and (' ' in name or len(name) > 3):
+            extracted_concepts.add(name)
+    return sorted(extracted_concepts)
+
+# --- Concept Extraction Cache ---
+# Extraction results are memoized by a hash of the normalized text, the spaCy
+# model name/version and CONCEPT_EXTRACTION_VERSION, in an in-process LRU backed by
+# the concept_extraction_cache table. Re-ingesting a resource, rebuilding the graph
+# after a wipe, or mirrored resources sharing a description then skip spaCy.
+# Bump CONCEPT_EXTRACTION_VERSION whenever concepts_from_doc changes its output.
+CONCEPT_EXTRACTION_VERSION = 2
+CONCEPT_CACHE_SIZE = int(os.getenv('CONCEPT_CACHE_SIZE', 10000))
+concept_cache = OrderedDict()
+concept_cache_lock = threading.Lock()
+concept_cache_stats = Counter() # memory_hits, db_hits, misses
+
+def concept_cache_key(text):
+    normalized = ' '.join(text.split())
+    nlp = get_nlp()
+    model = f"{nlp.meta.get('lang')}_{nlp.meta.get('name')}-{nlp.meta.get('version')}"
+    return hashlib.sha256(f"{model}|{CONCEPT_EXTRACTION_VERSION}|{normalized}".encode()).hexdigest()
+
+def get_cached_concepts(keys):
+    """Returns {key: concepts} for the keys found in memory or, within an app context, in the database."""
+    found = {}
+    with concept_cache_lock:
+        for key in keys:
+            if key in concept_cache:
+                concept_cache.move_to_end(key)
+                found[key] = concept_cache[key]
+    concept_cache_stats['memory_hits'] += len(found)
+
+    missing = [key for key in keys if key not in found]
+    if missing and has_app_context():
+        rows = db.session.query(ConceptExtractionCache.key, ConceptExtractionCache.concepts) \
+            .filter(ConceptExtractionCache.key.in_(missing)).all()
+        from_db = {row.key: json.loads(row.concepts) for row in rows}
+        concept_cache_stats['db_hits'] += len(from_db)
+        _remember_concepts(from_db)
+        found.update(from_db)
+
+    concept_cache_stats['misses'] += len(keys) - len(found)
+    return found
+
+def _remember_concepts(entries):
+    with concept_cache_lock:
+        for key, concepts in entries.items():
+            concept_cache[key] = concepts
+            concept_cache.move_to_end(key)
+        while len(concept_cache) > CONCEPT_CACHE_SIZE:
+            concept_cache.popitem(last=False)
+
+def store_cached_concepts(entries):
+    """Caches {key: concepts} in memory and, within an app context, in the database (committed)."""
+    _remember_concepts(entries)
+    if entries and has_app_context():
+        insert_ignoring_conflicts(ConceptExtractionCache.__table__,
+                                  [{"key": key, "concepts": json.dumps(concepts)} for key, concepts in entries.items()],
+                                  index_elements=['key'])
+        db.session.commit()
+
+def extract_concepts(title, description):
+    text = kg_text(title, description)
+    key = concept_cache_key(text)
+    cached = get_cached_concepts([key])
+    if key in cached:
+        return cached[key]
+
+    # nlp.pipe(disable=...) skips components per call without mutating the shared
+    # pipeline, so it is safe from the KG ingest worker threads.
+    with spacy_doc_seconds.time(mode='single'):
+        doc = next(get_nlp().pipe([text], disable=kg_pipe_disabled_components()))
+    concepts = concepts_from_doc(doc)
+    store_cached_concepts({key: concepts})
+    return concepts
+
+def _upsert_resources_tx(tx, resources):
+    tx.run(KG_UPSERT_RESOURCES_QUERY, resources=resources).consume()
+
+def write_resources_to_kg(resources, batch_size=KG_WRITE_BATCH_SIZE):
+    """
+    Writes resources to the Knowledge Graph, batch_size resources per transaction.
+    Each item is a dict with resource_id, title, url, text_hash (kg_text_hash) and
+    concepts (a list of names); the concepts replace any the resource taught before.
+    execute_write retries the transaction on transient errors (deadlocks, leader
+    switches) for up to NEO4J_MAX_TRANSACTION_RETRY_TIME seconds; other errors raise.
+    """
+    with get_neo4j_driver().session() as session:
+        for start in range(0, len(resources), batch_size):
+            with neo4j_query_seconds.time(query='upsert_resources'):
+                session.execute_write(_upsert_resources_tx, resources[start:start + batch_size])
+            record_resources_in_concept_index(resources[start:start + batch_size])
+
 def process_resource_for_kg(resource_id, title, description, url):
-    if not neo4j_driver:
+    if not get_neo4j_driver():
         logger.warning(f"Neo4j driver not available. Skipping KG processing for resource {resource_id}.")
         return
 
-    if not nlp:
+    if not get_nlp():
         logger.warning(f"spaCy NLP model not loaded. Skipping KG processing for resource {resource_id}.")
         return
 
-    text_to_process = f"{title}. {description if description else ''}"
-    doc = nlp(text_to_process)
+    concepts_list = extract_concepts(title, description)
 
-    extracted_concepts = set()
-    for ent in doc.ents:
-        extracted_concepts.add(ent.text)
-    for chunk in doc.noun_chunks:
-        if len(chunk.text.split()) > 1 or (len(chunk.text.split()) == 1 and len(chunk.text) > 3):
-             extracted_concepts.add(chunk.text)
-
-    concepts_list = list(set([concept.strip() for concept in extracted_concepts if concept.strip()]))
-
-    try:
-        with neo4j_driver.session() as session:
-            session.run(
-                "MERGE (r:Resource {resource_id: $resource_id}) "
-                "ON CREATE SET r.title = $title, r.url = $url, r.createdAt = timestamp() "
-                "ON MATCH SET r.title = $title, r.url = $url",
-                resource_id=resource_id, title=title, url=url
-            )
-
-            for concept_name in concepts_list:
-                session.run(
-                    "MERGE (c:Concept {name: $concept_name}) "
-                    "ON CREATE SET c.createdAt = timestamp()",
-                    concept_name=concept_name
-                )
-                session.run(
-                    "MATCH (r:Resource {resource_id: $resource_id}) "
-                    "MATCH (c:Concept {name: $concept_name}) "
-                    "MERGE (r)-[:TEACHES]->(c)",
-                    resource_id=resource_id, concept_name=concept_name
-                )
-            logger.info(f"Knowledge Graph updated for resource {resource_id} with concepts: {concepts_list}")
+    try:
+        write_resources_to_kg([{
+            "resource_id": resource_id,
+            "title": title,
+            "url": url,
+            "text_hash": kg_text_hash(title, description),
+            "concepts": concepts_list
+        }])
+        logger.info(f"Knowledge Graph updated for resource {resource_id} with concepts: {concepts_list}")
 
     except Exception as e:
         logger.error(f"Error updating Knowledge Graph for resource {resource_id}: {e}")
 
 
+# --- Background Knowledge Graph Ingestion ---
+# POST /resources only inserts the row and queues its id; a small worker pool does
+# the spaCy parsing and Neo4j writes. Job state lives in the kg_ingest_job table so
+# any web worker can answer GET /resources/<id>/kg_status, and rows left in the
+# 'failed' state form the dead-letter list. The queue itself is in memory, so jobs
+# of a worker that exited stay 'pending' or 'processing'; `flask kg-ingest-recover`
+# re-runs those once they are older than KG_INGEST_STALE_AFTER, and with --failed
+# the dead letters too. Ingestion is idempotent, so re-running a job that was in
+# fact still queued somewhere only costs the extra work.
+KG_INGEST_QUEUE_SIZE = int(os.getenv('KG_INGEST_QUEUE_SIZE', 1000))
+KG_INGEST_WORKERS = int(os.getenv('KG_INGEST_WORKERS', 2))
+KG_INGEST_MAX_ATTEMPTS = int(os.getenv('KG_INGEST_MAX_ATTEMPTS', 5))
+KG_INGEST_BACKOFF_SECONDS = float(os.getenv('KG_INGEST_BACKOFF_SECONDS', 2))
+KG_INGEST_STALE_AFTER = timedelta(seconds=int(os.getenv('KG_INGEST_STALE_AFTER_SECONDS', 900))) # Well past a job's retry schedule
+
+kg_ingest_queue = queue.Queue(maxsize=KG_INGEST_QUEUE_SIZE)
+kg_ingest_workers = []
+kg_ingest_workers_lock = threading.Lock()
+
+def set_kg_job_status(resource_id, status, attempts=None, error=None):
+    job = KGIngestJob.query.get(resource_id)
+    if not job:
+        job = KGIngestJob(resource_id=resource_id)
+        db.session.add(job)
+    job.status = status
+    if attempts is not None:
+        job.attempts = attempts
+    job.last_error = error
+    db.session.commit()
+
+def ingest_resource_into_kg(resource_id):
+    """Extracts concepts for one stored resource and writes them to Neo4j. Raises on failure."""
+    if not get_neo4j_driver() or not get_nlp():
+        raise RuntimeError("NLP model or Neo4j driver not available")
+
+    resource = db.session.query(Resource.title, Resource.description, Resource.url).filter_by(id=resource_id).first()
+    if not resource:
+        raise LookupError(f"Resource {resource_id} no longer exists")
+
+    concepts_list = extract_concepts(resource.title, resource.description)
+    write_resources_to_kg([{
+        "resource_id": resource_id,
+        "title": resource.title,
+        "url": resource.url,
+        "text_hash": kg_text_hash(resource.title, resource.description),
+        "concepts": concepts_list
+    }])
+    logger.info(f"Knowledge Graph updated for resource {resource_id} with concepts: {concepts_list}")
+
+def _run_kg_ingest_job(resource_id):
+    for attempt in range(1, KG_INGEST_MAX_ATTEMPTS + 1):
+        with app.app_context():
+            try:
+                set_kg_job_status(resource_id, 'processing', attempts=attempt)
+                ingest_resource_into_kg(resource_id)
+                set_kg_job_status(resource_id, 'done', attempts=attempt)
+                return
+            except LookupError as e:
+                db.session.rollback()
+                logger.warning(f"Dropping KG ingest job for resource {resource_id}: {e}")
+                return
+            except Exception as e:
+                db.session.rollback()
+                if attempt == KG_INGEST_MAX_ATTEMPTS:
+                    logger.error(f"KG ingest for resource {resource_id} failed after {attempt} attempts, moved to dead letters: {e}")
+                    set_kg_job_status(resource_id, 'failed', attempts=attempt, error=str(e))
+                    return
+                logger.warning(f"KG ingest for resource {resource_id} failed (attempt {attempt}), retrying: {e}")
+                set_kg_job_status(resource_id, 'pending', attempts=attempt, error=str(e))
+        time.sleep(KG_INGEST_BACKOFF_SECONDS * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+def _kg_ingest_worker():
+    while True:
+        resource_id = kg_ingest_queue.get()
+        try:
+            _run_kg_ingest_job(resource_id)
+        except Exception as e:
+            logger.error(f"Unexpected error in KG ingest worker for resource {resource_id}: {e}")
+        finally:
+            kg_ingest_queue.task_done()
+
+def start_kg_ingest_workers():
+    # Started on first use rather than at import so forked web workers and CLI
+    # commands that never ingest do not carry idle threads.
+    with kg_ingest_workers_lock:
+        while len(kg_ingest_workers) < KG_INGEST_WORKERS:
+            worker = threading.Thread(target=_kg_ingest_worker, name=f"kg-ingest-{len(kg_ingest_workers)}", daemon=True)
+            worker.start()
+            kg_ingest_workers.append(worker)
+
+def enqueue_kg_ingest(resource_id):
+    """Queues a resource for ingestion. Returns False when the queue is full."""
+    start_kg_ingest_workers()
+    try:
+        kg_ingest_queue.put_nowait(resource_id)
+        return True
+    except queue.Full:
+        return False
+
+def recoverable_kg_job_ids(stale_after=KG_INGEST_STALE_AFTER, include_failed=False, after_id=0, limit=500):
+    """Ids of jobs pending or processing for longer than stale_after (and failed ones if asked), in id order."""
+    condition = db.and_(KGIngestJob.status.in_(('pending', 'processing')),
+                        KGIngestJob.updated_at < datetime.utcnow() - stale_after)
+    if include_failed:
+        condition = db.or_(condition, KGIngestJob.status == 'failed')
+    return [resource_id for (resource_id,) in
+            db.session.query(KGIngestJob.resource_id).filter(condition, KGIngestJob.resource_id > after_id)
+            .order_by(KGIngestJob.resource_id).limit(limit)]
+
+@app.cli.command('kg-ingest-recover')
+@click.option('--stale-after', default=int(KG_INGEST_STALE_AFTER.total_seconds()), show_default=True,
+              help='Seconds after which a pending or processing job counts as abandoned.')
+@click.option('--failed', 'include_failed', is_flag=True, help='Also retry dead-lettered (failed) jobs.')
+@click.option('--batch-size', default=500, show_default=True, help='Job rows read per query.')
+def kg_ingest_recover(stale_after, include_failed, batch_size):
+    """Re-runs KG ingest jobs abandoned by exited workers and waits for them to finish."""
+    if not get_neo4j_driver() or not get_nlp():
+        raise click.ClickException("spaCy model and Neo4j driver are both required for kg-ingest-recover.")
+
+    start_kg_ingest_workers()
+    recovered = []
+    while True:
+        ids = recoverable_kg_job_ids(timedelta(seconds=stale_after), include_failed,
+                                     after_id=recovered[-1] if recovered else 0, limit=batch_size)
+        if not ids:
+            break
+        for resource_id in ids:
+            kg_ingest_queue.put(resource_id) # Blocks while the workers catch up
+        recovered.extend(ids)
+    db.session.rollback()
+    kg_ingest_queue.join()
+
+    statuses = Counter()
+    for start in range(0, len(recovered), batch_size):
+        statuses.update(status for (status,) in db.session.query(KGIngestJob.status)
+                        .filter(KGIngestJob.resource_id.in_(recovered[start:start + batch_size])))
+    click.echo(f"Re-ran {len(recovered)} KG ingest jobs: {statuses['done']} done, {statuses['failed']} failed.")
+
+
+def save_resource_and_queue_kg(new_resource):
+    """Commits a new Resource together with its KG ingest job and queues it. Returns the job status."""
+    db.session.add(new_resource)
+    db.session.flush()
+    db.session.add(KGIngestJob(resource_id=new_resource.id, status='pending'))
+    db.session.commit()
+
+    if kg_subsystems_unavailable():
+        logger.warning(f"Skipping KG processing for resource {new_resource.id} due to missing NLP or Neo4j connection.")
+        set_kg_job_status(new_resource.id, 'failed', error="NLP model or Neo4j driver not available")
+        return 'failed'
+    if not enqueue_kg_ingest(new_resource.id):
+        logger.warning(f"KG ingest queue full, resource {new_resource.id} moved to dead letters.")
+        set_kg_job_status(new_resource.id, 'failed', error="KG ingest queue full")
+        return 'failed'
+    return 'pending'
+
+
+# --- Page Fetching for Contributed URLs ---
+# /fetch_and_add_resource only needs a page's title and description, which live in
+# <head>. Pages are fetched through one pooled session with strict timeouts, the
+# body is streamed and cut off at FETCH_MAX_BYTES (or as soon as </head> arrives),
+# and only <title>/<meta> tags are parsed. Results are cached per URL in the
+# page_fetch_cache table and revalidated with If-None-Match/If-Modified-Since.
+# Redirects are followed by hand so that every hop's host is resolved and checked
+# against private networks, and the request then goes to exactly the address that
+# was checked, so a DNS rebind between check and connect cannot redirect it.
+FETCH_CONNECT_TIMEOUT = float(os.getenv('FETCH_CONNECT_TIMEOUT', 3))
+FETCH_READ_TIMEOUT = float(os.getenv('FETCH_READ_TIMEOUT', 5))
+FETCH_MAX_BYTES = int(os.getenv('FETCH_MAX_BYTES', 256 * 1024))
+FETCH_CACHE_TTL = timedelta(seconds=int(os.getenv('FETCH_CACHE_TTL_SECONDS', 24 * 3600)))
+FETCH_ALLOW_PRIVATE_HOSTS = os.getenv('FETCH_ALLOW_PRIVATE_HOSTS', 'False').lower() in ['true', '1', 't']
+FETCH_MAX_REDIRECTS = 5
+
+class PageFetchError(Exception):
+    pass
+
+class _PinnedHostAdapter(HTTPAdapter):
+    # Requests are sent to a checked IP literal with the real name in the Host
+    # header; for https the TLS handshake still uses and verifies that name.
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        hostname = urlparse(f"//{request.headers.get('Host', '')}").hostname
+        if host_params['scheme'] == 'https' and hostname:
+            pool_kwargs['server_hostname'] = hostname
+            pool_kwargs['assert_hostname'] = hostname
+        return host_params, pool_kwargs
+
+def _make_http_session():
+    session = requests.Session()
+    adapter = _PinnedHostAdapter(pool_connections=16, pool_maxsize=32,
+                                 max_retries=Retry(total=2, connect=2, read=0, redirect=False, backoff_factor=0.3,
+                                                   status_forcelist=[502, 503, 504]))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = 'GyanPath.ai resource fetcher'
+    return session
+
+http_session = _make_http_session()
+
+def _resolve_fetchable_host(hostname, port):
+    """Resolves hostname and returns one address to connect to. Raises PageFetchError for private networks."""
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(hostname, port, type=socket.SOCK_STREAM)]
+    except socket.gaierror:
+        raise PageFetchError(f"Could not resolve host {hostname}")
+    if not addresses:
+        raise PageFetchError(f"Could not resolve host {hostname}")
+    if not FETCH_ALLOW_PRIVATE_HOSTS:
+        for address in addresses:
+            if not ipaddress.ip_address(address.split('%')[0]).is_global:
+                raise PageFetchError("URL points to a private network address")
+    return addresses[0]
+
+def _pin_fetchable_url(url):
+    """Checks url and returns (url rewritten to the checked address, Host header value)."""
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise PageFetchError("URL must be an absolute http(s) URL")
+    port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+    address = _resolve_fetchable_host(parsed.hostname, port)
+    host = f"[{address}]" if ':' in address else address
+    netloc = f"{host}:{parsed.port}" if parsed.port else host
+    return parsed._replace(netloc=netloc).geturl(), parsed.netloc.rpartition('@')[2]
+
+def _get_following_redirects(url, headers):
+    """GETs url (streamed), checking and pinning the host of every redirect hop. Returns the final response."""
+    for _ in range(FETCH_MAX_REDIRECTS + 1):
+        pinned_url, host = _pin_fetchable_url(url)
+        response = http_session.get(pinned_url, headers={**headers, 'Host': host}, stream=True, allow_redirects=False,
+                                    timeout=(FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT))
+        if not response.is_redirect:
+            return response
+        response.close()
+        url = urljoin(url, response.headers['Location'])
+        # Validators belong to the originally requested URL only.
+        headers = {}
+    raise PageFetchError(f"Too many redirects (more than {FETCH_MAX_REDIRECTS})")
+
+def _read_head(response):
+    body = b''
+    for chunk in response.iter_content(chunk_size=16 * 1024):
+        body += chunk
+        if len(body) >= FETCH_MAX_BYTES or b'</head>' in body.lower():
+            break
+    return body[:FETCH_MAX_BYTES]
+
+def parse_page_metadata(body, encoding=None):
+    soup = BeautifulSoup(body, 'html.parser', parse_only=SoupStrainer(['title', 'meta']), from_encoding=encoding)
+    meta = {}
+    for tag in soup.find_all('meta'):
+        key = (tag.get('property') or tag.get('name') or '').lower()
+        if key and tag.get('content') and key not in meta:
+            meta[key] = tag['content'].strip()
+    title = meta.get('og:title') or (soup.title.string.strip() if soup.title and soup.title.string else None)
+    description = meta.get('description') or meta.get('og:description')
+    return title, description
+
+def fetch_page_metadata(url):
+    """Returns (title, description) for a page, using the cache when fresh. Raises PageFetchError."""
+    cached = PageFetchCache.query.get(url)
+    now = datetime.utcnow()
+    if cached and now - cached.fetched_at < FETCH_CACHE_TTL:
+        return cached.title, cached.description
+
+    headers = {}
+    if cached and cached.etag:
+        headers['If-None-Match'] = cached.etag
+    if cached and cached.last_modified:
+        headers['If-Modified-Since'] = cached.last_modified
+
+    try:
+        with _get_following_redirects(url, headers) as response:
+            if response.status_code == 304 and cached:
+                cached.fetched_at = now
+                db.session.commit()
+                return cached.title, cached.description
+            if response.status_code >= 400:
+                raise PageFetchError(f"Page returned HTTP {response.status_code}")
+            content_type = response.headers.get('Content-Type', '')
+            if 'html' not in content_type.lower():
+                raise PageFetchError(f"Unsupported content type: {content_type or 'unknown'}")
+            body = _read_head(response)
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            encoding = response.encoding if 'charset' in content_type.lower() else None
+    except requests.RequestException as e:
+        raise PageFetchError(f"Failed to fetch URL: {e}")
+
+    title, description = parse_page_metadata(body, encoding)
+    if not cached:
+        cached = PageFetchCache(url=url)
+        db.session.add(cached)
+    cached.title = title
+    cached.description = description
+    cached.etag = etag
+    cached.last_modified = last_modified
+    cached.fetched_at = now
+    db.session.commit()
+    return title, description
+
+
+# --- Bulk Knowledge Graph Re-extraction (flask kg-reindex) ---
+def iter_resource_chunks(after_id=0, chunk_size=1000):
+    """Streams lists of (id, title, description, url) rows in id order, chunk_size rows per query."""
+    while True:
+        rows = (db.session.query(Resource.id, Resource.title, Resource.description, Resource.url)
+                .filter(Resource.id > after_id)
+                .order_by(Resource.id)
+                .limit(chunk_size)
+                .all())
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1].id
+        db.session.expunge_all()
+
+def _iter_reindex_items(after_id, chunk_size):
+    # Yields (text, context) pairs for nlp.pipe. Texts whose concepts are already
+    # cached are replaced by an empty string so they cost nothing in the pipeline
+    # while keeping id order for the checkpoint. Contexts are plain tuples so they
+    # survive n_process > 1.
+    for rows in iter_resource_chunks(after_id, chunk_size):
+        texts = [kg_text(row.title, row.description) for row in rows]
+        keys = [concept_cache_key(text) for text in texts]
+        cached = get_cached_concepts(keys)
+        for row, text, key in zip(rows, texts, keys):
+            yield ('' if key in cached else text), (row.id, row.title, row.url, kg_text_hash(row.title, row.description),
+                                                    key, cached.get(key))
+
+def _read_reindex_checkpoint(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+def _write_reindex_checkpoint(path, last_id):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(str(last_id))
+    os.replace(tmp_path, path)
+
+def _remove_reindex_checkpoint(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+@app.cli.command('kg-reindex')
+@click.option('--chunk-size', default=1000, show_default=True, help='Resource rows fetched from the database per query.')
+@click.option('--batch-size', default=64, show_default=True, help='Documents per nlp.pipe batch.')
+@click.option('--n-process', default=1, show_default=True, help='spaCy worker processes.')
+@click.option('--write-batch-size', default=KG_WRITE_BATCH_SIZE, show_default=True, help='Resources per Neo4j write transaction.')
+@click.option('--checkpoint-file', default='.kg_reindex_checkpoint', show_default=True, help='Where the last written resource id is stored.')
+@click.option('--resume/--no-resume', default=True, show_default=True, help='Continue after the id in the checkpoint file left by an interrupted run.')
+def kg_reindex(chunk_size, batch_size, n_process, write_batch_size, checkpoint_file, resume):
+    """Re-extracts concepts for every resource and rewrites them to the Knowledge Graph."""
+    nlp = get_nlp()
+    if not nlp or not get_neo4j_driver():
+        raise click.ClickException("spaCy model and Neo4j driver are both required for kg-reindex.")
+
+    after_id = _read_reindex_checkpoint(checkpoint_file) if resume else 0
+    if after_id:
+        click.echo(f"Resuming after resource {after_id}.")
+
+    docs = nlp.pipe(_iter_reindex_items(after_id, chunk_size), as_tuples=True, batch_size=batch_size,
+                    n_process=n_process, disable=kg_pipe_disabled_components())
+
+    started = time.perf_counter()
+    processed = 0
+    pending = []
+    new_cache_entries = {}
+
+    def flush():
+        store_cached_concepts(new_cache_entries)
+        new_cache_entries.clear()
+        write_resources_to_kg(pending, batch_size=write_batch_size)
+        KGIngestJob.query.filter(KGIngestJob.resource_id.in_([item["resource_id"] for item in pending])) \
+            .update({"status": "done", "last_error": None}, synchronize_session=False)
+        db.session.commit()
+        _write_reindex_checkpoint(checkpoint_file, pending[-1]["resource_id"])
+        elapsed = time.perf_counter() - started
+        click.echo(f"{processed} resources written (last id {pending[-1]['resource_id']}), {processed / elapsed:.1f} docs/s")
+        pending.clear()
+
+    for doc, (resource_id, title, url, text_hash, key, cached_concepts) in docs:
+        if cached_concepts is None:
+            cached_concepts = new_cache_entries[key] = concepts_from_doc(doc)
+        pending.append({
+            "resource_id": resource_id,
+            "title": title,
+            "url": url,
+            "text_hash": text_hash,
+            "concepts": cached_concepts
+        })
+        processed += 1
+        if len(pending) >= write_batch_size:
+            flush()
+    if pending:
+        flush()
+    # The pass is complete, so the next run starts from the first resource again.
+    _remove_reindex_checkpoint(checkpoint_file)
+
+    elapsed = time.perf_counter() - started
+    rate = processed / elapsed if elapsed else 0.0
+    click.echo(f"Reindexed {processed} resources in {elapsed:.1f}s ({rate:.1f} docs/s).")
+    click.echo(f"Concept cache: {concept_cache_stats['memory_hits']} memory hits, "
+               f"{concept_cache_stats['db_hits']} database hits, {concept_cache_stats['misses']} misses.")
+
+
+# --- One-off Concept Merge (flask kg-merge-concepts) ---
+# Graphs built before canonicalization hold one Concept node per raw spelling.
+# This merges every group of names with the same canonical name into the canonical
+# node, moving TEACHES, PREREQUISITE_OF and KNOWS edges, and deletes nodes whose name
+# canonicalizes to nothing (stopword-only chunks).
+KG_MERGE_CONCEPTS_QUERY = (
+    "UNWIND $merges AS m "
+    "MERGE (target:Concept {name: m.canonical}) "
+    "ON CREATE SET target.createdAt = timestamp() "
+    "WITH target, m "
+    "UNWIND m.aliases AS alias "
+    "MATCH (c:Concept {name: alias}) "
+    "CALL { WITH c, target "
+    "  MATCH (r:Resource)-[:TEACHES]->(c) MERGE (r)-[:TEACHES]->(target) } "
+    "CALL { WITH c, target, m "
+    "  MATCH (p:Concept)-[:PREREQUISITE_OF]->(c) WHERE p <> target AND NOT p.name IN m.aliases "
+    "  MERGE (p)-[:PREREQUISITE_OF]->(target) } "
+    "CALL { WITH c, target, m "
+    "  MATCH (c)-[:PREREQUISITE_OF]->(n:Concept) WHERE n <> target AND NOT n.name IN m.aliases "
+    "  MERGE (target)-[:PREREQUISITE_OF]->(n) } "
+    "CALL { WITH c, target "
+    "  MATCH (u:User)-[k:KNOWS]->(c) MERGE (u)-[t:KNOWS]->(target) "
+    "  SET t.level = CASE WHEN t.level IS NULL OR k.level > t.level THEN k.level ELSE t.level END, "
+    "      t.updatedAt = timestamp() } "
+    "DETACH DELETE c"
+)
+KG_DELETE_CONCEPTS_QUERY = "UNWIND $names AS name MATCH (c:Concept {name: name}) DETACH DELETE c"
+
+def _read_concept_names_tx(tx):
+    return [record["name"] for record in tx.run("MATCH (c:Concept) RETURN c.name AS name")]
+
+def canonical_concept_names(names, batch_size=256):
+    """
+    Canonicalizes plain concept names (not spans of a larger text). Without the
+    spaCy model only case, whitespace and synonyms are normalized.
+    """
+    nlp = get_nlp()
+    if not nlp:
+        normalized = [' '.join((name or '').lower().split()) for name in names]
+        return [concept_synonyms.get(name, name) or None for name in normalized]
+    docs = nlp.pipe(names, batch_size=batch_size, disable=kg_pipe_disabled_components(KG_PIPE_NAME_COMPONENTS))
+    return [canonical_concept_name(doc[:]) for doc in docs]
+
+def lookup_concept(name, lookup):
+    """
+    Finds a concept named by a user, trying its canonical form first and then the
+    plain lowercased name (for concepts stored before canonicalization).
+    lookup(lowercase name) returns the stored name or None.
+    """
+    plain = ' '.join(name.lower().split())
+    for candidate in dict.fromkeys([canonical_concept_names([name])[0], plain]):
+        found = candidate and lookup(candidate)
+        if found:
+            return found
+    return None
+
+def plan_concept_merges(names, batch_size=256):
+    """Returns ({canonical: [alias names]}, [names to delete]) for the given Concept names."""
+    merges = {}
+    deletions = []
+    for name, canonical in zip(names, canonical_concept_names(names, batch_size)):
+        if canonical is None:
+            deletions.append(name)
+        elif canonical != name:
+            merges.setdefault(canonical, []).append(name)
+    return merges, deletions
+
+@app.cli.command('kg-merge-concepts')
+@click.option('--batch-size', default=KG_WRITE_BATCH_SIZE, show_default=True, help='Canonical names merged per write transaction.')
+@click.option('--dry-run', is_flag=True, help='Only report what would be merged.')
+def kg_merge_concepts(batch_size, dry_run):
+    """Merges duplicate Concept nodes into their canonical names."""
+    if not get_nlp() or not get_neo4j_driver():
+        raise click.ClickException("spaCy model and Neo4j driver are both required for kg-merge-concepts.")
+
+    with get_neo4j_driver().session() as session:
+        names = session.execute_read(_read_concept_names_tx)
+        merges, deletions = plan_concept_merges(names)
+        alias_count = sum(len(aliases) for aliases in merges.values())
+        click.echo(f"{len(names)} concepts: {alias_count} to merge into {len(merges)} canonical names, {len(deletions)} to delete.")
+        if dry_run:
+            for canonical, aliases in sorted(merges.items())[:50]:
+                click.echo(f"  {canonical} <- {', '.join(sorted(aliases))}")
+            return
+
+        items = [{"canonical": canonical, "aliases": aliases} for canonical, aliases in merges.items()]
+        for start in range(0, len(items), batch_size):
+            with neo4j_query_seconds.time(query='merge_concepts'):
+                session.execute_write(lambda tx, batch: tx.run(KG_MERGE_CONCEPTS_QUERY, merges=batch).consume(),
+                                      items[start:start + batch_size])
+            click.echo(f"{min(start + batch_size, len(items))}/{len(items)} canonical names merged.")
+        for start in range(0, len(deletions), batch_size):
+            session.execute_write(lambda tx, batch: tx.run(KG_DELETE_CONCEPTS_QUERY, names=batch).consume(),
+                                  deletions[start:start + batch_size])
+    click.echo(f"Done: {len(names) - alias_count - len(deletions) + len(set(merges) - set(names))} concepts remain.")
+
+
+# --- Knowledge Graph Schema (flask kg-migrate-schema, flask kg-check-plans) ---
+# Every MERGE keys on Resource.resource_id or Concept.name, and without a uniqueness
+# constraint (which comes with its own index) each one is a label scan. Schema
+# changes are versioned migrations applied at deploy time with
+# `flask kg-migrate-schema`; each applied version is recorded in the graph as a
+# (:SchemaMigration {version}) node. Append new migrations; never edit applied ones.
+KG_SCHEMA_MIGRATIONS = (
+    (1, "Uniqueness constraints on the MERGE keys", (
+        "CREATE CONSTRAINT resource_resource_id IF NOT EXISTS FOR (r:Resource) REQUIRE r.resource_id IS UNIQUE",
+        "CREATE CONSTRAINT concept_name IF NOT EXISTS FOR (c:Concept) REQUIRE c.name IS UNIQUE",
+    )),
+    (2, "Uniqueness constraint for user knowledge", (
+        "CREATE CONSTRAINT user_user_id IF NOT EXISTS FOR (u:User) REQUIRE u.user_id IS UNIQUE",
+    )),
+)
+KG_SCHEMA_VERSION = KG_SCHEMA_MIGRATIONS[-1][0]
+
+# Keyed queries whose plans must use an index, with sample parameters for EXPLAIN.
+# Deliberate whole-graph reads (the snapshot and co-occurrence index loads) are not
+# listed since they scan by design.
+KG_PLAN_CHECKED_QUERIES = {
+    'upsert_resources': (KG_UPSERT_RESOURCES_QUERY,
+                         {"resources": [{"resource_id": 0, "title": "", "url": "", "text_hash": "", "concepts": ["python"]}]}),
+    'merge_concepts': (KG_MERGE_CONCEPTS_QUERY, {"merges": [{"canonical": "python", "aliases": ["Python"]}]}),
+    'delete_concepts': (KG_DELETE_CONCEPTS_QUERY, {"names": ["Python"]}),
+}
+KG_PLAN_FORBIDDEN_OPERATORS = ('NodeByLabelScan', 'AllNodesScan')
+
+def get_kg_schema_version(session):
+    record = session.run("MATCH (m:SchemaMigration) RETURN max(m.version) AS version").single()
+    return (record["version"] if record else None) or 0
+
+def migrate_kg_schema(session, target_version=KG_SCHEMA_VERSION):
+    """Applies the migrations above the graph's recorded version, up to target_version. Returns the versions applied."""
+    applied = []
+    current = get_kg_schema_version(session)
+    for version, description, statements in KG_SCHEMA_MIGRATIONS:
+        if version <= current or version > target_version:
+            continue
+        # Schema commands cannot share a transaction with writes, so each is auto-committed.
+        for statement in statements:
+            session.run(statement).consume()
+        session.run("MERGE (m:SchemaMigration {version: $version}) "
+                    "ON CREATE SET m.description = $description, m.appliedAt = timestamp()",
+                    version=version, description=description).consume()
+        applied.append(version)
+    return applied
+
+def _plan_operators(plan):
+    yield plan['operatorType'].split('@')[0]
+    for child in plan.get('children', ()):
+        yield from _plan_operators(child)
+
+def explain_kg_queries(session, queries=None):
+    """
+    Runs EXPLAIN on each checked query and returns {query name: [forbidden operators]}
+    for the ones whose plans scan nodes by label instead of using an index. An empty
+    result means every query is index-backed; run it in CI against a migrated graph.
+    """
+    problems = {}
+    for name, (query, parameters) in (queries or KG_PLAN_CHECKED_QUERIES).items():
+        plan = session.run(f"EXPLAIN {query}", parameters).consume().plan
+        scans = [operator for operator in _plan_operators(plan) if operator in KG_PLAN_FORBIDDEN_OPERATORS]
+        if scans:
+            problems[name] = scans
+    return problems
+
+@app.cli.command('kg-migrate-schema')
+@click.option('--to-version', default=KG_SCHEMA_VERSION, show_default=True, help='Stop after this schema version.')
+@click.option('--status', is_flag=True, help='Only print the applied and latest schema versions.')
+def kg_migrate_schema(to_version, status):
+    """Creates the Knowledge Graph constraints and indexes and records the schema version."""
+    if not get_neo4j_driver():
+        raise click.ClickException("Neo4j driver is required for kg-migrate-schema.")
+    with get_neo4j_driver().session() as session:
+        current = get_kg_schema_version(session)
+        click.echo(f"Graph schema version {current} (latest {KG_SCHEMA_VERSION}).")
+        if status:
+            return
+        try:
+            applied = migrate_kg_schema(session, to_version)
+        except Neo4jError as e:
+            # Typically a uniqueness constraint that existing duplicate nodes violate.
+            raise click.ClickException(f"Schema migration failed: {e}")
+    for version in applied:
+        click.echo(f"Applied schema migration {version}.")
+    if not applied:
+        click.echo("Schema is up to date.")
+
+@app.cli.command('kg-check-plans')
+def kg_check_plans():
+    """Fails if any keyed Knowledge Graph query plans a label scan instead of an index lookup."""
+    if not get_neo4j_driver():
+        raise click.ClickException("Neo4j driver is required for kg-check-plans.")
+    with get_neo4j_driver().session() as session:
+        problems = explain_kg_queries(session)
+    for name, operators in problems.items():
+        click.echo(f"{name}: {', '.join(operators)}")
+    if problems:
+        raise click.ClickException(f"{len(problems)} of {len(KG_PLAN_CHECKED_QUERIES)} queries plan label scans; "
+                                   "run `flask kg-migrate-schema`.")
+    click.echo(f"All {len(KG_PLAN_CHECKED_QUERIES)} checked queries use indexes.")
+
+
+# --- Postgres/Knowledge Graph Reconciliation (flask kg-reconcile) ---
+# Resource writes reach Neo4j only through best-effort ingestion, so rows can be
+# missing from the graph (Neo4j or spaCy was down) or stale (the row changed), and
+# graph nodes can outlive their row. kg-reconcile checks, in bounded batches, only
+# the rows changed since the stored updated_at watermark, and rewrites the missing
+# ones and those whose title, url or r.textHash differ (a changed description
+# changes the concepts, and the rewrite replaces the TEACHES edges). With
+# --orphans it then pages through every Resource node to delete those without a
+# row, and sweeps Concept nodes without any relationship.
+KG_RECONCILE_WATERMARK = 'kg_reconcile'
+KG_RECONCILE_SLACK = timedelta(seconds=int(os.getenv('KG_RECONCILE_SLACK_SECONDS', 60))) # Re-check rows committed late
+KG_READ_RESOURCES_QUERY = ("UNWIND $ids AS id MATCH (r:Resource {resource_id: id}) "
+                           "RETURN r.resource_id AS resource_id, r.title AS title, r.url AS url, r.textHash AS text_hash")
+KG_RESOURCE_ID_PAGE_QUERY = ("MATCH (r:Resource) WHERE r.resource_id > $after_id "
+                             "RETURN r.resource_id AS resource_id ORDER BY r.resource_id LIMIT $limit")
+KG_DELETE_RESOURCES_QUERY = "UNWIND $ids AS id MATCH (r:Resource {resource_id: id}) DETACH DELETE r"
+KG_DELETE_UNLINKED_CONCEPTS_QUERY = ("MATCH (c:Concept) WHERE NOT (c)--() WITH c LIMIT $limit "
+                                     "DETACH DELETE c RETURN count(*) AS deleted")
+KG_PLAN_CHECKED_QUERIES.update({
+    'read_resources': (KG_READ_RESOURCES_QUERY, {"ids": [0]}),
+    'resource_id_page': (KG_RESOURCE_ID_PAGE_QUERY, {"after_id": 0, "limit": 1}),
+    'delete_resources': (KG_DELETE_RESOURCES_QUERY, {"ids": [0]}),
+})
+
+def _read_graph_resources_tx(tx, ids):
+    return {record["resource_id"]: record for record in tx.run(KG_READ_RESOURCES_QUERY, ids=ids)}
+
+def _read_graph_resource_id_page_tx(tx, after_id, limit):
+    return [record["resource_id"] for record in tx.run(KG_RESOURCE_ID_PAGE_QUERY, after_id=after_id, limit=limit)]
+
+def concepts_for_rows(rows, batch_size=64):
+    """Returns a concept list per (title, description) row, via the extraction cache and one nlp.pipe pass."""
+    texts = [kg_text(row.title, row.description) for row in rows]
+    keys = [concept_cache_key(text) for text in texts]
+    cached = get_cached_concepts(keys)
+    missing = [(text, key) for text, key in zip(texts, keys) if key not in cached]
+    if missing:
+        docs = get_nlp().pipe([text for text, _ in missing], batch_size=batch_size, disable=kg_pipe_disabled_components())
+        new_entries = {key: concepts_from_doc(doc) for (_, key), doc in zip(missing, docs)}
+        store_cached_concepts(new_entries)
+        cached.update(new_entries)
+    return [cached[key] for key in keys]
+
+def reconcile_changed_resources(session, batch_size, full=False, dry_run=False):
+    """Checks rows changed since the watermark against the graph and rewrites drifted ones. Returns drift counts."""
+    counts = Counter()
+    state = db.session.get(JobWatermark, KG_RECONCILE_WATERMARK) or JobWatermark(name=KG_RECONCILE_WATERMARK)
+    since = None if full or state.watermark is None else state.watermark - KG_RECONCILE_SLACK
+
+    columns = (Resource.id, Resource.title, Resource.description, Resource.url, Resource.updated_at)
+    last_id = None
+    while True:
+        query = db.session.query(*columns)
+        if since is not None:
+            query = query.filter(Resource.updated_at >= since)
+        if last_id is not None:
+            # As in GET /resources, the keyset timestamp is read back in SQL rather than bound
+            # from Python, so SQLite compares it in its own text format.
+            last_updated_at = db.session.query(Resource.updated_at).filter(Resource.id == last_id).scalar_subquery()
+            query = query.filter(db.tuple_(Resource.updated_at, Resource.id) > db.tuple_(last_updated_at, last_id))
+        rows = query.order_by(Resource.updated_at, Resource.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        with neo4j_query_seconds.time(query='read_resources'):
+            nodes = session.execute_read(_read_graph_resources_tx, [row.id for row in rows])
+        missing = [row for row in rows if row.id not in nodes]
+        stale = [row for row in rows if row.id in nodes and
+                 (nodes[row.id]["title"], nodes[row.id]["url"], nodes[row.id]["text_hash"]) !=
+                 (row.title, row.url, kg_text_hash(row.title, row.description))]
+        counts['checked'] += len(rows)
+        counts['missing'] += len(missing)
+        counts['stale'] += len(stale)
+
+        drifted = missing + stale
+        if drifted and not dry_run:
+            write_resources_to_kg([{
+                "resource_id": row.id,
+                "title": row.title,
+                "url": row.url,
+                "text_hash": kg_text_hash(row.title, row.description),
+                "concepts": concepts
+            } for row, concepts in zip(drifted, concepts_for_rows(drifted))], batch_size=batch_size)
+            KGIngestJob.query.filter(KGIngestJob.resource_id.in_([row.id for row in missing])) \
+                .update({"status": "done", "last_error": None}, synchronize_session=False)
+        if not dry_run:
+            # Only advance past batches that are fully written.
+            state.watermark = rows[-1].updated_at
+            db.session.add(state)
+            db.session.commit()
+    return counts
+
+def remove_orphaned_graph_nodes(session, batch_size, dry_run=False):
+    """Deletes Resource nodes whose row is gone and Concept nodes with no relationships. Returns drift counts."""
+    counts = Counter()
+    after_id = -1
+    while True:
+        with neo4j_query_seconds.time(query='resource_id_page'):
+            graph_ids = session.execute_read(_read_graph_resource_id_page_tx, after_id, batch_size)
+        if not graph_ids:
+            break
+        after_id = graph_ids[-1]
+        existing = {row.id for row in db.session.query(Resource.id).filter(Resource.id.in_(graph_ids))}
+        orphans = [resource_id for resource_id in graph_ids if resource_id not in existing]
+        counts['orphaned_resources'] += len(orphans)
+        if orphans and not dry_run:
+            session.execute_write(lambda tx, ids: tx.run(KG_DELETE_RESOURCES_QUERY, ids=ids).consume(), orphans)
+
+    if not dry_run:
+        while True:
+            deleted = session.execute_write(
+                lambda tx: tx.run(KG_DELETE_UNLINKED_CONCEPTS_QUERY, limit=batch_size).single()["deleted"])
+            counts['orphaned_concepts'] += deleted
+            if deleted < batch_size:
+                break
+    return counts
+
+@app.cli.command('kg-reconcile')
+@click.option('--batch-size', default=500, show_default=True, help='Rows or graph nodes checked per batch.')
+@click.option('--full', is_flag=True, help='Check every row instead of those changed since the last run.')
+@click.option('--orphans', is_flag=True,
+              help='Also remove graph nodes that have no row. Reads every Resource node, so schedule it less often.')
+@click.option('--dry-run', is_flag=True, help='Only report drift; write nothing and keep the watermark.')
+def kg_reconcile(batch_size, full, orphans, dry_run):
+    """Repairs drift between the resource table and the Knowledge Graph."""
+    if not get_neo4j_driver() or (not dry_run and not get_nlp()):
+        raise click.ClickException("spaCy model and Neo4j driver are both required for kg-reconcile.")
+
+    started = time.perf_counter()
+    with get_neo4j_driver().session() as session:
+        counts = reconcile_changed_resources(session, batch_size, full=full, dry_run=dry_run)
+        if orphans:
+            counts.update(remove_orphaned_graph_nodes(session, batch_size, dry_run=dry_run))
+
+    report = ", ".join(f"{name} {counts[name]}" for name in
+                       ('checked', 'missing', 'stale', 'orphaned_resources', 'orphaned_concepts'))
+    logger.info(f"KG reconciliation{' (dry run)' if dry_run else ''}: {report}")
+    click.echo(f"{report} in {time.perf_counter() - started:.1f}s{' (dry run)' if dry_run else ''}.")
+
+
+# --- Learning Path Engine ---
+# Paths are planned against an in-memory snapshot of the Concept/Resource graph
+# rather than with Cypher traversals per request. The snapshot is rebuilt in the
+# background once it is older than LEARNING_PATH_SNAPSHOT_TTL, and each rebuild
+# bumps the graph version. Planned paths are cached per (user, target, profile,
+# user knowledge version, graph version), so a repeat request is a dict lookup.
+LEARNING_PATH_SNAPSHOT_TTL = timedelta(seconds=int(os.getenv('LEARNING_PATH_SNAPSHOT_TTL_SECONDS', 600)))
+LEARNING_PATH_CACHE_SIZE = int(os.getenv('LEARNING_PATH_CACHE_SIZE', 2048))
+LEARNING_PATH_MAX_STEPS = 6
+LEARNING_PATH_RESOURCES_PER_STEP = 3
+DIFFICULTY_LEVELS = ['beginner', 'intermediate', 'advanced']
+
+class GraphSnapshot:
+    def __init__(self, version, concept_resources, prerequisites, resources):
+        self.version = version
+        self.built_at = datetime.utcnow()
+        self.concept_resources = concept_resources # concept name -> set of resource ids teaching it
+        self.prerequisites = prerequisites # concept name -> set of concept names it requires
+        self.resources = resources # resource id -> row with title, url, type, difficulty, time
+        self.resource_concepts = {}
+        for concept_name, resource_ids in concept_resources.items():
+            for resource_id in resource_ids:
+                self.resource_concepts.setdefault(resource_id, set()).add(concept_name)
+        self.concepts_by_lower_name = {name.lower(): name for name in concept_resources}
+
+graph_snapshot = None
+graph_snapshot_versions = itertools.count(1)
+graph_snapshot_lock = threading.Lock()
+graph_snapshot_refreshing = threading.Lock() # Held by the one background rebuild in flight
+learning_path_cache = OrderedDict()
+learning_path_cache_lock = threading.Lock()
+
+def _read_teaches_edges_tx(tx):
+    return [(record["resource_id"], record["concept"]) for record in
+            tx.run("MATCH (r:Resource)-[:TEACHES]->(c:Concept) RETURN r.resource_id AS resource_id, c.name AS concept")]
+
+def _read_prerequisite_edges_tx(tx):
+    return [(record["prerequisite"], record["concept"]) for record in
+            tx.run("MATCH (p:Concept)-[:PREREQUISITE_OF]->(c:Concept) RETURN p.name AS prerequisite, c.name AS concept")]
+
+def build_graph_snapshot():
+    version = next(graph_snapshot_versions)
+    with get_neo4j_driver().session() as session:
+        with neo4j_query_seconds.time(query='read_teaches_edges'):
+            teaches = session.execute_read(_read_teaches_edges_tx)
+        with neo4j_query_seconds.time(query='read_prerequisite_edges'):
+            prerequisite_edges = session.execute_read(_read_prerequisite_edges_tx)
+
+    concept_resources = {}
+    for resource_id, concept_name in teaches:
+        concept_resources.setdefault(concept_name, set()).add(resource_id)
+    prerequisites = {}
+    for prerequisite, concept_name in prerequisite_edges:
+        prerequisites.setdefault(concept_name, set()).add(prerequisite)
+
+    resource_ids = {resource_id for resource_id, _ in teaches}
+    resources = {}
+    id_list = sorted(resource_ids)
+    for start in range(0, len(id_list), 1000):
+        rows = (db.session.query(Resource.id, Resource.title, Resource.url, Resource.description, Resource.resource_type,
+                                 Resource.difficulty, Resource.estimated_time_minutes)
+                .filter(Resource.id.in_(id_list[start:start + 1000])).all())
+        resources.update({row.id: row for row in rows})
+
+    # Graph nodes whose Postgres row is gone are left out of the snapshot.
+    for concept_name in concept_resources:
+        concept_resources[concept_name] &= resources.keys()
+    return GraphSnapshot(version, concept_resources, prerequisites, resources)
+
+def refresh_in_background(name, refreshing, build, publish):
+    """
+    Runs build() in an app context on a daemon thread and hands the result to
+    publish(). refreshing is a Lock held for the duration, so at most one rebuild
+    of each kind is in flight; callers keep serving the old value meanwhile.
+    """
+    if not refreshing.acquire(blocking=False):
+        return
+
+    def refresh():
+        try:
+            with app.app_context():
+                publish(build())
+        except Exception as e:
+            logger.error(f"Failed to refresh {name}: {e}")
+        finally:
+            refreshing.release()
+
+    threading.Thread(target=refresh, name=f"{name.replace(' ', '-')}-refresh", daemon=True).start()
+
+def _publish_graph_snapshot(snapshot):
+    global graph_snapshot
+    graph_snapshot = snapshot
+    logger.info(f"Learning path graph snapshot refreshed (version {snapshot.version}).")
+
+def _refresh_graph_snapshot_in_background():
+    refresh_in_background('graph snapshot', graph_snapshot_refreshing, build_graph_snapshot, _publish_graph_snapshot)
+
+def get_graph_snapshot():
+    """Returns the current snapshot; builds the first one inline and later ones in the background."""
+    global graph_snapshot
+    if graph_snapshot is None:
+        with graph_snapshot_lock:
+            if graph_snapshot is None:
+                graph_snapshot = build_graph_snapshot()
+    elif datetime.utcnow() - graph_snapshot.built_at > LEARNING_PATH_SNAPSHOT_TTL:
+        _refresh_graph_snapshot_in_background()
+    return graph_snapshot
+
+def parse_time_availability(time_availability):
+    """Turns values such as '30_mins_day' or '1_hour_day' into minutes per day."""
+    match = re.match(r'(\d+)_(min|mins|hour|hours)_', time_availability or '')
+    if not match:
+        return 60
+    amount = int(match.group(1))
+    return amount * 60 if match.group(2).startswith('hour') else amount
+
+def _resource_score(resource, preferred_types, difficulty_rank, minutes_per_day):
+    score = 0
+    if resource.resource_type in preferred_types:
+        score += 2
+    if resource.difficulty in DIFFICULTY_LEVELS:
+        rank = DIFFICULTY_LEVELS.index(resource.difficulty)
+        score += 2 if rank == difficulty_rank else 1 if rank < difficulty_rank else -1
+    if resource.estimated_time_minutes:
+        score += 1 if resource.estimated_time_minutes <= minutes_per_day else -min(resource.estimated_time_minutes / minutes_per_day, 3)
+    return score
+
+def _order_prerequisites(snapshot, target):
+    """
+    Returns the concepts to learn before target, foundations first. Explicit
+    PREREQUISITE_OF edges are followed transitively when present; otherwise the
+    concepts co-taught with target that more resources cover (i.e. more general
+    ones) are used, most general first.
+    """
+    if target in snapshot.prerequisites:
+        ordered, visiting, done = [], set(), set()
+        def visit(concept_name):
+            if concept_name in done or concept_name in visiting:
+                return
+            visiting.add(concept_name)
+            for prerequisite in sorted(snapshot.prerequisites.get(concept_name, ())):
+                visit(prerequisite)
+            visiting.discard(concept_name)
+            done.add(concept_name)
+            ordered.append(concept_name)
+        visit(target)
+        return ordered[:-1]
+
+    target_frequency = len(snapshot.concept_resources.get(target, ()))
+    co_taught = Counter()
+    for resource_id in snapshot.concept_resources.get(target, ()):
+        co_taught.update(snapshot.resource_concepts.get(resource_id, ()))
+    co_taught.pop(target, None)
+    candidates = [name for name in co_taught if len(snapshot.concept_resources[name]) > target_frequency]
+    candidates.sort(key=lambda name: (-co_taught[name], -len(snapshot.concept_resources[name]), name))
+    chosen = candidates[:LEARNING_PATH_MAX_STEPS - 1]
+    return sorted(chosen, key=lambda name: (-len(snapshot.concept_resources[name]), name))
+
+def plan_learning_path(snapshot, target, known_concepts, preferred_types, difficulty_preference, minutes_per_day):
+    difficulty_rank = DIFFICULTY_LEVELS.index(difficulty_preference) if difficulty_preference in DIFFICULTY_LEVELS else 0
+    steps = [name for name in _order_prerequisites(snapshot, target) if name not in known_concepts]
+    if target not in known_concepts:
+        steps.append(target)
+
+    path = []
+    for concept_name in steps[-LEARNING_PATH_MAX_STEPS:]:
+        candidates = [snapshot.resources[resource_id] for resource_id in snapshot.concept_resources.get(concept_name, ())]
+        candidates.sort(key=lambda r: (-_resource_score(r, preferred_types, difficulty_rank, minutes_per_day), r.id))
+        path.append({
+            "concept": concept_name,
+            "resources": [{
+                "id": r.id,
+                "title": r.title,
+                "url": r.url,
+                "description": r.description,
+                "resource_type": r.resource_type,
+                "difficulty": r.difficulty,
+                "estimated_time_minutes": r.estimated_time_minutes
+            } for r in candidates[:LEARNING_PATH_RESOURCES_PER_STEP]]
+        })
+    return path
+
+def get_cached_learning_path(key, compute):
+    with learning_path_cache_lock:
+        if key in learning_path_cache:
+            learning_path_cache.move_to_end(key)
+            return learning_path_cache[key]
+    path = compute()
+    with learning_path_cache_lock:
+        learning_path_cache[key] = path
+        learning_path_cache.move_to_end(key)
+        while len(learning_path_cache) > LEARNING_PATH_CACHE_SIZE:
+            learning_path_cache.popitem(last=False)
+    return path
+
+
+# --- User Knowledge ---
+# What a user knows is stored in the graph as (:User {user_id})-[:KNOWS {level}]->
+# (:Concept) relationships, levels 1 (novice) to 5 (expert). POST
+# /users/<id>/knowledge applies any number of updates in one UNWIND write and can
+# replace the whole inventory (sync). Each write bumps the user's row in
+# user_knowledge_version. Learning paths and recommendations key their caches on
+# that version, and get_user_knowledge only reads the graph when it has changed.
+KNOWLEDGE_LEVELS = range(1, 6)
+KNOWLEDGE_KNOWN_LEVEL = int(os.getenv('KNOWLEDGE_KNOWN_LEVEL', 3)) # Concepts at or above this level count as known
+KNOWLEDGE_MAX_UPDATES = 1000
+KNOWLEDGE_CACHE_SIZE = int(os.getenv('KNOWLEDGE_CACHE_SIZE', 10000))
+KNOWLEDGE_VERSION_ATTEMPTS = 3
+KG_WRITE_KNOWLEDGE_QUERY = (
+    "MERGE (u:User {user_id: $user_id}) "
+    "WITH u "
+    "UNWIND $updates AS upd "
+    "MERGE (c:Concept {name: upd.concept}) "
+    "ON CREATE SET c.createdAt = timestamp() "
+    "MERGE (u)-[k:KNOWS]->(c) "
+    "SET k.level = upd.level, k.updatedAt = timestamp()"
+)
+KG_PRUNE_KNOWLEDGE_QUERY = ("MATCH (u:User {user_id: $user_id})-[k:KNOWS]->(c:Concept) "
+                            "WHERE NOT c.name IN $keep DELETE k RETURN count(k) AS removed")
+KG_READ_KNOWLEDGE_QUERY = ("UNWIND $user_ids AS user_id "
+                           "MATCH (u:User {user_id: user_id})-[k:KNOWS]->(c:Concept) "
+                           "RETURN user_id, c.name AS concept, k.level AS level")
+KG_PLAN_CHECKED_QUERIES.update({
+    'write_knowledge': (KG_WRITE_KNOWLEDGE_QUERY, {"user_id": 0, "updates": [{"concept": "python", "level": 3}]}),
+    'prune_knowledge': (KG_PRUNE_KNOWLEDGE_QUERY, {"user_id": 0, "keep": ["python"]}),
+    'read_knowledge': (KG_READ_KNOWLEDGE_QUERY, {"user_ids": [0]}),
+})
+user_knowledge_cache = OrderedDict() # user id -> (version, {concept name: level})
+user_knowledge_cache_lock = threading.Lock()
+
+def _write_knowledge_tx(tx, user_id, updates, keep):
+    removed = 0
+    if keep is not None:
+        removed = tx.run(KG_PRUNE_KNOWLEDGE_QUERY, user_id=user_id, keep=keep).single()["removed"]
+    tx.run(KG_WRITE_KNOWLEDGE_QUERY, user_id=user_id, updates=updates).consume()
+    return removed
+
+def _read_knowledge_tx(tx, user_ids):
+    levels = {user_id: {} for user_id in user_ids}
+    for record in tx.run(KG_READ_KNOWLEDGE_QUERY, user_ids=user_ids):
+        levels[record["user_id"]][record["concept"]] = record["level"]
+    return levels
+
+class KnowledgeVersionError(Exception):
+    pass
+
+def _increment_knowledge_version(user_id):
+    # Not committed: the UPDATE holds the row lock until the caller commits.
+    insert_ignoring_conflicts(UserKnowledgeVersion.__table__, [{"user_id": user_id, "version": 0}], ['user_id'])
+    db.session.query(UserKnowledgeVersion).filter_by(user_id=user_id) \
+        .update({"version": UserKnowledgeVersion.version + 1}, synchronize_session=False)
+    return db.session.query(UserKnowledgeVersion.version).filter_by(user_id=user_id).scalar()
+
+def bump_knowledge_version(user_id, attempts=KNOWLEDGE_VERSION_ATTEMPTS):
+    """Increments and returns the user's knowledge version (commits), retrying database errors."""
+    for attempt in range(1, attempts + 1):
+        try:
+            version = _increment_knowledge_version(user_id)
+            db.session.commit()
+            return version
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.warning(f"Knowledge version bump for user {user_id} failed (attempt {attempt}/{attempts}): {e}")
+            if attempt < attempts:
+                time.sleep(0.1 * 2 ** attempt)
+    # The graph already holds the new knowledge; drop what this process cached and
+    # tell the caller, since other workers keep their copy until the next bump.
+    with user_knowledge_cache_lock:
+        user_knowledge_cache.pop(user_id, None)
+    raise KnowledgeVersionError(f"Knowledge for user {user_id} was saved but its version could not be updated")
+
+def write_user_knowledge(user_id, updates, sync=False):
+    """
+    Applies [{"concept": canonical name, "level": 1-5}] for a user in one write
+    transaction. With sync, concepts missing from updates are removed. Returns
+    (new knowledge version, relationships removed). Raises KnowledgeVersionError if
+    the graph write succeeded but the version could not be bumped.
+    """
+    keep = [update["concept"] for update in updates] if sync else None
+    # The version is incremented before the graph write and committed after it: a
+    # failed graph write rolls it back, and writes for one user are serialized on
+    # the row lock. Only a failed commit needs the retrying bump.
+    version = _increment_knowledge_version(user_id)
+    try:
+        with get_neo4j_driver().session() as session:
+            with neo4j_query_seconds.time(query='write_knowledge'):
+                removed = session.execute_write(_write_knowledge_tx, user_id, updates, keep)
+    except Exception:
+        db.session.rollback()
+        raise
+    try:
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning(f"Knowledge version commit for user {user_id} failed, retrying: {e}")
+        version = bump_knowledge_version(user_id)
+    return version, removed
+
+def get_users_knowledge_levels(user_ids):
+    """Returns {user id: (knowledge version, {concept name: level})}, reading the graph only for changed users."""
+    versions = dict(db.session.query(UserKnowledgeVersion.user_id, UserKnowledgeVersion.version)
+                    .filter(UserKnowledgeVersion.user_id.in_(user_ids)))
+    found, stale = {}, []
+    with user_knowledge_cache_lock:
+        for user_id in user_ids:
+            version = versions.get(user_id, 0)
+            cached = user_knowledge_cache.get(user_id)
+            if not version:
+                found[user_id] = (0, {})
+            elif cached and cached[0] == version:
+                user_knowledge_cache.move_to_end(user_id)
+                found[user_id] = cached
+            else:
+                stale.append(user_id)
+    if stale:
+        if not get_neo4j_driver():
+            raise RuntimeError("Knowledge Graph is not available")
+        with get_neo4j_driver().session() as session:
+            with neo4j_query_seconds.time(query='read_knowledge'):
+                levels = session.execute_read(_read_knowledge_tx, stale)
+        with user_knowledge_cache_lock:
+            for user_id in stale:
+                found[user_id] = user_knowledge_cache[user_id] = (versions[user_id], levels[user_id])
+                user_knowledge_cache.move_to_end(user_id)
+            while len(user_knowledge_cache) > KNOWLEDGE_CACHE_SIZE:
+                user_knowledge_cache.popitem(last=False)
+    return found
+
+def get_users_knowledge(user_ids):
+    """Returns {user id: (knowledge version, frozenset of concepts known at KNOWLEDGE_KNOWN_LEVEL or above)}."""
+    return {user_id: (version, frozenset(name for name, level in levels.items() if level >= KNOWLEDGE_KNOWN_LEVEL))
+            for user_id, (version, levels) in get_users_knowledge_levels(user_ids).items()}
+
+def get_user_knowledge(user_id):
+    """Returns (knowledge_version, set of known concept names) for a user."""
+    return get_users_knowledge([user_id])[user_id]
+
+def parse_knowledge_updates(payload):
+    """
+    Accepts {"concept_name", "level"}, a list of those, or {"updates": [...], "sync": bool}.
+    Returns (updates, sync, error message).
+    """
+    sync = False
+    if isinstance(payload, dict) and 'updates' in payload:
+        sync = bool(payload.get('sync'))
+        payload = payload['updates']
+    items = payload if isinstance(payload, list) else [payload]
+    if not items and not sync:
+        return None, sync, "No knowledge updates given"
+    if len(items) > KNOWLEDGE_MAX_UPDATES:
+        return None, sync, f"At most {KNOWLEDGE_MAX_UPDATES} updates per request"
+
+    names, levels = [], []
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('concept_name'), str) or not item['concept_name'].strip():
+            return None, sync, "Each update needs a concept_name"
+        level = item.get('level')
+        if isinstance(level, bool) or not isinstance(level, int) or level not in KNOWLEDGE_LEVELS:
+            return None, sync, f"Invalid level for '{item['concept_name']}': must be an integer from 1 to 5"
+        names.append(item['concept_name'].strip())
+        levels.append(level)
+
+    # Later updates to the same canonical concept win.
+    updates = {}
+    for name, canonical, level in zip(names, canonical_concept_names(names), levels):
+        if canonical is None:
+            return None, sync, f"'{name}' is not a concept name"
+        updates[canonical] = level
+    return [{"concept": concept, "level": level} for concept, level in updates.items()], sync, None
+
+
+# --- Concept Co-occurrence Index ---
+# GET /concepts/<name>/related and /concepts/<name>/resources read an in-process
+# index of the TEACHES edges instead of aggregating two hops in Cypher per request.
+# Co-occurrence counts live in a SciPy CSR matrix (entry i, j = resources teaching
+# both concepts; the diagonal = resources teaching each concept), so a related-
+# concepts lookup is one row slice scored by PMI. The index is derived from the
+# learning path GraphSnapshot, so the TEACHES edges are read from Neo4j once for
+# both, and it is rebuilt in the background whenever a new snapshot is published.
+# Resources written to the KG by this process are folded in as sparse deltas
+# meanwhile; as in the graph, a rewrite replaces the resource's concept set.
+CONCEPT_RELATED_MIN_COUNT = int(os.getenv('CONCEPT_RELATED_MIN_COUNT', 2)) # Rarer pairs give noisy PMI
+CONCEPT_QUERY_DEFAULT_LIMIT = 20
+CONCEPT_QUERY_MAX_LIMIT = 100
+
+class ConceptCooccurrenceIndex:
+    def __init__(self, snapshot):
+        self.graph_version = snapshot.version
+        self.concept_ids = {} # concept name -> row/column in the matrix
+        self.concept_names = []
+        self.ids_by_lower_name = {}
+        self.resource_concepts = {} # resource id -> set of concept ids
+        self.concept_resources = {} # concept id -> set of resource ids
+        self.matrix = None
+        self.document_frequency = None
+        self._pending = ([], [], []) # rows, columns, values of counts not yet in self.matrix
+        self.lock = threading.Lock()
+        self._build(snapshot.resource_concepts)
+
+    def _build(self, resource_concepts):
+        # The full matrix is B.T @ B for the resource x concept incidence matrix B,
+        # which SciPy computes in C; only later incremental adds go pair by pair.
+        import numpy as np
+        from scipy import sparse
+
+        rows, columns = [], []
+        for position, (resource_id, concept_names) in enumerate(resource_concepts.items()):
+            concept_ids = {self._concept_id(name) for name in concept_names}
+            self.resource_concepts[resource_id] = concept_ids
+            for concept_id in concept_ids:
+                self.concept_resources[concept_id].add(resource_id)
+            rows.extend([position] * len(concept_ids))
+            columns.extend(concept_ids)
+        incidence = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns)),
+                                      shape=(len(self.resource_concepts), len(self.concept_names)))
+        self.matrix = (incidence.T @ incidence).tocsr()
+        self.matrix.sum_duplicates()
+        self.document_frequency = self.matrix.diagonal()
+
+    def _concept_id(self, name):
+        concept_id = self.concept_ids.get(name)
+        if concept_id is None:
+            concept_id = self.concept_ids[name] = len(self.concept_names)
+            self.concept_names.append(name)
+            self.ids_by_lower_name.setdefault(name.lower(), concept_id)
+            self.concept_resources[concept_id] = set()
+        return concept_id
+
+    def _add(self, resource_id, concept_names):
+        # A KG write replaces the resource's TEACHES edges, so its pairs change from
+        # old x old to new x new: add the pairs involving added concepts and
+        # subtract those involving removed ones (kept x kept is unchanged).
+        old = self.resource_concepts.get(resource_id, set())
+        new = {self._concept_id(name) for name in concept_names}
+        kept = old & new
+        rows, columns, values = self._pending
+        for changed, value in ((new - old, 1), (old - new, -1)):
+            for concept_id in changed:
+                if value > 0:
+                    self.concept_resources[concept_id].add(resource_id)
+                else:
+                    self.concept_resources[concept_id].discard(resource_id)
+                for other_id in itertools.chain(changed, kept):
+                    rows.append(concept_id)
+                    columns.append(other_id)
+                    values.append(value)
+                    if other_id in kept:
+                        rows.append(other_id)
+                        columns.append(concept_id)
+                        values.append(value)
+        if new:
+            self.resource_concepts[resource_id] = new
+        else:
+            self.resource_concepts.pop(resource_id, None)
+
+    def _fold_pending(self):
+        import numpy as np
+        from scipy import sparse
+
+        size = len(self.concept_names)
+        rows, columns, values = self._pending
+        delta = sparse.csr_matrix((np.array(values, dtype=np.int32), (rows, columns)), shape=(size, size))
+        if self.matrix is None:
+            self.matrix = delta
+        else:
+            self.matrix.resize((size, size))
+            self.matrix = self.matrix + delta
+        self.matrix.sum_duplicates()
+        self.matrix.eliminate_zeros() # Pairs no resource teaches any more
+        self.document_frequency = self.matrix.diagonal()
+        self._pending = ([], [], [])
+
+    def add_resources(self, resources):
+        """Folds freshly written KG items (dicts with resource_id and concepts) into the index, replacing their concepts."""
+        with self.lock:
+            for resource in resources:
+                self._add(resource["resource_id"], resource["concepts"])
+
+    def find(self, name):
+        """Returns the stored concept name matching name case-insensitively, or None if no resource teaches it."""
+        concept_id = self.ids_by_lower_name.get(name.lower())
+        if concept_id is None or not self.concept_resources[concept_id]:
+            return None
+        return self.concept_names[concept_id]
+
+    def related(self, name, limit, min_count=CONCEPT_RELATED_MIN_COUNT):
+        """Returns [(concept name, shared resources, PMI)] for the concepts seen most with name."""
+        import numpy as np
+
+        with self.lock:
+            if self._pending[0]:
+                self._fold_pending()
+            concept_id = self.concept_ids[name]
+            start, end = self.matrix.indptr[concept_id], self.matrix.indptr[concept_id + 1]
+            columns = self.matrix.indices[start:end]
+            counts = self.matrix.data[start:end]
+            keep = (columns != concept_id) & (counts >= min_count)
+            columns, counts = columns[keep], counts[keep]
+            total = max(len(self.resource_concepts), 1)
+            # float64 first: count x total overflows int32 on large catalogs.
+            pmi = np.log(counts.astype(np.float64) * total /
+                         (float(self.document_frequency[concept_id]) * self.document_frequency[columns].astype(np.float64)))
+            order = np.lexsort((-counts, -pmi))[:limit]
+            return [(self.concept_names[columns[i]], int(counts[i]), float(pmi[i])) for i in order]
+
+    def resource_ids(self, name):
+        with self.lock:
+            return sorted(self.concept_resources[self.concept_ids[name]], reverse=True)
+
+concept_index = None
+concept_index_lock = threading.Lock()
+concept_index_refreshing = threading.Lock()
+
+def _publish_concept_index(index):
+    global concept_index
+    concept_index = index
+    logger.info(f"Concept co-occurrence index rebuilt with {len(index.concept_names)} concepts "
+                f"(graph version {index.graph_version}).")
+
+def get_concept_index():
+    """Returns the index for the current graph snapshot; builds the first one inline and later ones in the background."""
+    global concept_index
+    snapshot = get_graph_snapshot()
+    if concept_index is None:
+        with concept_index_lock:
+            if concept_index is None:
+                concept_index = ConceptCooccurrenceIndex(snapshot)
+    elif concept_index.graph_version != snapshot.version:
+        refresh_in_background('concept index', concept_index_refreshing,
+                              lambda: ConceptCooccurrenceIndex(snapshot), _publish_concept_index)
+    return concept_index
+
+def record_resources_in_concept_index(resources):
+    # Nothing to update before the first query builds the index from the graph.
+    if concept_index is not None:
+        concept_index.add_resources(resources)
+
+
+# --- Recommendations ---
+# GET /users/<id>/recommendations serves a precomputed top-K list from the
+# user_recommendations table, so a feed costs one row read plus K resource rows.
+# `flask precompute-recommendations` rebuilds every user's list nightly. A list
+# whose profile_key no longer matches the user (preferences or knowledge changed)
+# is re-ranked online for that user alone and written back.
+#
+# Scores are the learning-path resource score (_resource_score) computed for all
+# candidate resources at once with NumPy, plus graph proximity: a bonus for
+# resources that teach concepts next to what the user knows (co-taught with or
+# unlocked by a known concept), and a penalty for resources teaching only known ones.
+RECOMMENDATION_TOP_K = int(os.getenv('RECOMMENDATION_TOP_K', 100))
+RECOMMENDATION_PROXIMITY_WEIGHT = 3.0
+RECOMMENDATION_KNOWN_PENALTY = 1.0
+RECOMMENDATION_CANDIDATES_TTL = LEARNING_PATH_SNAPSHOT_TTL
+
+class RecommendationCandidates:
+    """Column arrays for every resource plus its sparse resource-by-concept matrix."""
+    def __init__(self, rows, snapshot):
+        import numpy as np
+        from scipy import sparse
+
+        self.built_at = datetime.utcnow()
+        self.graph_version = snapshot.version if snapshot else None
+        self.resource_ids = np.array([row.id for row in rows], dtype=np.int64)
+        self.type_names = sorted({row.resource_type for row in rows if row.resource_type})
+        type_codes = {name: code for code, name in enumerate(self.type_names)}
+        self.types = np.array([type_codes.get(row.resource_type, -1) for row in rows], dtype=np.int32)
+        self.difficulty = np.array([DIFFICULTY_LEVELS.index(row.difficulty) if row.difficulty in DIFFICULTY_LEVELS else -1
+                                    for row in rows], dtype=np.int32)
+        self.minutes = np.array([row.estimated_time_minutes or 0 for row in rows], dtype=np.float32)
+
+        concept_names = sorted(snapshot.concept_resources) if snapshot else []
+        self.concept_ids = {name: column for column, name in enumerate(concept_names)}
+        row_of = {resource_id: position for position, resource_id in enumerate(self.resource_ids.tolist())}
+        entries = [(row_of[resource_id], self.concept_ids[name])
+                   for name, resource_ids in (snapshot.concept_resources.items() if snapshot else ())
+                   for resource_id in resource_ids if resource_id in row_of]
+        shape = (len(rows), len(concept_names))
+        self.teaches = sparse.csr_matrix((np.ones(len(entries), dtype=np.float32),
+                                          ([r for r, _ in entries], [c for _, c in entries])), shape=shape)
+        self.concept_counts = np.asarray(self.teaches.sum(axis=1)).ravel()
+        prerequisite_entries = [(self.concept_ids[prerequisite], self.concept_ids[name])
+                                for name, prerequisites in (snapshot.prerequisites.items() if snapshot else ())
+                                for prerequisite in prerequisites
+                                if name in self.concept_ids and prerequisite in self.concept_ids]
+        self.unlocks = sparse.csr_matrix((np.ones(len(prerequisite_entries), dtype=np.float32),
+                                          ([p for p, _ in prerequisite_entries], [c for _, c in prerequisite_entries])),
+                                         shape=(len(concept_names), len(concept_names)))
+
+    def score(self, profiles):
+        """
+        Scores every candidate for each profile (preferred types, difficulty rank,
+        minutes per day, known concept names) and returns a users x resources array.
+        """
+        import numpy as np
+        from scipy import sparse
+
+        users, resources = len(profiles), len(self.resource_ids)
+        preferred = np.zeros((users, len(self.type_names) + 1), dtype=np.float32) # last column: unknown type
+        for user_index, profile in enumerate(profiles):
+            for type_name in profile[0]:
+                if type_name in self.type_names:
+                    preferred[user_index, self.type_names.index(type_name)] = 1.0
+        scores = 2.0 * preferred[:, self.types]
+
+        difficulty_rank = np.array([profile[1] for profile in profiles], dtype=np.int32)[:, None]
+        known_difficulty = self.difficulty[None, :] >= 0
+        scores += np.where(known_difficulty & (self.difficulty[None, :] == difficulty_rank), 2.0,
+                           np.where(known_difficulty & (self.difficulty[None, :] < difficulty_rank), 1.0,
+                                    np.where(known_difficulty, -1.0, 0.0)))
+
+        minutes_per_day = np.array([max(profile[2], 1) for profile in profiles], dtype=np.float32)[:, None]
+        has_time = self.minutes[None, :] > 0
+        scores += np.where(has_time & (self.minutes[None, :] <= minutes_per_day), 1.0,
+                           np.where(has_time, -np.minimum(self.minutes[None, :] / minutes_per_day, 3.0), 0.0))
+
+        known_entries = [(user_index, self.concept_ids[name]) for user_index, profile in enumerate(profiles)
+                         for name in profile[3] if name in self.concept_ids]
+        if known_entries and self.teaches.shape[1]:
+            known = sparse.csr_matrix((np.ones(len(known_entries), dtype=np.float32),
+                                       ([u for u, _ in known_entries], [c for _, c in known_entries])),
+                                      shape=(users, self.teaches.shape[1]))
+            # Concepts co-taught with a known concept or unlocked by one, minus the known ones.
+            co_taught = (known @ self.teaches.T) @ self.teaches
+            nearby = ((co_taught + known @ self.unlocks) > 0).astype(np.float32) - known
+            nearby.data = np.maximum(nearby.data, 0)
+            denominator = np.maximum(self.concept_counts, 1.0)[None, :]
+            scores += RECOMMENDATION_PROXIMITY_WEIGHT * (nearby @ self.teaches.T).toarray() / denominator
+            known_share = (known @ self.teaches.T).toarray() / denominator
+            scores -= RECOMMENDATION_KNOWN_PENALTY * (known_share >= 1.0)
+        return scores
+
+    def top_k(self, profiles, k=RECOMMENDATION_TOP_K):
+        """Returns [(resource ids, scores)] best first for each profile."""
+        import numpy as np
+
+        if not len(self.resource_ids):
+            return [([], []) for _ in profiles]
+        scores = self.score(profiles)
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for user_index in range(len(profiles)):
+            order = top[user_index][np.lexsort((self.resource_ids[top[user_index]], -scores[user_index, top[user_index]]))]
+            results.append((self.resource_ids[order].tolist(), [round(float(value), 4) for value in scores[user_index, order]]))
+        return results
+
+recommendation_candidates = None
+recommendation_candidates_lock = threading.Lock()
+recommendation_candidates_refreshing = threading.Lock()
+
+def build_recommendation_candidates(snapshot):
+    rows = db.session.query(Resource.id, Resource.resource_type, Resource.difficulty,
+                            Resource.estimated_time_minutes).order_by(Resource.id).all()
+    return RecommendationCandidates(rows, snapshot)
+
+def _publish_recommendation_candidates(candidates):
+    global recommendation_candidates
+    recommendation_candidates = candidates
+    logger.info(f"Recommendation candidates rebuilt with {len(candidates.resource_ids)} resources.")
+
+def get_recommendation_candidates():
+    """
+    Returns candidates for the current graph snapshot. The first set is built
+    inline; later ones are rebuilt in the background when the snapshot changes or
+    RECOMMENDATION_CANDIDATES_TTL passes, while requests keep using the old set.
+    """
+    global recommendation_candidates
+    snapshot = None
+    if get_neo4j_driver():
+        try:
+            snapshot = get_graph_snapshot()
+        except Exception as e:
+            logger.warning(f"Recommendations without graph proximity: {e}")
+    if recommendation_candidates is None:
+        with recommendation_candidates_lock:
+            if recommendation_candidates is None:
+                recommendation_candidates = build_recommendation_candidates(snapshot)
+        return recommendation_candidates
+
+    current = recommendation_candidates
+    if snapshot is None and current.graph_version is not None:
+        # Neo4j is down: keep the set that has graph proximity rather than rebuild one without.
+        return current
+    stale = (datetime.utcnow() - current.built_at > RECOMMENDATION_CANDIDATES_TTL
+             or current.graph_version != (snapshot.version if snapshot else None))
+    if stale:
+        refresh_in_background('recommendation candidates', recommendation_candidates_refreshing,
+                              lambda: build_recommendation_candidates(snapshot), _publish_recommendation_candidates)
+    return current
+
+def recommendation_profile(user, known_concepts):
+    difficulty_rank = DIFFICULTY_LEVELS.index(user.difficulty_preference) if user.difficulty_preference in DIFFICULTY_LEVELS else 0
+    preferred_types = tuple(sorted(json.loads(user.preferred_content_types or '[]')))
+    return preferred_types, difficulty_rank, parse_time_availability(user.time_availability), known_concepts
+
+def recommendation_profile_key(user, knowledge_version):
+    """Changes whenever anything the ranking depends on for this user changes."""
+    raw = json.dumps([sorted(json.loads(user.preferred_content_types or '[]')), user.time_availability,
+                      user.difficulty_preference, knowledge_version])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def compute_recommendations(users, candidates):
+    """Returns UserRecommendations rows (not added to the session) for user rows with preference columns."""
+    knowledge = get_users_knowledge([user.id for user in users])
+    profiles = [recommendation_profile(user, knowledge[user.id][1]) for user in users]
+    now = datetime.utcnow()
+    return [UserRecommendations(user_id=user.id, resource_ids=json.dumps(resource_ids), scores=json.dumps(scores),
+                                profile_key=recommendation_profile_key(user, knowledge[user.id][0]), computed_at=now)
+            for user, (resource_ids, scores) in zip(users, candidates.top_k(profiles))]
+
+@app.cli.command('precompute-recommendations')
+@click.option('--chunk-size', default=64, show_default=True, help='Users scored together in one matrix.')
+def precompute_recommendations(chunk_size):
+    """Recomputes the top-K recommendation list of every user."""
+    started = time.perf_counter()
+    candidates = get_recommendation_candidates()
+    columns = (User.id, User.preferred_content_types, User.time_availability, User.difficulty_preference)
+    after_id, processed = 0, 0
+    while True:
+        users = db.session.query(*columns).filter(User.id > after_id).order_by(User.id).limit(chunk_size).all()
+        if not users:
+            break
+        after_id = users[-1].id
+        rows = compute_recommendations(users, candidates)
+        UserRecommendations.query.filter(UserRecommendations.user_id.in_([user.id for user in users])) \
+            .delete(synchronize_session=False)
+        db.session.add_all(rows)
+        db.session.commit()
+        processed += len(users)
+    click.echo(f"Recommendations computed for {processed} users over {len(candidates.resource_ids)} resources "
+               f"in {time.perf_counter() - started:.1f}s.")
+
+
+# --- Database Maintenance ---
+def insert_ignoring_conflicts(table, rows, index_elements, returning=None):
+    """Multi-row INSERT ... ON CONFLICT DO NOTHING for Postgres and SQLite. Does not commit."""
+    dialect_insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    stmt = dialect_insert(table).values(rows).on_conflict_do_nothing(index_elements=index_elements)
+    if returning:
+        stmt = stmt.returning(*returning)
+    return db.session.execute(stmt)
+
+@app.cli.command('create-indexes')
+def create_indexes():
+    """Creates any model indexes missing from existing tables (db.create_all only indexes new tables)."""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+            click.echo(f"Index {index.name} on {table.name} present.")
+
+@app.cli.command('add-columns')
+def add_columns():
+    """Adds model columns missing from existing tables (db.create_all only creates new tables)."""
+    inspector = db.inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = (f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} "
+                       f"{column.type.compile(dialect=db.engine.dialect)}")
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                connection.execute(db.text(ddl))
+                click.echo(f"Column {column.name} added to {table.name}.")
+
+
 # --- Flask Routes (API Endpoints) ---
 
 @app.route('/')
 def hello_world():
     return jsonify(message="Welcome to GyanPath.ai Backend!")
 
+@app.route('/ready')
+def readiness():
+    # In eager mode the probe also retries a failed load (at most once per
+    # SUBSYSTEM_RETRY_INTERVAL); in lazy mode subsystems only have to not be failing.
+    lazy_subsystems = (nlp_subsystem, neo4j_subsystem)
+    if EAGER_INIT != 'false':
+        for subsystem in lazy_subsystems:
+            subsystem.get()
+        ready = all(subsystem.status == 'loaded' for subsystem in lazy_subsystems)
+    else:
+        ready = not any(subsystem.recently_failed for subsystem in lazy_subsystems)
+
+    subsystems = {subsystem.name: {"status": subsystem.status, "error": subsystem.error} for subsystem in lazy_subsystems}
+    try:
+        db.session.execute(db.text('SELECT 1'))
+        subsystems['database'] = {"status": "loaded", "error": None}
+    except Exception as e:
+        db.session.rollback()
+        subsystems['database'] = {"status": "failed", "error": str(e)}
+        ready = False
+
+    return jsonify(ready=ready, subsystems=subsystems, startup_timings=startup_timings), 200 if ready else 503
+
 @app.route('/test-ai')
 def test_ai():
     return jsonify(message="AI functionality placeholder - ready to integrate!")
@@ -197,11 +2587,9 @@ def create_user():
 
     email = data['email'].lower()
 
-    if email not in verified_emails_for_registration:
+    if not verification_store.consume(email):
         return jsonify({"error": "Email not verified or verification expired. Please verify OTP first."}), 403
 
-    verified_emails_for_registration.remove(email)
-
     if User.query.filter_by(email=email).first():
         return jsonify({"error": "Email is already registered. Please login or reset password."}), 409
 
@@ -210,7 +2598,11 @@ def create_user():
         last_name=data['last_name'],
         email=email
     )
-    new_user.set_password(data['password'])
+    try:
+        new_user.set_password(data['password'])
+    except PasswordHashingBusy:
+        verification_store.add(email) # Hand the verification back so the client can retry
+        return jsonify({"error": "Server is busy, please try again shortly."}), 503
     
     new_user.preferred_content_types = json.dumps(["article", "video"])
     new_user.time_availability = '1_hour_day'
@@ -239,19 +2631,105 @@ def login_user():
 
     user = User.query.filter_by(email=email).first()
 
-    if user is None or not user.check_password(password):
-        return jsonify({"error": "Invalid email or password"}), 401
+    try:
+        if user is None or not user.check_password(password):
+            return jsonify({"error": "Invalid email or password"}), 401
+
+        if password_needs_rehash(user.password_hash):
+            user.set_password(password)
+            db.session.commit()
+            logger.info(f"Upgraded password hash for user {user.id} to {PASSWORD_HASH_METHOD}.")
+    except PasswordHashingBusy:
+        db.session.rollback()
+        return jsonify({"error": "Server is busy, please try again shortly."}), 503
     
     access_token = create_access_token(identity=str(user.id))
     return jsonify(access_token=access_token, user_id=user.id, email=user.email, 
                    first_name=user.first_name, last_name=user.last_name), 200
 
 
+USER_PAGE_DEFAULT_LIMIT = 100
+USER_PAGE_MAX_LIMIT = 1000
+USER_STREAM_FETCH_SIZE = 1000
+USER_LIST_COLUMNS = (User.id, User.email, User.first_name, User.last_name)
+
+def user_to_dict(row):
+    return {"id": row.id, "email": row.email, "first_name": row.first_name, "last_name": row.last_name}
+
 @app.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    users_list = [{"id": user.id, "email": user.email, "first_name": user.first_name, "last_name": user.last_name} for user in users]
-    return jsonify(users_list)
+    """
+    Returns users ordered by id, as a JSON array of id, email, first_name and last_name.
+    By default one page is returned and the next page's cursor is sent in the
+    X-Next-Cursor header. With ?stream=true every user is written out incrementally
+    from a server-side cursor, so an export never holds the whole table in memory.
+    """
+    query = db.session.query(*USER_LIST_COLUMNS).order_by(User.id)
+
+    if request.args.get('stream', 'false').lower() in ['true', '1', 't']:
+        def generate():
+            yield '['
+            separator = ''
+            for row in query.yield_per(USER_STREAM_FETCH_SIZE):
+                yield separator + json.dumps(user_to_dict(row))
+                separator = ','
+            yield ']'
+        return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+    limit = max(1, min(request.args.get('limit', USER_PAGE_DEFAULT_LIMIT, type=int), USER_PAGE_MAX_LIMIT))
+    cursor = request.args.get('cursor')
+    if cursor:
+        after_id = decode_id_cursor(cursor)
+        if after_id is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.filter(User.id > after_id)
+    rows = query.limit(limit + 1).all()
+
+    response = jsonify([user_to_dict(row) for row in rows[:limit]])
+    if len(rows) > limit:
+        response.headers['X-Next-Cursor'] = encode_cursor(rows[limit - 1].id)
+        response.headers['Access-Control-Expose-Headers'] = 'X-Next-Cursor'
+    return response
+
+# Profiles are served from a per-process LRU keyed by user id. The ETag is the
+# user's profile_version, which update_user_profile and change_user_password bump
+# in the same UPDATE as the change. Within PROFILE_CACHE_TTL an entry is served as
+# is; after that (and for conditional GETs that miss the cache) only the
+# profile_version column is read, and the full row is loaded only when it moved.
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 10000))
+PROFILE_CACHE_TTL = timedelta(seconds=int(os.getenv('PROFILE_CACHE_TTL_SECONDS', 30)))
+profile_cache = OrderedDict() # user id -> (profile_version, profile dict, cached_at)
+profile_cache_lock = threading.Lock()
+profile_cache_stats = Counter() # hits, revalidations, misses, evictions, invalidations
+
+def get_cached_profile(user_id):
+    """Returns (entry, fresh); a stale entry is returned so its version can be revalidated."""
+    with profile_cache_lock:
+        entry = profile_cache.get(user_id)
+        if entry:
+            profile_cache.move_to_end(user_id)
+        fresh = bool(entry) and datetime.utcnow() - entry[2] < PROFILE_CACHE_TTL
+        if fresh:
+            profile_cache_stats['hits'] += 1
+        return entry, fresh
+
+def cache_profile(user_id, version, profile):
+    entry = (version, profile, datetime.utcnow())
+    with profile_cache_lock:
+        profile_cache[user_id] = entry
+        profile_cache.move_to_end(user_id)
+        while len(profile_cache) > PROFILE_CACHE_SIZE:
+            profile_cache.popitem(last=False)
+            profile_cache_stats['evictions'] += 1
+    return entry
+
+def invalidate_profile(user_id):
+    with profile_cache_lock:
+        if profile_cache.pop(user_id, None):
+            profile_cache_stats['invalidations'] += 1
+
+def profile_etag(version):
+    return f"v{version}"
 
 @app.route('/users/<int:user_id>/profile', methods=['GET'])
 @jwt_required()
@@ -260,19 +2738,50 @@ def get_user_profile(user_id):
     if int(current_user_id) != user_id:
         return jsonify({"error": "Unauthorized: Cannot view another user's profile"}), 403
 
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({"error": "User not found"}), 404
-    
-    return jsonify({
-        "id": user.id,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "email": user.email,
-        "preferred_content_types": json.loads(user.preferred_content_types),
-        "time_availability": user.time_availability,
-        "difficulty_preference": user.difficulty_preference
-    }), 200
+    entry, fresh = get_cached_profile(user_id)
+    if not fresh and (entry or request.if_none_match):
+        version = db.session.query(User.profile_version).filter_by(id=user_id).scalar()
+        if version is None:
+            invalidate_profile(user_id)
+            return jsonify({"error": "User not found"}), 404
+        if entry and entry[0] == version:
+            entry = cache_profile(user_id, version, entry[1])
+            profile_cache_stats['revalidations'] += 1
+        elif request.if_none_match.contains(profile_etag(version)):
+            profile_cache_stats['revalidations'] += 1
+            return _profile_response(version, None)
+        else:
+            entry = None
+
+    if entry is None:
+        profile_cache_stats['misses'] += 1
+        user = User.query.get(user_id)
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        entry = cache_profile(user_id, user.profile_version, {
+            "id": user.id,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "email": user.email,
+            "preferred_content_types": json.loads(user.preferred_content_types),
+            "time_availability": user.time_availability,
+            "difficulty_preference": user.difficulty_preference
+        })
+
+    version, profile, _ = entry
+    return _profile_response(version, profile)
+
+def _profile_response(version, profile):
+    etag = profile_etag(version)
+    if profile is None or request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(profile)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['Access-Control-Expose-Headers'] = 'ETag'
+    return response
 
 @app.route('/users/<int:user_id>/profile', methods=['PUT'])
 @jwt_required()
@@ -301,9 +2810,11 @@ def update_user_profile(user_id):
         user.time_availability = data['time_availability']
     if 'difficulty_preference' in data:
         user.difficulty_preference = data['difficulty_preference']
+    user.profile_version = User.profile_version + 1
 
     try:
         db.session.commit()
+        invalidate_profile(user_id)
         return jsonify({"message": "Profile updated successfully!"}), 200
     except Exception as e:
         db.session.rollback()
@@ -328,12 +2839,17 @@ def change_user_password(user_id):
     if not old_password or not new_password:
         return jsonify({"error": "Old password and new password are required"}), 400
     
-    if not user.check_password(old_password):
-        return jsonify({"error": "Incorrect old password"}), 401
-    
-    user.set_password(new_password)
+    try:
+        if not user.check_password(old_password):
+            return jsonify({"error": "Incorrect old password"}), 401
+
+        user.set_password(new_password)
+    except PasswordHashingBusy:
+        return jsonify({"error": "Server is busy, please try again shortly."}), 503
+    user.profile_version = User.profile_version + 1
     try:
         db.session.commit()
+        invalidate_profile(user_id)
         return jsonify({"message": "Password changed successfully!"}), 200
     except Exception as e:
         db.session.rollback()
@@ -352,6 +2868,8 @@ def request_otp():
     if User.query.filter_by(email=email).first():
         return jsonify({"error": "Email is already registered. Please login or reset password."}), 409
 
+    start_otp_sweeper()
+
     otp_code = ''.join(random.choices(string.digits, k=6))
     expires_at = datetime.utcnow() + timedelta(minutes=5)
     
@@ -363,14 +2881,14 @@ def request_otp():
         new_otp = OTP(email=email, code=otp_code, expires_at=expires_at)
         db.session.add(new_otp)
     
+    queue_mail(email, "Your GyanPath.ai OTP",
+               f"Your One-Time Password (OTP) for GyanPath.ai registration is: {otp_code}\n\nThis OTP is valid for 5 minutes.")
+
     try:
         db.session.commit()
+        wake_mail_sender()
         
-        msg = Message("Your GyanPath.ai OTP", recipients=[email])
-        msg.body = f"Your One-Time Password (OTP) for GyanPath.ai registration is: {otp_code}\n\nThis OTP is valid for 5 minutes."
-        mail.send(msg)
-        
-        logger.info(f"OTP sent to {email}: {otp_code}")
+        logger.info(f"OTP queued for {email}: {otp_code}")
         return jsonify({"message": "OTP sent to your email. Please check your inbox (and spam folder)."}), 200
     except Exception as e:
         db.session.rollback()
@@ -400,7 +2918,7 @@ def verify_otp():
     db.session.delete(otp_record)
     db.session.commit()
     
-    verified_emails_for_registration.add(email)
+    verification_store.add(email)
     
     return jsonify({"message": "OTP verified successfully! You can now proceed to register."}), 200
 
@@ -423,26 +2941,7 @@ def add_resource():
     if existing_resource:
         return jsonify({"message": "Resource with this URL already exists, skipping addition."}), 200
 
-    # The issue here is 'url_to_fetch' is not defined. It comes from /fetch_and_add_resource
-    # This block should be within a separate function or endpoint if it's meant to fetch
-    # Since this is a direct POST to /resources, it expects data directly.
-    # So, the 'if not (url_to_fetch.startswith' block should be removed for add_resource
-    # Or, the endpoint should be changed to parse all fields and then make a request if it's external.
-    
-    # Original logic in app.py for add_resource (before fetch_and_add_resource was introduced)
-    # new_resource = Resource(
-    #     title=data['title'],
-    #     url=data['url'],
-    #     description=data.get('description'),
-    #     resource_type=data.get('resource_type', 'article'), # Default to article if not provided
-    #     source=data.get('source'),
-    #     difficulty=data.get('difficulty'),
-    #     estimated_time_minutes=data.get('estimated_time_minutes'),
-    #     contributed_by_user_id=contributed_by_user_id
-    # )
-
-    try:
-        # Original logic should be uncommented/restored here
+    try:
         new_resource = Resource(
             title=data['title'],
             url=data['url'],
@@ -453,35 +2952,917 @@ def add_resource():
             estimated_time_minutes=data.get('estimated_time_minutes'),
             contributed_by_user_id=contributed_by_user_id
         )
-        
-        db.session.add(new_resource)
-        db.session.commit()
-
-        if nlp and neo4j_driver:
-            process_resource_for_kg(new_resource.id, new_resource.title, new_resource.description, new_resource.url)
-        else:
-            logger.warning(f"Skipping KG processing for resource {new_resource.id} due to missing NLP or Neo4j connection.")
+        kg_status = save_resource_and_queue_kg(new_resource)
 
         return jsonify({
             "message": "Resource added successfully!",
             "resource_id": new_resource.id,
             "title": new_resource.title,
-            "url": new_resource.url
+            "url": new_resource.url,
+            "kg_status": kg_status
         }), 201
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error adding resource: {e}")
         return jsonify({"error": "Failed to add resource", "details": str(e)}), 500
 
+# --- Resource Listing (GET /resources) ---
+RESOURCE_PAGE_DEFAULT_LIMIT = 50
+RESOURCE_PAGE_MAX_LIMIT = 200
+RESOURCE_LIST_COLUMNS = (Resource.id, Resource.title, Resource.url, Resource.description, Resource.resource_type,
+                         Resource.source, Resource.difficulty, Resource.estimated_time_minutes, Resource.created_at)
+RESOURCE_LIST_FILTERS = ('resource_type', 'difficulty', 'source')
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Returns the list encoded by encode_cursor, or None if the cursor is malformed."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+
+def decode_id_cursor(cursor):
+    """Returns the id from a cursor made by encode_cursor(id), or None if it is malformed."""
+    decoded = decode_cursor(cursor)
+    if not isinstance(decoded, list) or len(decoded) != 1 or not isinstance(decoded[0], int):
+        return None
+    return decoded[0]
+
+def resource_to_dict(row):
+    return {
+        "id": row.id,
+        "title": row.title,
+        "url": row.url,
+        "description": row.description,
+        "resource_type": row.resource_type,
+        "source": row.source,
+        "difficulty": row.difficulty,
+        "estimated_time_minutes": row.estimated_time_minutes,
+        "created_at": row.created_at.isoformat() if row.created_at else None
+    }
+
+@app.route('/resources', methods=['GET'])
+def list_resources():
+    """
+    Returns one page of resources, newest first, as a JSON array. The cursor for the
+    next page is sent in the X-Next-Cursor header (and a Link: rel="next" header).
+    The ETag changes whenever a matching resource is added or updated, so clients
+    revalidating an unchanged page get 304 Not Modified without the page query.
+    """
+    limit = max(1, min(request.args.get('limit', RESOURCE_PAGE_DEFAULT_LIMIT, type=int), RESOURCE_PAGE_MAX_LIMIT))
+    filters = {name: request.args[name] for name in RESOURCE_LIST_FILTERS if request.args.get(name)}
+
+    cursor = request.args.get('cursor')
+    after_id = None
+    if cursor:
+        after_id = decode_id_cursor(cursor)
+        if after_id is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    latest_update = db.session.query(db.func.max(Resource.updated_at)).filter_by(**filters).scalar()
+    etag = hashlib.sha1(f"{latest_update}|{limit}|{sorted(filters.items())}|{cursor}".encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    query = db.session.query(*RESOURCE_LIST_COLUMNS).filter_by(**filters)
+    if after_id is not None:
+        # The cursor carries only the last id; its created_at is read back in the same
+        # statement so the comparison uses the stored value exactly.
+        after_created_at = db.session.query(Resource.created_at).filter(Resource.id == after_id).scalar_subquery()
+        query = query.filter(db.tuple_(Resource.created_at, Resource.id) < db.tuple_(after_created_at, after_id))
+    rows = query.order_by(Resource.created_at.desc(), Resource.id.desc()).limit(limit + 1).all()
+
+    response = jsonify([resource_to_dict(row) for row in rows[:limit]])
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.id)
+        response.headers['X-Next-Cursor'] = next_cursor
+        next_args = {**request.args.to_dict(), "cursor": next_cursor}
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(next_args)}>; rel="next"'
+    response.headers['Access-Control-Expose-Headers'] = 'ETag, X-Next-Cursor, Link'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag)
+    return response
+
+
+# --- Full-Text Search over Resources ---
+# On Postgres, GET /resources/search ranks matches of the ix_resource_search GIN
+# expression index with ts_rank_cd. Other databases (SQLite in development and the
+# benchmarks) use an in-process inverted index with BM25 scoring. It is built on
+# the first search and then catches up incrementally from Resource.updated_at, so
+# rows added by any route or worker are picked up without a rebuild.
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 50
+SEARCH_MAX_OFFSET = 1000
+SEARCH_STOPWORDS = frozenset(['a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it',
+                              'of', 'on', 'or', 'that', 'the', 'this', 'to', 'with'])
+SEARCH_TITLE_WEIGHT = 2.0
+SEARCH_REFRESH_SLACK = timedelta(seconds=1)
+
+def search_tokens(text):
+    return [token for token in re.findall(r'\w+', (text or '').lower()) if token not in SEARCH_STOPWORDS]
+
+class InvertedIndex:
+    def __init__(self):
+        self.postings = {} # token -> {resource id: weighted term frequency}
+        self.doc_tokens = {} # resource id -> tokens, for removal when a row changes
+        self.doc_lengths = {}
+        self.doc_filters = {} # resource id -> {"resource_type": ..., "difficulty": ...}
+        self.total_length = 0.0
+        self.watermark = None
+        self.lock = threading.Lock()
+
+    def _remove(self, resource_id):
+        for token in self.doc_tokens.pop(resource_id, ()):
+            postings = self.postings.get(token)
+            if postings:
+                postings.pop(resource_id, None)
+                if not postings:
+                    del self.postings[token]
+        self.total_length -= self.doc_lengths.pop(resource_id, 0.0)
+        self.doc_filters.pop(resource_id, None)
+
+    def _add(self, row):
+        self._remove(row.id)
+        weights = Counter()
+        for token in search_tokens(row.title):
+            weights[token] += SEARCH_TITLE_WEIGHT
+        for token in search_tokens(row.description):
+            weights[token] += 1.0
+        for token, weight in weights.items():
+            self.postings.setdefault(token, {})[row.id] = weight
+        self.doc_tokens[row.id] = tuple(weights)
+        self.doc_lengths[row.id] = sum(weights.values())
+        self.total_length += self.doc_lengths[row.id]
+        self.doc_filters[row.id] = {"resource_type": row.resource_type, "difficulty": row.difficulty}
+
+    def refresh(self):
+        """Indexes rows changed since the last refresh (all rows the first time)."""
+        with self.lock:
+            query = db.session.query(Resource.id, Resource.title, Resource.description, Resource.resource_type,
+                                     Resource.difficulty, Resource.updated_at)
+            if self.watermark is not None:
+                # updated_at may have one-second resolution (SQLite CURRENT_TIMESTAMP), so look
+                # back a little; re-adding an unchanged row is idempotent.
+                query = query.filter(Resource.updated_at >= self.watermark - SEARCH_REFRESH_SLACK)
+            for row in query.order_by(Resource.updated_at).yield_per(1000):
+                self._add(row)
+                if row.updated_at and (self.watermark is None or row.updated_at > self.watermark):
+                    self.watermark = row.updated_at
+
+    def search(self, text, filters, limit, offset):
+        """Returns [(resource id, score)] for one page, best first (BM25 over the query tokens)."""
+        with self.lock:
+            doc_count = len(self.doc_lengths)
+            if not doc_count:
+                return []
+            average_length = self.total_length / doc_count or 1.0
+            scores = Counter()
+            for token in set(search_tokens(text)):
+                postings = self.postings.get(token, {})
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for resource_id, weight in postings.items():
+                    length_norm = 1.2 * (0.25 + 0.75 * self.doc_lengths[resource_id] / average_length)
+                    scores[resource_id] += idf * weight * 2.2 / (weight + length_norm)
+            if filters:
+                scores = {resource_id: score for resource_id, score in scores.items()
+                          if all(self.doc_filters[resource_id].get(name) == value for name, value in filters.items())}
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            return ranked[offset:offset + limit]
+
+resource_search_index = InvertedIndex()
+
+def search_resources(text, filters, limit, offset):
+    """Returns [(row, score)] for one page of resources matching text, best first."""
+    if db.engine.dialect.name == 'postgresql':
+        vector = db.literal_column(f"({RESOURCE_SEARCH_VECTOR_SQL})")
+        ts_query = db.func.websearch_to_tsquery(db.literal_column("'english'"), text)
+        rank = db.func.ts_rank_cd(vector, ts_query).label('score')
+        rows = (db.session.query(*RESOURCE_LIST_COLUMNS, rank)
+                .filter(vector.op('@@')(ts_query))
+                .filter_by(**filters)
+                .order_by(rank.desc(), Resource.id)
+                .offset(offset).limit(limit).all())
+        return [(row, row.score) for row in rows]
+
+    resource_search_index.refresh()
+    ranked = resource_search_index.search(text, filters, limit, offset)
+    rows = {row.id: row for row in db.session.query(*RESOURCE_LIST_COLUMNS).filter(Resource.id.in_([rid for rid, _ in ranked]))}
+    return [(rows[resource_id], score) for resource_id, score in ranked if resource_id in rows]
+
+@app.route('/resources/search', methods=['GET'])
+def search_resources_route():
+    """
+    Ranked full-text search over resource titles and descriptions, filterable by
+    resource_type and difficulty. Returns a JSON array; the next page's cursor is
+    sent in the X-Next-Cursor header.
+    """
+    text = (request.args.get('q') or '').strip()
+    if not text:
+        return jsonify({"error": "Query parameter q is required"}), 400
+    limit = max(1, min(request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int), SEARCH_MAX_LIMIT))
+    filters = {name: request.args[name] for name in ('resource_type', 'difficulty') if request.args.get(name)}
+
+    offset = 0
+    cursor = request.args.get('cursor')
+    if cursor:
+        offset = decode_id_cursor(cursor)
+        if offset is None or offset < 0 or offset > SEARCH_MAX_OFFSET:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    matches = search_resources(text, filters, limit + 1, offset)
+    response = jsonify([{**resource_to_dict(row), "score": round(float(score), 4)} for row, score in matches[:limit]])
+    if len(matches) > limit and offset + limit <= SEARCH_MAX_OFFSET:
+        response.headers['X-Next-Cursor'] = encode_cursor(offset + limit)
+        response.headers['Access-Control-Expose-Headers'] = 'X-Next-Cursor'
+    return response
+
+
+# --- Similar Resources Index ---
+# GET /resources/<id>/similar scores resources by cosine similarity of TF-IDF
+# vectors over title and description. Terms are hashed into SIMILARITY_FEATURES
+# columns (crc32, so the columns are stable across processes) and rows are
+# L2-normalized, so one sparse matrix-vector product scores every resource.
+# `flask build-similarity-index` writes the CSR arrays as .npy files under
+# SIMILARITY_INDEX_DIR, which every worker memory-maps and so shares through the
+# page cache. Each worker appends resources added after the build to a small
+# in-memory delta, checking for them at most every SIMILARITY_DELTA_INTERVAL; run
+# the build nightly to fold them in and refresh IDF weights. Until a build exists
+# the endpoint answers 503 rather than vectorizing the whole table per worker.
+SIMILARITY_INDEX_DIR = os.getenv('SIMILARITY_INDEX_DIR', 'similarity_index')
+SIMILARITY_FEATURES = 2 ** 18
+SIMILARITY_DEFAULT_LIMIT = 10
+SIMILARITY_MAX_LIMIT = 50
+SIMILARITY_DELTA_INTERVAL = timedelta(seconds=int(os.getenv('SIMILARITY_DELTA_INTERVAL_SECONDS', 30)))
+
+class SimilarityIndexMissing(Exception):
+    pass
+
+def similarity_term_counts(title, description):
+    counts = Counter()
+    for token in search_tokens(title):
+        counts[zlib.crc32(token.encode()) & (SIMILARITY_FEATURES - 1)] += SEARCH_TITLE_WEIGHT
+    for token in search_tokens(description):
+        counts[zlib.crc32(token.encode()) & (SIMILARITY_FEATURES - 1)] += 1.0
+    return counts
+
+def tfidf_row(counts, idf):
+    """Returns (feature ids, L2-normalized weights) for term counts, with idf(feature) -> weight."""
+    import numpy as np
+
+    features = np.array(sorted(counts), dtype=np.int32)
+    weights = np.array([(1.0 + math.log(counts[feature])) * idf(feature) for feature in features.tolist()], dtype=np.float32)
+    norm = np.linalg.norm(weights)
+    return features, (weights / norm if norm else weights)
+
+def write_similarity_index(directory, resource_ids, term_counts):
+    """Builds the TF-IDF matrix for the given resources (ascending ids) and publishes it atomically."""
+    import numpy as np
+
+    document_frequency = np.zeros(SIMILARITY_FEATURES, dtype=np.int32)
+    for counts in term_counts:
+        document_frequency[list(counts)] += 1
+    total = len(term_counts)
+    idf_values = np.log((1.0 + total) / (1.0 + document_frequency)) + 1.0
+
+    indptr = [0]
+    indices, data = [], []
+    for counts in term_counts:
+        features, weights = tfidf_row(counts, idf_values.__getitem__)
+        indices.append(features)
+        data.append(weights)
+        indptr.append(indptr[-1] + len(features))
+
+    version = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+    version_dir = os.path.join(directory, version)
+    os.makedirs(version_dir)
+    np.save(os.path.join(version_dir, 'indptr.npy'), np.array(indptr, dtype=np.int64))
+    np.save(os.path.join(version_dir, 'indices.npy'), np.concatenate(indices) if indices else np.empty(0, np.int32))
+    np.save(os.path.join(version_dir, 'data.npy'), np.concatenate(data) if data else np.empty(0, np.float32))
+    np.save(os.path.join(version_dir, 'resource_ids.npy'), np.array(resource_ids, dtype=np.int64))
+    np.save(os.path.join(version_dir, 'document_frequency.npy'), document_frequency)
+
+    manifest_path = os.path.join(directory, 'manifest.json')
+    with open(f"{manifest_path}.tmp", 'w') as f:
+        json.dump({"version": version, "documents": total,
+                   "max_resource_id": int(resource_ids[-1]) if resource_ids else 0}, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    # Workers still mapping an older version keep their open files until they reload.
+    for name in os.listdir(directory):
+        if name not in (version, 'manifest.json') and os.path.isdir(os.path.join(directory, name)):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return version
+
+class SimilarityIndex:
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.manifest_mtime = None
+        self._reset(None, None, None, None, 0, 0)
+
+    def _reset(self, version, base, base_ids, base_df, base_documents, max_resource_id):
+        self.version = version
+        self.base = base # memory-mapped CSR matrix from the last build
+        self.base_ids = base_ids
+        self.base_df = base_df
+        self.base_documents = base_documents
+        self.max_resource_id = max_resource_id
+        self.delta_ids = [] # resources added since the build, appended in id order
+        self.delta_rows = []
+        self.delta_df = Counter()
+        self.delta = None
+        self.delta_checked_at = None
+
+    def _load_if_changed(self):
+        import numpy as np
+        from scipy import sparse
+
+        manifest_path = os.path.join(self.directory, 'manifest.json')
+        try:
+            mtime = os.stat(manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self.manifest_mtime:
+            return
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        self.manifest_mtime = mtime
+        if manifest["version"] == self.version:
+            return
+        version_dir = os.path.join(self.directory, manifest["version"])
+        load = lambda name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode='r')
+        base_ids = load('resource_ids')
+        base = sparse.csr_matrix((load('data'), load('indices'), load('indptr')),
+                                 shape=(len(base_ids), SIMILARITY_FEATURES), copy=False)
+        self._reset(manifest["version"], base, base_ids, load('document_frequency'), manifest["documents"],
+                    manifest["max_resource_id"])
+        logger.info(f"Similarity index {self.version} loaded with {len(base_ids)} resources.")
+
+    def _idf(self, feature):
+        documents = self.base_documents + len(self.delta_ids)
+        frequency = (int(self.base_df[feature]) if self.base_df is not None else 0) + self.delta_df[feature]
+        return math.log((1.0 + documents) / (1.0 + frequency)) + 1.0
+
+    def _append_new_resources(self):
+        now = datetime.utcnow()
+        if self.delta_checked_at and now - self.delta_checked_at < SIMILARITY_DELTA_INTERVAL:
+            return
+        self.delta_checked_at = now
+        while True:
+            rows = (db.session.query(Resource.id, Resource.title, Resource.description)
+                    .filter(Resource.id > self.max_resource_id)
+                    .order_by(Resource.id).limit(1000).all())
+            if not rows:
+                return
+            for row in rows:
+                counts = similarity_term_counts(row.title, row.description)
+                self.delta_df.update(counts.keys())
+                self.delta_ids.append(row.id)
+                self.delta_rows.append(tfidf_row(counts, self._idf))
+            self.max_resource_id = rows[-1].id
+            self.delta = None
+
+    def _delta_matrix(self):
+        import numpy as np
+        from scipy import sparse
+
+        if self.delta is None:
+            indptr = np.zeros(len(self.delta_rows) + 1, dtype=np.int64)
+            indptr[1:] = np.cumsum([len(features) for features, _ in self.delta_rows])
+            indices = np.concatenate([features for features, _ in self.delta_rows]) if self.delta_rows else np.empty(0, np.int32)
+            data = np.concatenate([weights for _, weights in self.delta_rows]) if self.delta_rows else np.empty(0, np.float32)
+            self.delta = sparse.csr_matrix((data, indices, indptr), shape=(len(self.delta_rows), SIMILARITY_FEATURES))
+        return self.delta
+
+    def similar(self, resource_id, limit):
+        """
+        Returns [(resource id, cosine similarity)] best first, or None if the resource
+        is not indexed. Raises SimilarityIndexMissing before the first build.
+        """
+        import numpy as np
+
+        with self.lock:
+            self._load_if_changed()
+            if self.version is None:
+                raise SimilarityIndexMissing(f"No similarity index in {self.directory}; run `flask build-similarity-index`.")
+            self._append_new_resources()
+            delta = self._delta_matrix()
+            matrices = [matrix for matrix in (self.base, delta) if matrix is not None and matrix.shape[0]]
+            ids = np.concatenate([self.base_ids if self.base is not None else np.empty(0, np.int64),
+                                  np.array(self.delta_ids, dtype=np.int64)])
+
+            position = int(np.searchsorted(ids, resource_id))
+            if position >= len(ids) or ids[position] != resource_id:
+                return None
+            base_rows = self.base.shape[0] if self.base is not None else 0
+            query = self.base[position] if position < base_rows else delta[position - base_rows]
+
+            scores = np.concatenate([matrix.dot(query.T).toarray().ravel() for matrix in matrices])
+            scores[position] = 0.0
+            count = min(limit, int(np.count_nonzero(scores > 0)))
+            if not count:
+                return []
+            top = np.argpartition(-scores, count - 1)[:count]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [(int(ids[i]), float(scores[i])) for i in top]
+
+similarity_index = SimilarityIndex(SIMILARITY_INDEX_DIR)
+
+@app.cli.command('build-similarity-index')
+@click.option('--chunk-size', default=1000, show_default=True, help='Resource rows fetched from the database per query.')
+def build_similarity_index(chunk_size):
+    """Rebuilds the similar-resources TF-IDF matrix and publishes it to SIMILARITY_INDEX_DIR."""
+    started = time.perf_counter()
+    resource_ids, term_counts = [], []
+    for rows in iter_resource_chunks(chunk_size=chunk_size):
+        for row in rows:
+            resource_ids.append(row.id)
+            term_counts.append(similarity_term_counts(row.title, row.description))
+    os.makedirs(SIMILARITY_INDEX_DIR, exist_ok=True)
+    version = write_similarity_index(SIMILARITY_INDEX_DIR, resource_ids, term_counts)
+    click.echo(f"Similarity index {version} written with {len(resource_ids)} resources "
+               f"in {time.perf_counter() - started:.1f}s.")
+
+@app.route('/resources/<int:resource_id>/similar', methods=['GET'])
+def get_similar_resources(resource_id):
+    limit = max(1, min(request.args.get('limit', SIMILARITY_DEFAULT_LIMIT, type=int), SIMILARITY_MAX_LIMIT))
+    try:
+        matches = similarity_index.similar(resource_id, limit)
+    except SimilarityIndexMissing as e:
+        logger.error(str(e))
+        return jsonify({"error": "Similar resources are not available yet"}), 503
+    if matches is None:
+        if not db.session.query(Resource.id).filter_by(id=resource_id).first():
+            return jsonify({"error": "Resource not found"}), 404
+        matches = [] # Added after the last delta catch-up
+
+    scores = dict(matches)
+    rows = db.session.query(*RESOURCE_LIST_COLUMNS).filter(Resource.id.in_(list(scores))).all()
+    rows.sort(key=lambda row: -scores[row.id])
+    return jsonify({
+        "resource_id": resource_id,
+        "similar": [{**resource_to_dict(row), "score": round(scores[row.id], 4)} for row in rows]
+    }), 200
+
+
+# --- Bulk Resource Import ---
+# POST /resources/bulk reads NDJSON (default) or CSV (Content-Type: text/csv) from
+# the request stream and handles BULK_IMPORT_CHUNK_SIZE rows at a time: one query
+# for contributor ids, one for already-known URLs, and one multi-row
+# INSERT ... ON CONFLICT (url) DO NOTHING, so the cost per row is a fraction of a
+# round trip rather than three.
+BULK_IMPORT_CHUNK_SIZE = int(os.getenv('BULK_IMPORT_CHUNK_SIZE', 1000))
+BULK_IMPORT_FIELDS = ['title', 'url', 'description', 'resource_type', 'source', 'difficulty', 'estimated_time_minutes', 'contributed_by_user_id']
+
+def iter_bulk_rows(stream, content_type):
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if content_type == 'text/csv':
+        for row in csv.DictReader(text_stream):
+            yield {key: value for key, value in row.items() if value not in (None, '')}
+        return
+    for line in text_stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON: {e}")
+
+def _clean_bulk_row(row):
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError("Row must be an object")
+    if not all(row.get(field) for field in ['title', 'url', 'resource_type']):
+        raise ValueError("Missing required fields: title, url, resource_type")
+
+    cleaned = {field: row.get(field) for field in BULK_IMPORT_FIELDS}
+    for field in ['estimated_time_minutes', 'contributed_by_user_id']:
+        if cleaned[field] is not None:
+            try:
+                cleaned[field] = int(cleaned[field])
+            except (TypeError, ValueError):
+                raise ValueError(f"{field} must be an integer")
+    return cleaned
+
+def _insert_resources_ignoring_duplicates(rows):
+    """Multi-row insert that skips URLs already present. Returns {url: id} for inserted rows."""
+    table = Resource.__table__
+    result = insert_ignoring_conflicts(table, rows, index_elements=['url'], returning=(table.c.id, table.c.url))
+    return {row.url: row.id for row in result}
+
+def import_resource_chunk(chunk, kg_skip_reason=None):
+    """
+    Imports a list of (row_number, raw_row) pairs and returns one result dict per row.
+    New resources are queued for KG ingestion unless kg_skip_reason is given, in which
+    case their jobs are dead-lettered with it, as save_resource_and_queue_kg does.
+    """
+    results = {}
+    candidates = []
+    seen_urls = set()
+    for row_number, raw_row in chunk:
+        try:
+            row = _clean_bulk_row(raw_row)
+        except ValueError as e:
+            results[row_number] = {"row": row_number, "status": "invalid", "error": str(e)}
+            continue
+        if row['url'] in seen_urls:
+            results[row_number] = {"row": row_number, "url": row['url'], "status": "duplicate"}
+            continue
+        seen_urls.add(row['url'])
+        candidates.append((row_number, row))
+
+    contributor_ids = {row['contributed_by_user_id'] for _, row in candidates if row['contributed_by_user_id']}
+    known_user_ids = set()
+    if contributor_ids:
+        known_user_ids = {user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(contributor_ids))}
+
+    existing_urls = set()
+    if seen_urls:
+        existing_urls = {url for (url,) in db.session.query(Resource.url).filter(Resource.url.in_(seen_urls))}
+
+    to_insert = []
+    for row_number, row in candidates:
+        if row['contributed_by_user_id'] and row['contributed_by_user_id'] not in known_user_ids:
+            results[row_number] = {"row": row_number, "url": row['url'], "status": "invalid", "error": "contributed_by_user_id does not exist"}
+        elif row['url'] in existing_urls:
+            results[row_number] = {"row": row_number, "url": row['url'], "status": "duplicate"}
+        else:
+            to_insert.append((row_number, row))
+
+    inserted = _insert_resources_ignoring_duplicates([row for _, row in to_insert]) if to_insert else {}
+    if inserted:
+        db.session.execute(KGIngestJob.__table__.insert(), [{
+            "resource_id": resource_id,
+            "status": "failed" if kg_skip_reason else "pending",
+            "attempts": 0,
+            "last_error": kg_skip_reason
+        } for resource_id in inserted.values()])
+    db.session.commit()
+
+    for row_number, row in to_insert:
+        resource_id = inserted.get(row['url'])
+        if resource_id is None:
+            # Inserted by a concurrent request between the lookup and the insert.
+            results[row_number] = {"row": row_number, "url": row['url'], "status": "duplicate"}
+        else:
+            results[row_number] = {"row": row_number, "url": row['url'], "status": "created", "resource_id": resource_id}
+
+    if not kg_skip_reason and inserted:
+        queue_full_ids = [resource_id for resource_id in inserted.values() if not enqueue_kg_ingest(resource_id)]
+        if queue_full_ids:
+            KGIngestJob.query.filter(KGIngestJob.resource_id.in_(queue_full_ids)) \
+                .update({"status": "failed", "last_error": "KG ingest queue full"}, synchronize_session=False)
+            db.session.commit()
+
+    return [results[row_number] for row_number, _ in chunk]
+
+@app.route('/resources/bulk', methods=['POST'])
+def bulk_add_resources():
+    content_type = (request.mimetype or '').lower()
+    kg_skip_reason = None
+    if request.args.get('kg', 'true').lower() not in ['true', '1', 't']:
+        kg_skip_reason = "KG ingestion skipped at import (kg=false)"
+    elif kg_subsystems_unavailable():
+        kg_skip_reason = "NLP model or Neo4j driver not available"
+
+    summary = {"created": 0, "duplicate": 0, "invalid": 0}
+    row_results = []
+    chunk = []
+    try:
+        for row_number, raw_row in enumerate(iter_bulk_rows(request.stream, content_type), start=1):
+            chunk.append((row_number, raw_row))
+            if len(chunk) >= BULK_IMPORT_CHUNK_SIZE:
+                row_results.extend(import_resource_chunk(chunk, kg_skip_reason))
+                chunk = []
+        if chunk:
+            row_results.extend(import_resource_chunk(chunk, kg_skip_reason))
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error during bulk resource import after {len(row_results)} rows: {e}")
+        return jsonify({"error": "Bulk import failed", "details": str(e), "rows_committed": len(row_results), "rows": row_results}), 500
+
+    for result in row_results:
+        summary[result["status"]] += 1
+    logger.info(f"Bulk import finished: {summary}")
+    return jsonify({"message": "Bulk import finished.", **summary, "rows": row_results}), 200
+
+@app.route('/fetch_and_add_resource', methods=['POST'])
+@jwt_required()
+def fetch_and_add_resource():
+    data = request.get_json()
+    url = (data.get('url') or '').strip()
+    if not url:
+        return jsonify({"error": "URL is required"}), 400
+
+    if Resource.query.filter_by(url=url).first():
+        return jsonify({"message": "Resource with this URL already exists, skipping addition."}), 200
+
+    try:
+        title, description = fetch_page_metadata(url)
+    except PageFetchError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        new_resource = Resource(
+            title=(title or data.get('title') or url)[:255],
+            url=url,
+            description=description or data.get('description'),
+            resource_type=data.get('resource_type', 'article'),
+            source=urlparse(url).hostname,
+            difficulty=data.get('difficulty'),
+            estimated_time_minutes=data.get('estimated_time_minutes'),
+            contributed_by_user_id=int(get_jwt_identity())
+        )
+        kg_status = save_resource_and_queue_kg(new_resource)
+
+        return jsonify({
+            "message": f"Resource '{new_resource.title}' added successfully!",
+            "resource_id": new_resource.id,
+            "title": new_resource.title,
+            "description": new_resource.description,
+            "url": new_resource.url,
+            "kg_status": kg_status
+        }), 201
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error adding fetched resource {url}: {e}")
+        return jsonify({"error": "Failed to add resource", "details": str(e)}), 500
+
+@app.route('/resources/<int:resource_id>/kg_status', methods=['GET'])
+def get_resource_kg_status(resource_id):
+    job = KGIngestJob.query.get(resource_id)
+    if not job:
+        if not Resource.query.get(resource_id):
+            return jsonify({"error": "Resource not found"}), 404
+        return jsonify({"resource_id": resource_id, "status": "unknown"}), 200
+
+    return jsonify({
+        "resource_id": job.resource_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "last_error": job.last_error,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None
+    }), 200
+
+@app.route('/kg_ingest/dead_letters', methods=['GET'])
+def get_kg_dead_letters():
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    jobs = KGIngestJob.query.filter_by(status='failed').order_by(KGIngestJob.updated_at.desc()).limit(limit).all()
+    return jsonify([{
+        "resource_id": job.resource_id,
+        "attempts": job.attempts,
+        "last_error": job.last_error,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None
+    } for job in jobs]), 200
+
+@app.route('/users/<int:user_id>/learning_path', methods=['GET'])
+@jwt_required()
+def get_learning_path(user_id):
+    current_user_id = get_jwt_identity()
+    if int(current_user_id) != user_id:
+        return jsonify({"error": "Unauthorized: Cannot view another user's learning path"}), 403
+
+    target_concept = (request.args.get('target_concept') or '').strip()
+    if not target_concept:
+        return jsonify({"error": "target_concept is required"}), 400
+
+    user = db.session.query(User.preferred_content_types, User.time_availability, User.difficulty_preference).filter_by(id=user_id).first()
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    if not get_neo4j_driver():
+        return jsonify({"error": "Knowledge Graph is not available"}), 503
+    try:
+        snapshot = get_graph_snapshot()
+    except Exception as e:
+        logger.error(f"Failed to build learning path graph snapshot: {e}")
+        return jsonify({"error": "Knowledge Graph is not available", "details": str(e)}), 503
+
+    target = lookup_concept(target_concept, snapshot.concepts_by_lower_name.get)
+    if not target:
+        return jsonify({"error": f"Concept '{target_concept}' was not found in the knowledge graph"}), 404
+
+    preferred_types = tuple(sorted(json.loads(user.preferred_content_types or '[]')))
+    minutes_per_day = parse_time_availability(user.time_availability)
+    try:
+        knowledge_version, known_concepts = get_user_knowledge(user_id)
+    except (RuntimeError, Neo4jError, DriverError) as e:
+        logger.error(f"Failed to read knowledge for user {user_id}: {e}")
+        return jsonify({"error": "Knowledge Graph is not available", "details": str(e)}), 503
+    key = (user_id, target, preferred_types, user.difficulty_preference, minutes_per_day, knowledge_version, snapshot.version)
+
+    path = get_cached_learning_path(key, lambda: plan_learning_path(
+        snapshot, target, known_concepts, preferred_types, user.difficulty_preference, minutes_per_day))
+
+    message = f"Learning path for '{target}' with {len(path)} steps." if path else f"You already know '{target}' and its prerequisites."
+    return jsonify({
+        "target_concept": target,
+        "path": path,
+        "message": message,
+        "graph_version": snapshot.version
+    }), 200
+
+def _get_concept_index_or_error():
+    if not get_neo4j_driver():
+        return None, (jsonify({"error": "Knowledge Graph is not available"}), 503)
+    try:
+        return get_concept_index(), None
+    except Exception as e:
+        logger.error(f"Failed to build concept co-occurrence index: {e}")
+        return None, (jsonify({"error": "Knowledge Graph is not available", "details": str(e)}), 503)
+
+@app.route('/concepts/<path:name>/related', methods=['GET'])
+def get_related_concepts(name):
+    index, error = _get_concept_index_or_error()
+    if error:
+        return error
+    concept = lookup_concept(name, index.find)
+    if not concept:
+        return jsonify({"error": f"Concept '{name}' was not found in the knowledge graph"}), 404
+
+    limit = max(1, min(request.args.get('limit', CONCEPT_QUERY_DEFAULT_LIMIT, type=int), CONCEPT_QUERY_MAX_LIMIT))
+    min_count = max(1, request.args.get('min_count', CONCEPT_RELATED_MIN_COUNT, type=int))
+    related = index.related(concept, limit, min_count=min_count)
+    return jsonify({
+        "concept": concept,
+        "related": [{"concept": other, "shared_resources": count, "pmi": round(pmi, 4)} for other, count, pmi in related]
+    }), 200
+
+@app.route('/concepts/<path:name>/resources', methods=['GET'])
+def get_concept_resources(name):
+    """Resources teaching a concept, newest first. The next page's cursor is sent in X-Next-Cursor."""
+    index, error = _get_concept_index_or_error()
+    if error:
+        return error
+    concept = lookup_concept(name, index.find)
+    if not concept:
+        return jsonify({"error": f"Concept '{name}' was not found in the knowledge graph"}), 404
+
+    limit = max(1, min(request.args.get('limit', CONCEPT_QUERY_DEFAULT_LIMIT, type=int), CONCEPT_QUERY_MAX_LIMIT))
+    resource_ids = index.resource_ids(concept)
+    cursor = request.args.get('cursor')
+    if cursor:
+        after_id = decode_id_cursor(cursor)
+        if after_id is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+        resource_ids = [resource_id for resource_id in resource_ids if resource_id < after_id]
+    page_ids = resource_ids[:limit]
+
+    # Graph nodes whose Postgres row is gone are skipped.
+    rows = db.session.query(*RESOURCE_LIST_COLUMNS).filter(Resource.id.in_(page_ids)).order_by(Resource.id.desc()).all()
+    response = jsonify({"concept": concept, "resources": [resource_to_dict(row) for row in rows]})
+    if len(resource_ids) > limit:
+        response.headers['X-Next-Cursor'] = encode_cursor(page_ids[-1])
+        response.headers['Access-Control-Expose-Headers'] = 'X-Next-Cursor'
+    return response
+
+@app.route('/users/<int:user_id>/knowledge', methods=['GET'])
+@jwt_required()
+def get_knowledge(user_id):
+    current_user_id = get_jwt_identity()
+    if int(current_user_id) != user_id:
+        return jsonify({"error": "Unauthorized: Cannot view another user's knowledge"}), 403
+    if not get_neo4j_driver():
+        return jsonify({"error": "Knowledge Graph is not available"}), 503
+
+    try:
+        version, levels = get_users_knowledge_levels([user_id])[user_id]
+    except (RuntimeError, Neo4jError, DriverError) as e:
+        logger.error(f"Failed to read knowledge for user {user_id}: {e}")
+        return jsonify({"error": "Knowledge Graph is not available", "details": str(e)}), 503
+    return jsonify({
+        "knowledge_version": version,
+        "knowledge": [{"concept_name": name, "level": level} for name, level in sorted(levels.items())]
+    }), 200
+
+@app.route('/users/<int:user_id>/knowledge', methods=['POST'])
+@jwt_required()
+def update_knowledge(user_id):
+    """
+    Records concept mastery levels (1-5) for a user. Accepts one
+    {"concept_name", "level"} object, a list of them, or
+    {"updates": [...], "sync": true} to replace the whole inventory.
+    """
+    current_user_id = get_jwt_identity()
+    if int(current_user_id) != user_id:
+        return jsonify({"error": "Unauthorized: Cannot update another user's knowledge"}), 403
+    if not db.session.query(User.id).filter_by(id=user_id).first():
+        return jsonify({"error": "User not found"}), 404
+
+    updates, sync, error = parse_knowledge_updates(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+    if not get_neo4j_driver():
+        return jsonify({"error": "Knowledge Graph is not available"}), 503
+
+    try:
+        version, removed = write_user_knowledge(user_id, updates, sync=sync)
+    except KnowledgeVersionError as e:
+        logger.error(str(e))
+        return jsonify({"error": "Knowledge was saved but may not show up everywhere yet; please retry the request",
+                        "details": str(e)}), 500
+    except Exception as e:
+        logger.error(f"Error writing knowledge for user {user_id}: {e}")
+        return jsonify({"error": "Failed to update knowledge", "details": str(e)}), 500
+
+    if len(updates) == 1 and not sync:
+        message = f"Knowledge of '{updates[0]['concept']}' set to level {updates[0]['level']}."
+    else:
+        noun = 'concept' if len(updates) == 1 else 'concepts'
+        message = f"Knowledge updated for {len(updates)} {noun}" + (f", {removed} removed." if sync else ".")
+    return jsonify({
+        "message": message,
+        "knowledge_version": version,
+        "updated": len(updates),
+        "removed": removed
+    }), 200
+
+@app.route('/users/<int:user_id>/recommendations', methods=['GET'])
+@jwt_required()
+def get_recommendations(user_id):
+    current_user_id = get_jwt_identity()
+    if int(current_user_id) != user_id:
+        return jsonify({"error": "Unauthorized: Cannot view another user's recommendations"}), 403
+
+    user = db.session.query(User.id, User.preferred_content_types, User.time_availability,
+                            User.difficulty_preference).filter_by(id=user_id).first()
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    limit = max(1, min(request.args.get('limit', 20, type=int), RECOMMENDATION_TOP_K))
+
+    stored = db.session.get(UserRecommendations, user_id)
+    source = 'precomputed'
+    try:
+        if stored is None or stored.profile_key != recommendation_profile_key(user, get_user_knowledge(user_id)[0]):
+            stored = db.session.merge(compute_recommendations([user], get_recommendation_candidates())[0])
+            db.session.commit()
+            source = 'online'
+    except (RuntimeError, Neo4jError, DriverError) as e:
+        # Knowledge cannot be read while Neo4j is down; a possibly stale list beats none.
+        db.session.rollback()
+        logger.warning(f"Serving stored recommendations for user {user_id}: {e}")
+        if stored is None:
+            return jsonify({"error": "Recommendations are not available", "details": str(e)}), 503
+
+    resource_ids = json.loads(stored.resource_ids)[:limit]
+    scores = dict(zip(resource_ids, json.loads(stored.scores)))
+    rows = db.session.query(*RESOURCE_LIST_COLUMNS).filter(Resource.id.in_(resource_ids)).all()
+    position = {resource_id: index for index, resource_id in enumerate(resource_ids)}
+    rows.sort(key=lambda row: position[row.id])
+    return jsonify({
+        "user_id": user_id,
+        "recommendations": [{**resource_to_dict(row), "score": scores[row.id]} for row in rows],
+        "source": source,
+        "computed_at": stored.computed_at.isoformat()
+    }), 200
+
+# The driver is shared by requests and the KG ingest workers, so it is closed once
+# at interpreter exit rather than at the end of every app context.
+@atexit.register
+def close_neo4j_driver():
+    if neo4j_subsystem.value:
+        neo4j_subsystem.value.close()
+        logger.info("Neo4j driver closed.")
+
+MetricGauge('gyanpath_kg_ingest_queue_depth', 'Resources waiting in the KG ingest queue.',
+            lambda: [({}, kg_ingest_queue.qsize())])
+MetricGauge('gyanpath_concept_cache_lookups_total', 'Concept extraction cache lookups by outcome.',
+            lambda: [({"outcome": outcome}, count) for outcome, count in sorted(concept_cache_stats.items())], 'counter')
+MetricGauge('gyanpath_profile_cache_events_total', 'Profile cache hits, revalidations, misses, evictions and invalidations.',
+            lambda: [({"event": name}, count) for name, count in sorted(profile_cache_stats.items())], 'counter')
+MetricGauge('gyanpath_password_hash_rejected_total', 'Password operations rejected because the pool was saturated.',
+            lambda: [({}, password_hash_stats['rejected'])], 'counter')
+MetricGauge('gyanpath_subsystem_loaded', 'Whether a lazily loaded subsystem is loaded (1) or not (0).',
+            lambda: [({"subsystem": subsystem.name}, int(subsystem.status == 'loaded')) for subsystem in (nlp_subsystem, neo4j_subsystem)])
+
+@app.route('/metrics')
+def metrics():
+    return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+# --- Startup Timing and Optional Warm-up ---
+startup_timings['configuration'] = round(time.perf_counter() - _startup_started - startup_timings['imports'], 3)
+logger.info(f"Startup phases: {startup_timings}")
+
+def warm_up_subsystems():
+    get_nlp()
+    get_neo4j_driver()
+
+if EAGER_INIT == 'true':
+    warm_up_subsystems()
+elif EAGER_INIT == 'background':
+    threading.Thread(target=warm_up_subsystems, name="subsystem-warm-up", daemon=True).start()
+
 # --- Main Application Entry Point ---
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
         logger.info("PostgreSQL tables created/checked.")
     app.run(debug=True, port=5000)
-
-@app.teardown_appcontext
-def close_neo4j_driver(exception):
-    if neo4j_driver:
-        neo4j_driver.close()
-        logger.info("Neo4j driver closed.")
\ No newline at end of file
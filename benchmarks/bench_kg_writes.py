@@ -0,0 +1,77 @@
+"""
+Compares the per-statement Knowledge Graph writes that process_resource_for_kg
+used to make with the batched UNWIND path, against an in-memory Neo4j stand-in.
+
+    python -m benchmarks.bench_kg_writes --resources 200 --concepts 30 --rtt-ms 2
+"""
+import argparse
+import time
+
+from benchmarks.common import load_app, FakeNeo4jDriver
+
+
+def legacy_write(driver, resource):
+    # The 1 + 2N statement pattern process_resource_for_kg used before batching.
+    with driver.session() as session:
+        session.run(
+            "MERGE (r:Resource {resource_id: $resource_id}) "
+            "ON CREATE SET r.title = $title, r.url = $url, r.createdAt = timestamp() "
+            "ON MATCH SET r.title = $title, r.url = $url",
+            resource_id=resource["resource_id"], title=resource["title"], url=resource["url"]
+        )
+        for concept_name in resource["concepts"]:
+            session.run(
+                "MERGE (c:Concept {name: $concept_name}) "
+                "ON CREATE SET c.createdAt = timestamp()",
+                concept_name=concept_name
+            )
+            session.run(
+                "MATCH (r:Resource {resource_id: $resource_id}) "
+                "MATCH (c:Concept {name: $concept_name}) "
+                "MERGE (r)-[:TEACHES]->(c)",
+                resource_id=resource["resource_id"], concept_name=concept_name
+            )
+
+
+def make_resources(count, concepts_per_resource):
+    return [{
+        "resource_id": i,
+        "title": f"Resource {i}",
+        "url": f"https://example.com/resources/{i}",
+        "concepts": [f"concept {i}-{j}" for j in range(concepts_per_resource)]
+    } for i in range(1, count + 1)]
+
+
+def measure(label, driver, fn, resources):
+    driver.reset()
+    started = time.perf_counter()
+    fn(resources)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} round trips: {driver.round_trips:>7}   wall: {elapsed * 1000:>9.1f} ms")
+    return driver.round_trips, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resources', type=int, default=200)
+    parser.add_argument('--concepts', type=int, default=30)
+    parser.add_argument('--rtt-ms', type=float, default=2.0)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    driver = FakeNeo4jDriver(rtt_ms=args.rtt_ms)
+    app_module.neo4j_subsystem.value = driver
+    resources = make_resources(args.resources, args.concepts)
+
+    print(f"{args.resources} resources x {args.concepts} concepts, {args.rtt_ms} ms simulated RTT")
+    measure("legacy (1 + 2N per resource)", driver,
+            lambda items: [legacy_write(driver, r) for r in items], resources)
+    measure("batched, one tx per resource", driver,
+            lambda items: [app_module.write_resources_to_kg([r]) for r in items], resources)
+    measure(f"batched, {args.batch_size} resources per tx", driver,
+            lambda items: app_module.write_resources_to_kg(items, batch_size=args.batch_size), resources)
+
+
+if __name__ == '__main__':
+    main()
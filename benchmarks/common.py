@@ -0,0 +1,111 @@
+import os
+import time
+import importlib
+import tempfile
+
+
+def load_app():
+    """
+    Imports app.py against local stand-ins: a throwaway SQLite file (unless
+    BENCH_DATABASE_URL points at a local Postgres) and an unroutable Neo4j URI so
+    that nothing reaches the real Aura instance configured in .env. Install a
+    FakeNeo4jDriver with app.neo4j_subsystem.value = driver.
+    """
+    # A file rather than :memory: so the KG ingest worker threads get their own
+    # connections instead of sharing the single in-memory one.
+    database_path = os.path.join(tempfile.mkdtemp(prefix='gyanpath-bench-'), 'bench.sqlite3')
+    os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL', f'sqlite:///{database_path}')
+    os.environ['NEO4J_URI'] = os.getenv('BENCH_NEO4J_URI', 'bolt://127.0.0.1:9')
+    return importlib.import_module('app')
+
+
+class FakeResult:
+    def consume(self):
+        return None
+
+
+class FakeTransaction:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, query, parameters=None, **kwargs):
+        return self.driver._round_trip(query)
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def run(self, query, parameters=None, **kwargs):
+        # Auto-commit query: one round trip for the statement itself.
+        return self.driver._round_trip(query)
+
+    def execute_write(self, work, *args, **kwargs):
+        # Managed transaction: BEGIN and COMMIT are pipelined with the first and
+        # last statement by the Bolt driver, so only the statements are counted.
+        return work(FakeTransaction(self.driver), *args, **kwargs)
+
+    execute_read = execute_write
+
+
+class FakeNeo4jDriver:
+    """
+    Stand-in for a neo4j.Driver that counts round trips and sleeps rtt_ms per
+    statement to model the network latency to Aura.
+    """
+    def __init__(self, rtt_ms=2.0):
+        self.rtt = rtt_ms / 1000.0
+        self.round_trips = 0
+        self.queries = []
+
+    def _round_trip(self, query):
+        self.round_trips += 1
+        self.queries.append(query)
+        if self.rtt:
+            time.sleep(self.rtt)
+        return FakeResult()
+
+    def session(self, **kwargs):
+        return FakeSession(self)
+
+    def verify_connectivity(self):
+        return None
+
+    def close(self):
+        return None
+
+    def reset(self):
+        self.round_trips = 0
+        self.queries = []
+
+
+def use_null_mail(app_module):
+    """Makes Flask-Mail skip the SMTP connection (messages are still built and dispatched)."""
+    app_module.app.extensions['mail'].suppress = True
+
+
+def use_nlp_if_available(app_module):
+    """
+    Loads en_core_web_sm through the app. When the model is not installed the spaCy
+    subsystem is left marked as failed, so resource creation skips KG queueing
+    instead of retrying in the background. Returns True if the model loaded.
+    """
+    return app_module.get_nlp() is not None
+
+
+def timed_runs(fn, iterations, warmup=1):
+    """Calls fn warmup + iterations times and returns the timed durations in seconds."""
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return durations
@@ -0,0 +1,251 @@
+"""
+Offline microbenchmarks for the backend hot paths. Runs against a throwaway SQLite
+database (or BENCH_DATABASE_URL), an in-memory Neo4j stand-in and a null mail
+backend, so nothing external is needed.
+
+    python -m benchmarks.run                   # run and compare with the baseline
+    python -m benchmarks.run --save-baseline   # run and store the results as the baseline
+    python -m benchmarks.run --only login_user --threshold 0.1
+
+Results are compared by median time per operation; a benchmark more than
+--threshold slower than its baseline is reported as a regression and the run
+exits with status 1. Baselines are machine-specific, so keep one per machine
+(--baseline-file) and compare like with like.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+from datetime import datetime
+
+os.environ.setdefault('MAIL_SENDER_IN_PROCESS', 'false')
+os.environ.setdefault('EAGER_INIT', 'false')
+
+from benchmarks.common import load_app, FakeNeo4jDriver, use_null_mail, use_nlp_if_available, timed_runs
+
+DEFAULT_BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+SAMPLE_DESCRIPTION = ("An introduction to Python web development with Flask, covering routing, "
+                      "templates, SQLAlchemy models and deploying the application to a cloud provider.")
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+class Context:
+    def __init__(self, app_module, quick):
+        self.app_module = app_module
+        self.app = app_module.app
+        self.db = app_module.db
+        self.client = app_module.app.test_client()
+        self.quick = quick
+        self.has_nlp = False
+        self.driver = FakeNeo4jDriver(rtt_ms=float(os.getenv('BENCH_NEO4J_RTT_MS', 2)))
+        self.counter = 0
+
+    def unique(self, prefix):
+        self.counter += 1
+        return f"{prefix}-{self.counter}"
+
+    def iterations(self, full, quick):
+        return quick if self.quick else full
+
+
+@benchmark('create_user')
+def bench_create_user(ctx):
+    def create():
+        email = f"{ctx.unique('bench-create')}@example.com"
+        with ctx.app.app_context():
+            ctx.app_module.verification_store.add(email)
+        response = ctx.client.post('/create_user', json={
+            "first_name": "Bench", "last_name": "User", "email": email, "password": "correct horse battery"})
+        assert response.status_code == 201, response.json
+    return {"create_user": timed_runs(create, ctx.iterations(20, 5))}
+
+
+@benchmark('login_user')
+def bench_login_user(ctx):
+    email = f"{ctx.unique('bench-login')}@example.com"
+    with ctx.app.app_context():
+        user = ctx.app_module.User(first_name="Bench", last_name="User", email=email)
+        user.set_password("correct horse battery")
+        ctx.db.session.add(user)
+        ctx.db.session.commit()
+
+    def login():
+        response = ctx.client.post('/login', json={"email": email, "password": "correct horse battery"})
+        assert response.status_code == 200, response.json
+    return {"login_user": timed_runs(login, ctx.iterations(20, 5))}
+
+
+@benchmark('add_resource')
+def bench_add_resource(ctx):
+    def add():
+        response = ctx.client.post('/resources', json={
+            "title": "Flask for beginners", "url": f"https://example.com/{ctx.unique('resource')}",
+            "description": SAMPLE_DESCRIPTION, "resource_type": "article"})
+        assert response.status_code == 201, response.json
+    results = {"add_resource": timed_runs(add, ctx.iterations(200, 30))}
+    ctx.app_module.kg_ingest_queue.join()
+    return results
+
+
+@benchmark('process_resource_for_kg')
+def bench_process_resource_for_kg(ctx):
+    concepts = [f"concept {i}" for i in range(30)]
+
+    def write():
+        ctx.app_module.write_resources_to_kg([{
+            "resource_id": 1, "title": "Flask for beginners", "url": "https://example.com/kg", "concepts": concepts}])
+    results = {"kg_write_30_concepts": timed_runs(write, ctx.iterations(100, 20))}
+
+    if not ctx.has_nlp:
+        print("  spaCy model en_core_web_sm not installed; skipping extraction timings.")
+        return results
+
+    def extract_uncached():
+        # A fresh title each time defeats the concept cache.
+        ctx.app_module.extract_concepts(ctx.unique("Flask for beginners"), SAMPLE_DESCRIPTION)
+
+    def extract_cached():
+        ctx.app_module.extract_concepts("Flask for beginners", SAMPLE_DESCRIPTION)
+
+    with ctx.app.app_context():
+        results["extract_concepts_uncached"] = timed_runs(extract_uncached, ctx.iterations(100, 20))
+        results["extract_concepts_cached"] = timed_runs(extract_cached, ctx.iterations(100, 20))
+        results["process_resource_for_kg"] = timed_runs(
+            lambda: ctx.app_module.process_resource_for_kg(1, ctx.unique("Flask"), SAMPLE_DESCRIPTION, "https://example.com/kg"),
+            ctx.iterations(50, 10))
+    return results
+
+
+def _seed_users(ctx, total):
+    User = ctx.app_module.User
+    with ctx.app.app_context():
+        existing = ctx.db.session.query(User).count()
+        rows = [{"first_name": "Seed", "last_name": f"User{i}", "email": f"seed{i}@example.com",
+                 "password_hash": "scrypt:32768:8:1$seed$0", "preferred_content_types": '["article"]',
+                 "time_availability": "1_hour_day", "difficulty_preference": "beginner"}
+                for i in range(existing, total)]
+        for start in range(0, len(rows), 10000):
+            ctx.db.session.execute(User.__table__.insert(), rows[start:start + 10000])
+        ctx.db.session.commit()
+
+
+@benchmark('get_users')
+def bench_get_users(ctx):
+    results = {}
+    for total in ((10000,) if ctx.quick else (10000, 100000)):
+        _seed_users(ctx, total)
+
+        def page():
+            response = ctx.client.get('/users?limit=100')
+            assert response.status_code == 200
+
+        def stream():
+            response = ctx.client.get('/users?stream=true')
+            assert response.status_code == 200
+            len(response.get_data())
+        results[f"get_users_page_{total // 1000}k"] = timed_runs(page, ctx.iterations(50, 10))
+        results[f"get_users_stream_{total // 1000}k"] = timed_runs(stream, ctx.iterations(3, 1))
+    return results
+
+
+@benchmark('otp')
+def bench_otp(ctx):
+    OTP = ctx.app_module.OTP
+    emails = []
+
+    def request_otp():
+        email = f"{ctx.unique('bench-otp')}@example.com"
+        emails.append(email)
+        response = ctx.client.post('/request_otp', json={"email": email})
+        assert response.status_code == 200, response.json
+    results = {"request_otp": timed_runs(request_otp, ctx.iterations(100, 20))}
+
+    with ctx.app.app_context():
+        codes = {otp.email: otp.code for otp in OTP.query.filter(OTP.email.in_(emails))}
+    pending = [email for email in emails if email in codes]
+
+    def verify_otp():
+        email = pending.pop()
+        response = ctx.client.post('/verify_otp', json={"email": email, "otp_code": codes[email]})
+        assert response.status_code == 200, response.json
+    results["verify_otp"] = timed_runs(verify_otp, min(len(pending) - 1, ctx.iterations(100, 20)))
+    return results
+
+
+def summarize(durations):
+    ordered = sorted(durations)
+    return {
+        "runs": len(ordered),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, summary in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            status = "new"
+        else:
+            change = summary["median_ms"] / previous["median_ms"] - 1 if previous["median_ms"] else 0.0
+            status = f"{change:+.1%}"
+            if change > threshold:
+                status += "  REGRESSION"
+                regressions.append(name)
+        print(f"{name:<32} median {summary['median_ms']:>10.3f} ms   p95 {summary['p95_ms']:>10.3f} ms   {status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS), help='Run only this benchmark (repeatable).')
+    parser.add_argument('--quick', action='store_true', help='Fewer iterations and only the 10k user table.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown of the median before flagging.')
+    parser.add_argument('--baseline-file', default=DEFAULT_BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    app_module = load_app()
+    use_null_mail(app_module)
+    ctx = Context(app_module, args.quick)
+    app_module.neo4j_subsystem.value = ctx.driver
+    ctx.has_nlp = use_nlp_if_available(app_module)
+    with ctx.app.app_context():
+        ctx.db.create_all()
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        print(f"Running {name}...")
+        for result_name, durations in BENCHMARKS[name](ctx).items():
+            results[result_name] = summarize(durations)
+
+    baseline = {}
+    if os.path.exists(args.baseline_file):
+        with open(args.baseline_file) as f:
+            baseline = json.load(f).get("results", {})
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline_file, 'w') as f:
+            json.dump({"saved_at": datetime.utcnow().isoformat(), "results": {**baseline, **results}}, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline_file}.")
+    elif not baseline:
+        print("No baseline found; run with --save-baseline to record one.")
+
+    if regressions and not args.save_baseline:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
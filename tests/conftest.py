@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """app.py imported against a throwaway SQLite file and an unroutable Neo4j URI."""
+    from benchmarks.common import load_app
+    module = load_app()
+    with module.app.app_context():
+        module.db.create_all()
+    return module
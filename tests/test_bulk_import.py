@@ -0,0 +1,50 @@
+import json
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture
+def import_rows(app_module, monkeypatch):
+    queued = []
+    monkeypatch.setattr(app_module, 'enqueue_kg_ingest', lambda resource_id: queued.append(resource_id) or True)
+    created = []
+
+    def post(query=''):
+        body = '\n'.join(json.dumps({"title": f'Bulk {n}', "url": f'https://example.com/bulk/{len(created)}/{n}',
+                                     "resource_type": 'article'}) for n in range(2))
+        response = app_module.app.test_client().post(f'/resources/bulk{query}', data=body,
+                                                     content_type='application/x-ndjson')
+        assert response.status_code == 200, response.json
+        ids = [row["resource_id"] for row in response.json["rows"]]
+        created.extend(ids)
+        with app_module.app.app_context():
+            jobs = app_module.KGIngestJob.query.filter(app_module.KGIngestJob.resource_id.in_(ids)).all()
+            return ids, queued, {(job.status, job.last_error) for job in jobs}
+
+    yield post
+    with app_module.app.app_context():
+        app_module.KGIngestJob.query.filter(app_module.KGIngestJob.resource_id.in_(created)).delete()
+        app_module.Resource.query.filter(app_module.Resource.id.in_(created)).delete()
+        app_module.db.session.commit()
+
+
+def test_imported_resources_are_queued_for_ingestion(app_module, import_rows, monkeypatch):
+    monkeypatch.setattr(app_module.nlp_subsystem, 'failed_at', None)
+    monkeypatch.setattr(app_module.neo4j_subsystem, 'failed_at', None)
+    ids, queued, jobs = import_rows()
+    assert queued == ids
+    assert jobs == {('pending', None)}
+
+
+def test_import_without_kg_dead_letters_the_jobs(app_module, import_rows):
+    ids, queued, jobs = import_rows('?kg=false')
+    assert queued == []
+    assert jobs == {('failed', "KG ingestion skipped at import (kg=false)")}
+
+
+def test_import_while_kg_is_down_dead_letters_the_jobs(app_module, import_rows, monkeypatch):
+    monkeypatch.setattr(app_module.neo4j_subsystem, 'failed_at', datetime.utcnow())
+    ids, queued, jobs = import_rows()
+    assert queued == []
+    assert jobs == {('failed', "NLP model or Neo4j driver not available")}
@@ -0,0 +1,51 @@
+import math
+
+
+def test_related_pmi_does_not_overflow_on_large_catalogs(app_module):
+    # 40k resources teach both concepts in a 100k catalog: count x total > 2**31.
+    concept_resources = {'python': set(range(40000)), 'flask': set(range(40000)),
+                         'rust': set(range(40000, 100000))}
+    snapshot = app_module.GraphSnapshot(1, concept_resources, {}, {})
+    index = app_module.ConceptCooccurrenceIndex(snapshot)
+
+    [(name, shared, pmi)] = index.related('python', 10)
+    assert (name, shared) == ('flask', 40000)
+    assert math.isclose(pmi, math.log(100000 / 40000))
+
+
+def test_index_follows_graph_snapshot_and_folds_new_writes(app_module):
+    snapshot = app_module.GraphSnapshot(1, {'python': {1, 2}, 'flask': {1}}, {}, {})
+    index = app_module.ConceptCooccurrenceIndex(snapshot)
+    assert index.graph_version == 1
+
+    index.add_resources([{"resource_id": 3, "concepts": ["python", "flask"]}])
+    assert index.related('flask', 10, min_count=1) == [('python', 2, 0.0)]
+    assert index.resource_ids('flask') == [3, 1]
+
+
+def test_snapshot_build_matches_incremental_adds(app_module):
+    resource_concepts = {1: ['python', 'flask', 'sql'], 2: ['python', 'sql'], 3: ['rust'], 4: ['python', 'flask']}
+    concept_resources = {}
+    for resource_id, names in resource_concepts.items():
+        for name in names:
+            concept_resources.setdefault(name, set()).add(resource_id)
+    built = app_module.ConceptCooccurrenceIndex(app_module.GraphSnapshot(1, concept_resources, {}, {}))
+    incremental = app_module.ConceptCooccurrenceIndex(app_module.GraphSnapshot(1, {}, {}, {}))
+    incremental.add_resources([{"resource_id": resource_id, "concepts": names}
+                               for resource_id, names in resource_concepts.items()])
+
+    for name in ('python', 'flask', 'sql', 'rust'):
+        # Concept ids differ between the two, so PMI ties may come back in either order.
+        assert sorted(built.related(name, 10, min_count=1)) == sorted(incremental.related(name, 10, min_count=1))
+        assert built.resource_ids(name) == incremental.resource_ids(name)
+
+
+def test_rewritten_resource_drops_its_removed_concepts(app_module):
+    snapshot = app_module.GraphSnapshot(1, {'python': {1, 2}, 'flask': {1, 2}, 'sql': {1}}, {}, {})
+    index = app_module.ConceptCooccurrenceIndex(snapshot)
+
+    index.add_resources([{"resource_id": 1, "concepts": ["python"]}])
+    assert index.related('python', 10, min_count=1) == [('flask', 1, math.log(2 / 2))]
+    assert index.resource_ids('flask') == [2]
+    assert index.find('sql') is None
+    assert index.related('flask', 10, min_count=1) == [('python', 1, 0.0)]
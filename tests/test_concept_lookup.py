@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+import spacy
+from flask_jwt_extended import create_access_token
+from spacy.tokens import Doc
+
+vocab = spacy.blank('en').vocab
+ANALYSES = {
+    'Data Structures': (['Data', 'Structures'], ['NOUN', 'NOUN'], ['datum', 'structure']),
+    'JS': (['JS'], ['PROPN'], ['JS']),
+}
+
+
+class LemmatizingNLP:
+    pipe_names = []
+
+    def pipe(self, texts, **kwargs):
+        for text in texts:
+            words, pos, lemmas = ANALYSES.get(text, (text.split(), ['NOUN'] * len(text.split()), text.split()))
+            yield Doc(vocab, words=words, pos=pos, lemmas=lemmas)
+
+
+@pytest.fixture
+def graph(app_module, monkeypatch):
+    resources = {resource_id: SimpleNamespace(id=resource_id, title=f'R{resource_id}', url=f'https://example.com/{resource_id}',
+                                              description='', resource_type='article', difficulty='beginner',
+                                              estimated_time_minutes=30)
+                 for resource_id in (1, 2, 3)}
+    snapshot = app_module.GraphSnapshot(1, {'data structure': {1}, 'javascript': {2}, 'Legacy Name': {3}}, {}, resources)
+    monkeypatch.setattr(app_module.nlp_subsystem, 'value', LemmatizingNLP())
+    monkeypatch.setattr(app_module.neo4j_subsystem, 'value', object())
+    monkeypatch.setattr(app_module, 'get_graph_snapshot', lambda: snapshot)
+    monkeypatch.setattr(app_module, 'concept_index', None)
+    return snapshot
+
+
+@pytest.mark.parametrize('name, expected', [('Data Structures', 'data structure'), ('JS', 'javascript'),
+                                            ('legacy name', 'Legacy Name'), ('unknown', None)])
+def test_lookup_uses_canonical_then_plain_name(app_module, graph, name, expected):
+    assert app_module.lookup_concept(name, graph.concepts_by_lower_name.get) == expected
+
+
+def test_routes_find_canonicalized_concepts(app_module, graph):
+    with app_module.app.app_context():
+        user = app_module.User(first_name='A', last_name='B', email='lookup@example.com', password_hash='x')
+        app_module.db.session.add(user)
+        app_module.db.session.commit()
+        user_id, token = user.id, create_access_token(identity=str(user.id))
+    try:
+        client = app_module.app.test_client()
+        response = client.get(f'/users/{user_id}/learning_path?target_concept=Data Structures',
+                              headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == 200
+        assert response.json['target_concept'] == 'data structure'
+        assert client.get('/concepts/JS/related').json['concept'] == 'javascript'
+    finally:
+        with app_module.app.app_context():
+            app_module.db.session.delete(app_module.db.session.get(app_module.User, user_id))
+            app_module.db.session.commit()
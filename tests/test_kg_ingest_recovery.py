@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def jobs(app_module):
+    """Resources whose ingest job is abandoned mid-run, freshly queued, and dead-lettered."""
+    long_ago = datetime.utcnow() - timedelta(hours=1)
+    ids = {}
+    with app_module.app.app_context():
+        for name, status, updated_at in (('abandoned', 'processing', long_ago), ('queued', 'pending', None),
+                                         ('dead', 'failed', long_ago)):
+            resource = app_module.Resource(title=name, url=f'https://example.com/{name}', resource_type='article')
+            app_module.db.session.add(resource)
+            app_module.db.session.flush()
+            app_module.db.session.add(app_module.KGIngestJob(resource_id=resource.id, status=status, attempts=5,
+                                                             updated_at=updated_at))
+            ids[name] = resource.id
+        app_module.db.session.commit()
+    yield ids
+    with app_module.app.app_context():
+        app_module.KGIngestJob.query.filter(app_module.KGIngestJob.resource_id.in_(ids.values())).delete()
+        app_module.Resource.query.filter(app_module.Resource.id.in_(ids.values())).delete()
+        app_module.db.session.commit()
+
+
+def statuses(app_module, ids):
+    with app_module.app.app_context():
+        return {name: app_module.db.session.get(app_module.KGIngestJob, resource_id).status
+                for name, resource_id in ids.items()}
+
+
+@pytest.fixture
+def ingested(app_module, monkeypatch):
+    ingested = []
+    monkeypatch.setattr(app_module, 'get_neo4j_driver', lambda: object())
+    monkeypatch.setattr(app_module, 'get_nlp', lambda: object())
+    monkeypatch.setattr(app_module, 'ingest_resource_into_kg', ingested.append)
+    return ingested
+
+
+def test_recover_reruns_only_stale_jobs(app_module, jobs, ingested):
+    result = app_module.app.test_cli_runner().invoke(args=['kg-ingest-recover'])
+    assert result.exit_code == 0, result.output
+    assert ingested == [jobs['abandoned']]
+    assert statuses(app_module, jobs) == {'abandoned': 'done', 'queued': 'pending', 'dead': 'failed'}
+
+
+def test_recover_with_failed_retries_dead_letters(app_module, jobs, ingested):
+    result = app_module.app.test_cli_runner().invoke(args=['kg-ingest-recover', '--failed'])
+    assert result.exit_code == 0, result.output
+    assert sorted(ingested) == sorted([jobs['abandoned'], jobs['dead']])
+    assert "Re-ran 2 KG ingest jobs: 2 done, 0 failed." in result.output
@@ -0,0 +1,44 @@
+import pytest
+
+
+class Graph:
+    """Resource nodes as kg-reconcile reads them; writes are recorded rather than sent."""
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def execute_read(self, work, ids, *args):
+        return {resource_id: self.nodes[resource_id] for resource_id in ids if resource_id in self.nodes}
+
+
+@pytest.fixture
+def resource(app_module):
+    with app_module.app.app_context():
+        row = app_module.Resource(title='Intro', url='https://example.com/reconcile', description='Lists in Python',
+                                  resource_type='article')
+        app_module.db.session.add(row)
+        app_module.db.session.commit()
+        resource_id = row.id
+    yield resource_id
+    with app_module.app.app_context():
+        app_module.db.session.delete(app_module.db.session.get(app_module.Resource, resource_id))
+        app_module.JobWatermark.query.filter_by(name=app_module.KG_RECONCILE_WATERMARK).delete()
+        app_module.db.session.commit()
+
+
+def test_changed_description_is_rewritten_with_its_new_concepts(app_module, resource, monkeypatch):
+    written = []
+    monkeypatch.setattr(app_module, 'write_resources_to_kg', lambda items, batch_size: written.extend(items))
+    monkeypatch.setattr(app_module, 'concepts_for_rows', lambda rows: [['dictionaries'] for _ in rows])
+    graph = Graph({resource: {"title": 'Intro', "url": 'https://example.com/reconcile',
+                              "text_hash": app_module.kg_text_hash('Intro', 'Lists in Python')}})
+
+    with app_module.app.app_context():
+        assert app_module.reconcile_changed_resources(graph, 100, full=True)['stale'] == 0
+        app_module.db.session.get(app_module.Resource, resource).description = 'Dictionaries in Python'
+        app_module.db.session.commit()
+        counts = app_module.reconcile_changed_resources(graph, 100, full=True)
+
+    assert counts['stale'] == 1
+    assert written == [{"resource_id": resource, "title": 'Intro', "url": 'https://example.com/reconcile',
+                        "text_hash": app_module.kg_text_hash('Intro', 'Dictionaries in Python'),
+                        "concepts": ['dictionaries']}]
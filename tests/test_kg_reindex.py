@@ -0,0 +1,59 @@
+import pytest
+
+
+class FakeNLP:
+    meta = {'lang': 'en', 'name': 'fake', 'version': '0'}
+    pipe_names = []
+
+    def pipe(self, items, as_tuples=False, **kwargs):
+        return ((text, context) for text, context in items)
+
+
+@pytest.fixture
+def resources(app_module):
+    with app_module.app.app_context():
+        rows = [app_module.Resource(title=f'Reindex {n}', url=f'https://example.com/reindex/{n}', resource_type='article')
+                for n in range(3)]
+        app_module.db.session.add_all(rows)
+        app_module.db.session.commit()
+        ids = [row.id for row in rows]
+    yield ids
+    with app_module.app.app_context():
+        app_module.Resource.query.filter(app_module.Resource.id.in_(ids)).delete()
+        app_module.db.session.commit()
+
+
+def test_completed_reindex_removes_its_checkpoint(app_module, resources, monkeypatch, tmp_path):
+    written = []
+    monkeypatch.setattr(app_module, 'get_nlp', lambda: FakeNLP())
+    monkeypatch.setattr(app_module, 'get_neo4j_driver', lambda: object())
+    monkeypatch.setattr(app_module, 'concepts_from_doc', lambda doc: ['python'])
+    monkeypatch.setattr(app_module, 'write_resources_to_kg',
+                        lambda items, batch_size: written.extend(item["resource_id"] for item in items))
+    checkpoint = tmp_path / 'checkpoint'
+    runner = app_module.app.test_cli_runner()
+
+    for _ in range(2):
+        result = runner.invoke(args=['kg-reindex', '--checkpoint-file', str(checkpoint), '--write-batch-size', '2'])
+        assert result.exit_code == 0, result.output
+        assert not checkpoint.exists()
+    assert [resource_id for resource_id in written if resource_id in resources] == resources * 2
+
+
+class RecordingNLP(FakeNLP):
+    pipe_names = ['tok2vec', 'tagger', 'parser', 'attribute_ruler', 'lemmatizer', 'ner', 'textcat']
+
+    def __init__(self):
+        self.disabled = []
+
+    def pipe(self, texts, disable=(), **kwargs):
+        self.disabled.append(sorted(disable))
+        return iter([])
+
+
+def test_passes_disable_the_components_they_do_not_read(app_module, monkeypatch):
+    nlp = RecordingNLP()
+    monkeypatch.setattr(app_module, 'get_nlp', lambda: nlp)
+    assert app_module.kg_pipe_disabled_components() == ['textcat']
+    app_module.canonical_concept_names([])
+    assert nlp.disabled == [['ner', 'parser', 'textcat']]
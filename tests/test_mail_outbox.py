@@ -0,0 +1,67 @@
+import smtplib
+from datetime import datetime, timedelta
+
+import pytest
+
+
+class Connection:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+
+@pytest.fixture
+def outbox(app_module):
+    with app_module.app.app_context():
+        app_module.MailOutbox.query.delete()
+        app_module.db.session.commit()
+    yield app_module.MailOutbox
+    with app_module.app.app_context():
+        app_module.MailOutbox.query.delete()
+        app_module.db.session.commit()
+
+
+def test_sent_messages_do_not_keep_their_body(app_module, outbox):
+    connection = Connection()
+    with app_module.app.app_context():
+        app_module.queue_mail('otp@example.com', 'Your code', 'Your OTP is 123456')
+        app_module.db.session.commit()
+        app_module.send_mail_batch(connection, app_module.claim_mail_batch())
+        row = outbox.query.one()
+        assert (row.status, row.body) == ('sent', '')
+    assert connection.sent[0].body == 'Your OTP is 123456'
+
+
+def test_old_sent_and_failed_messages_are_swept(app_module, outbox):
+    long_ago = datetime.utcnow() - app_module.MAIL_RETENTION - timedelta(days=1)
+    with app_module.app.app_context():
+        for status, created_at in (('sent', long_ago), ('failed', long_ago), ('queued', long_ago),
+                                   ('sent', datetime.utcnow())):
+            app_module.db.session.add(outbox(recipient='a@example.com', subject='s', body='', status=status,
+                                             created_at=created_at))
+        app_module.db.session.commit()
+        assert app_module.delete_old_mail(batch_size=1) == 2
+        assert sorted(status for (status,) in app_module.db.session.query(outbox.status)) == ['queued', 'sent']
+
+
+class RefusingConnection(Connection):
+    def send(self, message):
+        if message.recipients == ['refused@example.com']:
+            raise smtplib.SMTPRecipientsRefused({'refused@example.com': (550, b'No such user')})
+        super().send(message)
+
+
+def test_refused_recipient_does_not_fail_the_rest_of_the_batch(app_module, outbox):
+    connection = RefusingConnection()
+    with app_module.app.app_context():
+        for recipient in ('refused@example.com', 'a@example.com', 'b@example.com'):
+            app_module.queue_mail(recipient, 'Your code', 'Your OTP is 123456')
+        app_module.db.session.commit()
+        app_module.send_mail_batch(connection, app_module.claim_mail_batch())
+        rows = {row.recipient: row for row in outbox.query}
+        assert rows['refused@example.com'].status == 'queued'
+        assert 'No such user' in rows['refused@example.com'].last_error
+        assert [(rows[r].status, rows[r].last_error) for r in ('a@example.com', 'b@example.com')] == [('sent', None)] * 2
+    assert [message.recipients for message in connection.sent] == [['a@example.com'], ['b@example.com']]
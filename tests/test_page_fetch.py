@@ -0,0 +1,69 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+PUBLIC_HOST = 'public.example'
+
+
+class RedirectingHandler(BaseHTTPRequestHandler):
+    hits = []
+
+    def do_GET(self):
+        type(self).hits.append((self.path, self.headers.get('Host')))
+        if self.path == '/start':
+            self.send_response(302)
+            self.send_header('Location', f'http://127.0.0.1:{self.server.server_port}/internal-admin')
+            self.end_headers()
+        elif self.path == '/relative':
+            self.send_response(302)
+            self.send_header('Location', '/page')
+            self.end_headers()
+        else:
+            body = b'<html><head><title>Internal</title></head></html>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(app_module, monkeypatch):
+    httpd = HTTPServer(('127.0.0.1', 0), RedirectingHandler)
+    RedirectingHandler.hits = []
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    # PUBLIC_HOST stands for a public site: it "resolves" to the local server and
+    # passes the private-network check; every other host goes through the real check.
+    real_resolve = app_module._resolve_fetchable_host
+    monkeypatch.setattr(app_module, '_resolve_fetchable_host',
+                        lambda hostname, port: '127.0.0.1' if hostname == PUBLIC_HOST else real_resolve(hostname, port))
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_redirect_to_private_address_is_refused(app_module, server):
+    with app_module.app.app_context():
+        with pytest.raises(app_module.PageFetchError, match='private network'):
+            app_module.fetch_page_metadata(f'http://{PUBLIC_HOST}:{server.server_port}/start')
+    assert [path for path, _ in RedirectingHandler.hits] == ['/start']
+
+
+def test_relative_redirect_stays_pinned_to_checked_host(app_module, server):
+    with app_module.app.app_context():
+        title, _ = app_module.fetch_page_metadata(f'http://{PUBLIC_HOST}:{server.server_port}/relative')
+    assert title == 'Internal'
+    assert RedirectingHandler.hits == [('/relative', f'{PUBLIC_HOST}:{server.server_port}'),
+                                       ('/page', f'{PUBLIC_HOST}:{server.server_port}')]
+
+
+def test_private_address_is_refused_before_connecting(app_module, server):
+    with app_module.app.app_context():
+        with pytest.raises(app_module.PageFetchError, match='private network'):
+            app_module.fetch_page_metadata(f'http://127.0.0.1:{server.server_port}/internal-admin')
+    assert RedirectingHandler.hits == []
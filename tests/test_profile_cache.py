@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+
+@pytest.fixture
+def user(app_module):
+    with app_module.app.app_context():
+        user = app_module.User(first_name='A', last_name='B', email='profile@example.com', password_hash='x')
+        app_module.db.session.add(user)
+        app_module.db.session.commit()
+        user_id, token = user.id, create_access_token(identity=str(user.id))
+    yield user_id, {'Authorization': f'Bearer {token}'}
+    app_module.invalidate_profile(user_id)
+    with app_module.app.app_context():
+        app_module.db.session.delete(app_module.db.session.get(app_module.User, user_id))
+        app_module.db.session.commit()
+
+
+def bump_elsewhere(app_module, user_id, **changes):
+    """A write made by another worker: this process's cache is not invalidated."""
+    with app_module.app.app_context():
+        app_module.User.query.filter_by(id=user_id).update(
+            dict(changes, profile_version=app_module.User.profile_version + 1))
+        app_module.db.session.commit()
+
+
+def expire(app_module, user_id):
+    version, profile, cached_at = app_module.profile_cache[user_id]
+    app_module.profile_cache[user_id] = (version, profile, cached_at - app_module.PROFILE_CACHE_TTL - timedelta(seconds=1))
+
+
+def test_profile_update_changes_the_etag(app_module, user):
+    user_id, headers = user
+    client = app_module.app.test_client()
+    first = client.get(f'/users/{user_id}/profile', headers=headers)
+    assert first.headers['ETag'] == '"v1"'
+
+    assert client.put(f'/users/{user_id}/profile', json={'first_name': 'C'}, headers=headers).status_code == 200
+    response = client.get(f'/users/{user_id}/profile', headers=dict(headers, **{'If-None-Match': '"v1"'}))
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"v2"'
+    assert response.json['first_name'] == 'C'
+
+
+def test_stale_entry_revalidates_against_the_version_column(app_module, user):
+    user_id, headers = user
+    client = app_module.app.test_client()
+    client.get(f'/users/{user_id}/profile', headers=headers)
+
+    expire(app_module, user_id)
+    response = client.get(f'/users/{user_id}/profile', headers=dict(headers, **{'If-None-Match': '"v1"'}))
+    assert response.status_code == 304
+
+    bump_elsewhere(app_module, user_id, first_name='D')
+    expire(app_module, user_id)
+    response = client.get(f'/users/{user_id}/profile', headers=dict(headers, **{'If-None-Match': '"v1"'}))
+    assert response.status_code == 200
+    assert response.json['first_name'] == 'D'
+
+
+def test_conditional_get_without_a_cache_entry_reads_only_the_version(app_module, user, monkeypatch):
+    user_id, headers = user
+    app_module.invalidate_profile(user_id)
+    monkeypatch.setattr(app_module, 'cache_profile', lambda *args: pytest.fail("full row loaded"))
+    response = app_module.app.test_client().get(f'/users/{user_id}/profile',
+                                                headers=dict(headers, **{'If-None-Match': '"v1"'}))
+    assert response.status_code == 304
+    assert response.headers['ETag'] == '"v1"'
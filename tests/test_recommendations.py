@@ -0,0 +1,68 @@
+import threading
+from datetime import datetime
+
+import pytest
+from flask_jwt_extended import create_access_token
+from neo4j.exceptions import ServiceUnavailable
+
+
+class UnavailableGraph:
+    def session(self, **kwargs):
+        raise ServiceUnavailable("connection refused")
+
+
+@pytest.fixture
+def user(app_module):
+    with app_module.app.app_context():
+        app_module.db.session.add(app_module.User(first_name='A', last_name='B', email='rec@example.com', password_hash='x'))
+        app_module.db.session.add(app_module.Resource(title='Intro', url='http://rec/1', resource_type='video',
+                                                      difficulty='beginner', estimated_time_minutes=20))
+        app_module.db.session.commit()
+        user = app_module.User.query.filter_by(email='rec@example.com').one()
+        yield user.id, create_access_token(identity=str(user.id))
+        app_module.db.session.rollback()
+        app_module.UserKnowledgeVersion.query.filter_by(user_id=user.id).delete()
+        app_module.UserRecommendations.query.filter_by(user_id=user.id).delete()
+        app_module.db.session.delete(user)
+        app_module.db.session.commit()
+
+
+def test_stored_list_is_served_when_the_graph_fails(app_module, user, monkeypatch):
+    user_id, token = user
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app_module.app.test_client()
+    monkeypatch.setattr(app_module.neo4j_subsystem, 'value', None)
+    monkeypatch.setattr(app_module.neo4j_subsystem, 'failed_at', datetime.utcnow()) # no connection attempt
+    assert client.get(f'/users/{user_id}/recommendations', headers=headers).json['source'] == 'online'
+
+    # Knowledge changed, and the loaded driver now fails on use.
+    with app_module.app.app_context():
+        app_module.bump_knowledge_version(user_id)
+    monkeypatch.setattr(app_module.neo4j_subsystem, 'value', UnavailableGraph())
+    monkeypatch.setattr(app_module, 'get_graph_snapshot', lambda: (_ for _ in ()).throw(ServiceUnavailable("down")))
+
+    response = client.get(f'/users/{user_id}/recommendations', headers=headers)
+    assert response.status_code == 200
+    assert response.json['source'] == 'precomputed'
+
+
+def test_stale_candidates_are_rebuilt_in_the_background(app_module, monkeypatch):
+    snapshots = [app_module.GraphSnapshot(101, {}, {}, {})]
+    monkeypatch.setattr(app_module, 'get_neo4j_driver', lambda: object())
+    monkeypatch.setattr(app_module, 'get_graph_snapshot', lambda: snapshots[-1])
+    monkeypatch.setattr(app_module, 'recommendation_candidates', None)
+    with app_module.app.app_context():
+        first = app_module.get_recommendation_candidates()
+
+        release = threading.Event()
+        real_build = app_module.build_recommendation_candidates
+        monkeypatch.setattr(app_module, 'build_recommendation_candidates',
+                            lambda snapshot: release.wait(5) and real_build(snapshot))
+        snapshots.append(app_module.GraphSnapshot(102, {}, {}, {}))
+        assert app_module.get_recommendation_candidates() is first
+        release.set()
+    for _ in range(50):
+        if app_module.recommendation_candidates is not first:
+            break
+        threading.Event().wait(0.05)
+    assert app_module.recommendation_candidates.graph_version == 102
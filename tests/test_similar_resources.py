@@ -0,0 +1,56 @@
+import pytest
+
+
+@pytest.fixture
+def resources(app_module):
+    ids = []
+
+    def add(title, description):
+        with app_module.app.app_context():
+            row = app_module.Resource(title=title, url=f'https://example.com/similar/{len(ids)}', description=description,
+                                      resource_type='article')
+            app_module.db.session.add(row)
+            app_module.db.session.commit()
+            ids.append(row.id)
+            return row.id
+
+    yield add
+    with app_module.app.app_context():
+        app_module.Resource.query.filter(app_module.Resource.id.in_(ids)).delete()
+        app_module.db.session.commit()
+
+
+@pytest.fixture
+def index(app_module, monkeypatch, tmp_path):
+    index = app_module.SimilarityIndex(str(tmp_path))
+    monkeypatch.setattr(app_module, 'similarity_index', index)
+    return index
+
+
+def build(app_module, directory):
+    with app_module.app.app_context():
+        rows = app_module.db.session.query(app_module.Resource.id, app_module.Resource.title,
+                                           app_module.Resource.description).order_by(app_module.Resource.id).all()
+    app_module.write_similarity_index(directory, [row.id for row in rows],
+                                      [app_module.similarity_term_counts(row.title, row.description) for row in rows])
+
+
+def test_missing_index_is_503_instead_of_an_in_process_build(app_module, resources, index):
+    resource_id = resources('Python lists', 'Working with lists in Python')
+    response = app_module.app.test_client().get(f'/resources/{resource_id}/similar')
+    assert response.status_code == 503
+    assert index.delta_ids == []
+
+
+def test_delta_catch_up_is_throttled(app_module, resources, index):
+    first = resources('Python lists', 'Working with lists in Python')
+    build(app_module, index.directory)
+    second = resources('Python list comprehensions', 'Lists in Python, built in one line')
+    client = app_module.app.test_client()
+
+    assert client.get(f'/resources/{first}/similar').json['similar'][0]['id'] == second
+    third = resources('More Python lists', 'Slicing lists in Python')
+    response = client.get(f'/resources/{third}/similar')
+    assert response.status_code == 200
+    assert response.json['similar'] == []
+    assert third not in index.delta_ids
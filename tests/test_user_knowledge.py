@@ -0,0 +1,120 @@
+import pytest
+from flask_jwt_extended import create_access_token
+from neo4j.exceptions import ServiceUnavailable
+from sqlalchemy.exc import OperationalError
+
+
+class Result:
+    def consume(self):
+        return None
+
+    def single(self):
+        return {"removed": 0}
+
+
+class Graph:
+    """Accepts knowledge writes; reads fail once fail_reads is set."""
+    def __init__(self):
+        self.fail_writes = False
+        self.fail_reads = False
+
+    def session(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_write(self, work, *args):
+        if self.fail_writes:
+            raise ServiceUnavailable("write failed")
+        return work(self, *args)
+
+    def execute_read(self, work, *args):
+        if self.fail_reads:
+            raise ServiceUnavailable("read failed")
+        return work(self, *args)
+
+    def run(self, query, parameters=None, **kwargs):
+        return Result() if 'RETURN' not in query or 'removed' in query else []
+
+
+@pytest.fixture
+def graph(app_module, monkeypatch):
+    graph = Graph()
+    monkeypatch.setattr(app_module.neo4j_subsystem, 'value', graph)
+    return graph
+
+
+@pytest.fixture
+def user(app_module):
+    with app_module.app.app_context():
+        user = app_module.User(first_name='A', last_name='B', email='knows@example.com', password_hash='x')
+        app_module.db.session.add(user)
+        app_module.db.session.commit()
+        yield user.id, {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+        app_module.db.session.rollback()
+        app_module.UserKnowledgeVersion.query.filter_by(user_id=user.id).delete()
+        app_module.db.session.delete(app_module.db.session.get(app_module.User, user.id))
+        app_module.db.session.commit()
+
+
+def version(app_module, user_id):
+    with app_module.app.app_context():
+        return app_module.db.session.query(app_module.UserKnowledgeVersion.version).filter_by(user_id=user_id).scalar()
+
+
+def test_failed_graph_write_leaves_the_version_alone(app_module, graph, user):
+    user_id, headers = user
+    client = app_module.app.test_client()
+    assert client.post(f'/users/{user_id}/knowledge', json={'concept_name': 'python', 'level': 3},
+                       headers=headers).json['knowledge_version'] == 1
+
+    graph.fail_writes = True
+    response = client.post(f'/users/{user_id}/knowledge', json={'concept_name': 'python', 'level': 4}, headers=headers)
+    assert response.status_code == 500
+    assert version(app_module, user_id) == 1
+
+
+def test_failed_version_commit_is_retried(app_module, graph, user, monkeypatch):
+    user_id, headers = user
+    real_commit = app_module.db.session.commit
+    failures = [OperationalError('COMMIT', {}, Exception('connection lost'))]
+
+    def flaky_commit():
+        if failures:
+            raise failures.pop()
+        real_commit()
+
+    monkeypatch.setattr(app_module.db.session, 'commit', flaky_commit)
+    response = app_module.app.test_client().post(f'/users/{user_id}/knowledge',
+                                                 json={'concept_name': 'python', 'level': 3}, headers=headers)
+    assert response.status_code == 200
+    assert version(app_module, user_id) == 1
+
+
+def test_learning_path_is_503_when_knowledge_cannot_be_read(app_module, graph, user, monkeypatch):
+    user_id, headers = user
+    client = app_module.app.test_client()
+    client.post(f'/users/{user_id}/knowledge', json={'concept_name': 'python', 'level': 3}, headers=headers)
+    app_module.user_knowledge_cache.clear()
+    monkeypatch.setattr(app_module, 'get_graph_snapshot',
+                        lambda: app_module.GraphSnapshot(1, {'python': set()}, {}, {}))
+
+    graph.fail_reads = True
+    response = client.get(f'/users/{user_id}/learning_path?target_concept=python', headers=headers)
+    assert response.status_code == 503
+
+
+def test_knowledge_is_503_when_the_graph_cannot_be_read(app_module, graph, user):
+    user_id, headers = user
+    client = app_module.app.test_client()
+    client.post(f'/users/{user_id}/knowledge', json={'concept_name': 'python', 'level': 3}, headers=headers)
+    app_module.user_knowledge_cache.clear()
+
+    graph.fail_reads = True
+    response = client.get(f'/users/{user_id}/knowledge', headers=headers)
+    assert response.status_code == 503
+    assert response.json['error'] == "Knowledge Graph is not available"